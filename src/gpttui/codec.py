@@ -0,0 +1,118 @@
+"""
+This module defines the JSON encoding used for provider payloads, it uses `orjson` or `msgspec` when
+they're installed and falls back to the standard library.
+"""
+import json
+from typing import Any, Callable, Dict, Iterable, List, Tuple, Union
+
+try:
+    import orjson
+
+    BACKEND = "orjson"
+    _dumps: Callable[[Any], bytes] = orjson.dumps
+    _loads: Callable[[Union[bytes, str]], Any] = orjson.loads
+except ImportError:
+    try:
+        import msgspec
+
+        BACKEND = "msgspec"
+        _dumps = msgspec.json.encode
+        _loads = msgspec.json.decode
+    except ImportError:
+        BACKEND = "json"
+        _dumps = lambda obj: json.dumps(
+            obj, ensure_ascii=False, separators=(",", ":")
+        ).encode()
+        _loads = json.loads
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    Encodes an object as JSON.
+
+    Parameters
+    ----------
+    obj : Any
+        Object to encode.
+
+    Returns
+    -------
+    bytes
+        UTF-8 encoded JSON.
+    """
+    return _dumps(obj)
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """
+    Decodes a JSON document.
+
+    Parameters
+    ----------
+    data : Union[bytes, str]
+        JSON document.
+
+    Returns
+    -------
+    Any
+        Decoded object.
+    """
+    return _loads(data)
+
+
+def dumps_object(fields: Dict[str, Any], raw: Dict[str, bytes]) -> bytes:
+    """
+    Encodes a JSON object where some values are already encoded.
+
+    Parameters
+    ----------
+    fields : Dict[str, Any]
+        Values to encode.
+    raw : Dict[str, bytes]
+        Encoded values, they're inserted as they are.
+
+    Returns
+    -------
+    bytes
+        UTF-8 encoded JSON object.
+    """
+    members = [dumps(key) + b":" + dumps(value) for key, value in fields.items()]
+    members.extend(dumps(key) + b":" + value for key, value in raw.items())
+    return b"{" + b",".join(members) + b"}"
+
+
+class ArrayEncoder:
+    """
+    Encodes JSON arrays that grow by appending, like the history of a session. The encoded items of
+    the previous call are cached, so only the items after the unchanged prefix are encoded.
+    """
+
+    def __init__(self):
+        self.cache: List[Tuple[Any, bytes]] = []
+
+    def encode(self, items: Iterable[Any]) -> bytes:
+        """
+        Encodes the items as a JSON array, they're consumed lazily.
+
+        Parameters
+        ----------
+        items : Iterable[Any]
+            Items to encode.
+
+        Returns
+        -------
+        bytes
+            UTF-8 encoded JSON array.
+        """
+        position = 0
+        for item in items:
+            if position < len(self.cache):
+                cached = self.cache[position][0]
+                if cached is item or cached == item:
+                    position += 1
+                    continue
+                del self.cache[position:]
+            self.cache.append((item, dumps(item)))
+            position += 1
+        del self.cache[position:]
+        return b"[" + b",".join(encoded for _, encoded in self.cache) + b"]"
@@ -0,0 +1,123 @@
+"""
+This module defines the compressed format of archived sessions: gzip compressed JSON lines with every
+column of the messages, so they're restored exactly as they were stored.
+"""
+import gzip, os
+from pathlib import Path
+from typing import Iterable, Iterator, NamedTuple, Optional
+from gpttui.codec import dumps, loads
+
+ARCHIVE_SUFFIX = ".jsonl.gz"
+
+
+class ArchivedMessage(NamedTuple):
+    """
+    Row of the messages table, including the columns that aren't exported.
+
+    Attributes
+    ----------
+    id : int
+        Message identifier, it's kept so summaries and the recall index stay valid.
+    role : str
+        Who wrote the message.
+    content : str
+        Message content.
+    timestamp : Optional[int]
+        Unix time.
+    parent_id : Optional[int]
+        Last summarized message, only for summaries.
+    remote_id : Optional[str]
+        Identifier that the model's server gave to the message.
+    """
+
+    id: int
+    role: str
+    content: str
+    timestamp: Optional[int]
+    parent_id: Optional[int]
+    remote_id: Optional[str]
+
+
+def encode_archive(rows: Iterable[ArchivedMessage]) -> Iterator[bytes]:
+    """
+    Serializes messages into JSON lines.
+
+    Parameters
+    ----------
+    rows : Iterable[ArchivedMessage]
+        Messages to archive.
+
+    Yields
+    ------
+    bytes
+        One line per message.
+    """
+    for row in rows:
+        yield dumps(list(row)) + b"\n"
+
+
+def decode_archive(lines: Iterable[bytes]) -> Iterator[ArchivedMessage]:
+    """
+    Parses the JSON lines of an archive.
+
+    Parameters
+    ----------
+    lines : Iterable[bytes]
+        Decompressed lines.
+
+    Yields
+    ------
+    ArchivedMessage
+        Archived messages.
+    """
+    for line in lines:
+        if line.strip():
+            yield ArchivedMessage(*loads(line))
+
+
+def write_archive(path: Path, rows: Iterable[ArchivedMessage]) -> int:
+    """
+    Writes an archive file atomically, it's only visible once it's complete and synced.
+
+    Parameters
+    ----------
+    path : Path
+        Archive file.
+    rows : Iterable[ArchivedMessage]
+        Messages to archive, they're consumed lazily.
+
+    Returns
+    -------
+    int
+        Number of archived messages.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.tmp")
+    total = 0
+    with open(tmp, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as f:
+            for line in encode_archive(rows):
+                f.write(line)
+                total += 1
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp, path)
+    return total
+
+
+def read_archive(path: Path) -> Iterator[ArchivedMessage]:
+    """
+    Reads an archive file lazily.
+
+    Parameters
+    ----------
+    path : Path
+        Archive file.
+
+    Yields
+    ------
+    ArchivedMessage
+        Archived messages, in their original order.
+    """
+    with gzip.open(path, "rb") as f:
+        yield from decode_archive(f)
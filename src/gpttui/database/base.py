@@ -3,7 +3,7 @@ This module defines the general classes that are required in the database module
 """
 
 from abc import ABC, abstractmethod
-from typing import List, Any
+from typing import List, Any, Dict, Iterable, Iterator, NamedTuple, Optional, Tuple
 from pydantic import BaseModel
 from enum import Enum
 
@@ -14,6 +14,27 @@ class DatabasesEnum(Enum):
     """
 
     SQLITE = "SQLITE"
+    POSTGRES = "POSTGRES"
+
+
+class RequestStatusEnum(Enum):
+    """
+    Enum that specifies the states of a queued request to a model.
+    """
+
+    PENDING = "pending"
+    DONE = "done"
+    DROPPED = "dropped"
+
+
+class UsageGroupEnum(Enum):
+    """
+    Enum that specifies how the usage metrics can be aggregated.
+    """
+
+    SESSION = "session"
+    BACKEND = "backend"
+    DAY = "day"
 
 
 class Message(BaseModel):
@@ -32,17 +53,211 @@ class Message(BaseModel):
     content: str
 
 
-class Messages(BaseModel):
+class MessageRecord(NamedTuple):
+    """
+    Lightweight, tuple-backed message used in the read path instead of `Message`.
+
+    Attributes
+    ----------
+    role : str
+        Who wrote the message.
+    content : str
+        Message content.
+    """
+
+    role: str
+    content: str
+
+
+class PendingRequest(NamedTuple):
     """
-    Dataclass that represents multiple messages.
+    Request to a model that was queued but never answered.
 
     Attributes
     ----------
-    values : List[Message]
+    id : int
+        Request identifier.
+    session_name : str
+        Session of the request.
+    content : str
+        User message to answer.
+    """
+
+    id: int
+    session_name: str
+    content: str
+
+
+class IndexedMessage(NamedTuple):
+    """
+    Message of any session, as seen by the embedding index.
+
+    Attributes
+    ----------
+    id : int
+        Message identifier.
+    session_name : str
+        Session of the message.
+    role : str
+        Who wrote the message.
+    content : str
+        Message content.
+    """
+
+    id: int
+    session_name: str
+    role: str
+    content: str
+
+
+class TurnMetric(NamedTuple):
+    """
+    Measurements of an answer of a model.
+
+    Attributes
+    ----------
+    backend : str
+        Model that answered, e.g. `openai/gpt-3.5-turbo`.
+    timestamp : int
+        Unix time of the answer.
+    latency_ms : float
+        Time spent generating the answer.
+    prompt_tokens : int
+        Tokens sent to the model.
+    completion_tokens : int
+        Tokens of the answer.
+    estimated : bool
+        Whether the tokens were approximated because the server didn't report them.
+    """
+
+    backend: str
+    timestamp: int
+    latency_ms: float
+    prompt_tokens: int
+    completion_tokens: int
+    estimated: bool
+
+
+class RetentionPolicy(NamedTuple):
+    """
+    How long the user and assistant messages of a session are kept, system messages and summaries
+    are never deleted.
+
+    Attributes
+    ----------
+    max_age_days : int
+        Messages older than this are deleted, 0 keeps them forever.
+    max_messages : int
+        Only the most recent messages are kept, 0 keeps all of them.
+    """
+
+    max_age_days: int = 0
+    max_messages: int = 0
+
+
+class LockStats(NamedTuple):
+    """
+    Waits for the write lock of the database, as measured by one connection.
+
+    Attributes
+    ----------
+    transactions : int
+        Number of write transactions.
+    contended : int
+        Transactions that waited at least a millisecond for the lock.
+    retries : int
+        Times that the lock was requested again after the busy timeout expired.
+    failures : int
+        Transactions that gave up.
+    wait_ms : float
+        Total time waited.
+    max_wait_ms : float
+        Longest wait.
+    """
+
+    transactions: int = 0
+    contended: int = 0
+    retries: int = 0
+    failures: int = 0
+    wait_ms: float = 0.0
+    max_wait_ms: float = 0.0
+
+
+class UsageRow(NamedTuple):
+    """
+    Usage metrics aggregated over a group of answers.
+
+    Attributes
+    ----------
+    key : str
+        Session, backend or day (`YYYY-MM-DD`, UTC) of the group.
+    turns : int
+        Number of answers.
+    prompt_tokens : int
+        Tokens sent to the models.
+    completion_tokens : int
+        Tokens of the answers.
+    max_prompt_tokens : int
+        Largest prompt, it shows how expensive a conversation has become.
+    estimated_turns : int
+        Answers whose tokens were approximated.
+    """
+
+    key: str
+    turns: int
+    prompt_tokens: int
+    completion_tokens: int
+    max_prompt_tokens: int
+    estimated_turns: int
+
+
+class Messages:
+    """
+    Container of multiple messages, it isn't validated since it's built from stored rows.
+
+    Parameters
+    ----------
+    values : List[MessageRecord]
         List of messages.
     """
 
-    values: List[Message]
+    __slots__ = ("values",)
+
+    def __init__(self, values: List[MessageRecord]):
+        self.values = values
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __iter__(self) -> Iterator[MessageRecord]:
+        return iter(self.values)
+
+    def view(self, *roles: str) -> Iterator[MessageRecord]:
+        """
+        Iterates over the messages of the given roles without copying them.
+
+        Parameters
+        ----------
+        roles : str
+            Roles to keep.
+
+        Yields
+        ------
+        MessageRecord
+            Messages with any of the given roles.
+        """
+        return (msg for msg in self.values if msg.role in roles)
+
+    def payload(self) -> List[Dict[str, str]]:
+        """
+        Serializes the messages into the role/content dictionaries that most providers expect.
+
+        Returns
+        -------
+        List[Dict[str, str]]
+            Serialized messages.
+        """
+        return [{"role": role, "content": content} for role, content in self.values]
 
 
 class MessageWithTime(BaseModel):
@@ -55,10 +270,65 @@ class MessageWithTime(BaseModel):
         A message instance.
     timestamp : int
         Unix time.
+    remote_id : Optional[str]
+        Identifier that the model's server gave to the message, if any.
     """
 
     message: Message
     timestamp: int
+    remote_id: Optional[str] = None
+
+
+class SessionInfo(BaseModel):
+    """
+    Dataclass that represents the metadata of a session.
+
+    Attributes
+    ----------
+    name : str
+        Session name.
+    created_at : int
+        Unix time of creation.
+    updated_at : int
+        Unix time of the last message.
+    message_count : int
+        Number of messages in the session.
+    token_total : int
+        Approximated number of tokens in the session.
+    preview : str
+        Beginning of the last message.
+    archived : bool
+        Whether the messages are in the cold archive, they're restored on first access.
+    """
+
+    name: str
+    created_at: int
+    updated_at: int
+    message_count: int
+    token_total: int
+    preview: str
+    archived: bool = False
+
+
+PREVIEW_LENGTH = 80
+SUMMARY_ROLE = "summary"
+
+
+def approximate_tokens(text: str) -> int:
+    """
+    Approximates the number of tokens of a text, roughly four characters per token.
+
+    Parameters
+    ----------
+    text : str
+        Input text.
+
+    Returns
+    -------
+    int
+        Approximated number of tokens.
+    """
+    return (len(text) + 3) // 4
 
 
 class AbstractDB(ABC):
@@ -69,9 +339,13 @@ class AbstractDB(ABC):
     ----------
     connection : Any
         Connection with any database.
+    thread_safe : bool
+        Whether the methods can be called from other threads, the TUI then keeps them off its event
+        loop.
     """
 
     connection: Any
+    thread_safe: bool = False
 
     @abstractmethod
     def setup(self, **kwargs: str) -> "AbstractDB":
@@ -90,6 +364,24 @@ class AbstractDB(ABC):
         """
         ...
 
+    @abstractmethod
+    def migrate(self, batch_size: int = 1000) -> int:
+        """
+        Runs a bounded step of the pending schema migrations, so they can be interleaved with other
+        work.
+
+        Parameters
+        ----------
+        batch_size : int
+            Maximum number of rows that the step moves.
+
+        Returns
+        -------
+        int
+            Number of pending migrations.
+        """
+        ...
+
     @abstractmethod
     def create_session(self, session_name: str):
         """
@@ -114,6 +406,20 @@ class AbstractDB(ABC):
         """
         ...
 
+    @abstractmethod
+    def rename_session(self, session_name: str, new_name: str):
+        """
+        Renames a session keeping its messages.
+
+        Parameters
+        ----------
+        session_name : str
+            Name of the session.
+        new_name : str
+            New name, it must not be in use.
+        """
+        ...
+
     @abstractmethod
     def add_message(self, msg: MessageWithTime, session_name: str):
         """
@@ -128,15 +434,497 @@ class AbstractDB(ABC):
         """
         ...
 
+    @abstractmethod
+    def add_messages(self, msgs: Iterable[MessageWithTime], session_name: str) -> int:
+        """
+        Add several messages to the database in a single transaction.
+
+        Parameters
+        ----------
+        msgs : Iterable[MessageWithTime]
+            Messages to store, they're consumed lazily.
+        session_name : str
+            Name of the session.
+
+        Returns
+        -------
+        int
+            Number of stored messages.
+        """
+        ...
+
+    @abstractmethod
+    def enqueue_request(self, msg: MessageWithTime, session_name: str) -> int:
+        """
+        Stores a user message and queues the request to answer it in a single transaction, earlier
+        pending requests of the session are dropped since the conversation moved on.
+
+        Parameters
+        ----------
+        msg : MessageWithTime
+            User message.
+        session_name : str
+            Name of the session.
+
+        Returns
+        -------
+        int
+            Request identifier.
+        """
+        ...
+
+    @abstractmethod
+    def complete_request(
+        self,
+        request_id: int,
+        msg: Optional[MessageWithTime],
+        session_name: str,
+        metric: Optional[TurnMetric] = None,
+    ) -> bool:
+        """
+        Stores the answer of a pending request and marks it as done in a single transaction.
+
+        Parameters
+        ----------
+        request_id : int
+            Request identifier.
+        msg : Optional[MessageWithTime]
+            Assistant message, the request is dropped if it's `None`.
+        session_name : str
+            Name of the session.
+        metric : Optional[TurnMetric]
+            Measurements of the answer, stored along with it.
+
+        Returns
+        -------
+        bool
+            Whether the request was still pending, nothing is stored otherwise.
+        """
+        ...
+
+    @abstractmethod
+    def get_pending_requests(
+        self, session_name: Optional[str] = None
+    ) -> List[PendingRequest]:
+        """
+        Lists the requests that were never answered, oldest first.
+
+        Parameters
+        ----------
+        session_name : Optional[str]
+            Name of the session, all sessions by default.
+
+        Returns
+        -------
+        List[PendingRequest]
+            Pending requests.
+        """
+        ...
+
     @abstractmethod
     def get_messages(self, session_name: str) -> Messages:
         """
-        Get the most recent messages from the database.
+        Get the most recent messages from the database, summaries are excluded.
+
+        Parameters
+        ----------
+        session_name : str
+            Name of the session.
+        """
+        ...
+
+    @abstractmethod
+    def get_last_message(
+        self, session_name: str, role: str, offset: int = 0
+    ) -> Optional[str]:
+        """
+        Finds a recent message of a role without reading the whole session.
+
+        Parameters
+        ----------
+        session_name : str
+            Name of the session.
+        role : str
+            Role of the message.
+        offset : int
+            Number of newer messages of the role to skip, 0 is the last one.
+
+        Returns
+        -------
+        Optional[str]
+            Message content, `None` if the session doesn't have so many messages.
+        """
+        ...
+
+    @abstractmethod
+    def get_recent_messages(self, session_name: str) -> Messages:
+        """
+        Get the messages that must be sent to a model: the system messages, the latest summary (with
+        the `SUMMARY_ROLE` role) and the messages that it doesn't cover.
+
+        Parameters
+        ----------
+        session_name : str
+            Name of the session.
+        """
+        ...
+
+    @abstractmethod
+    def get_compactable(
+        self, session_name: str, keep: int
+    ) -> Tuple[Messages, Optional[int]]:
+        """
+        Get the messages that can be summarized, preceded by the latest summary.
+
+        Parameters
+        ----------
+        session_name : str
+            Name of the session.
+        keep : int
+            Number of recent messages that mustn't be summarized.
+
+        Returns
+        -------
+        Tuple[Messages, Optional[int]]
+            Messages to summarize and the identifier of the last one, `None` if there's nothing to
+            summarize.
+        """
+        ...
+
+    @abstractmethod
+    def get_remote_state(self, session_name: str) -> Tuple[Optional[str], int]:
+        """
+        Get the latest identifier that the model's server gave to a message of the session.
+
+        Parameters
+        ----------
+        session_name : str
+            Name of the session.
+
+        Returns
+        -------
+        Tuple[Optional[str], int]
+            Remote identifier, `None` if the server has no state, and the identifier of its message.
+        """
+        ...
+
+    @abstractmethod
+    def get_messages_after(self, session_name: str, after_id: int) -> Messages:
+        """
+        Get the messages stored after a given one, summaries are excluded.
 
         Parameters
         ----------
         session_name : str
             Name of the session.
+        after_id : int
+            Identifier of the last message that must be excluded.
+        """
+        ...
+
+    @abstractmethod
+    def add_summary(self, content: str, until_id: int, session_name: str):
+        """
+        Stores a summary of the messages of a session.
+
+        Parameters
+        ----------
+        content : str
+            Summary.
+        until_id : int
+            Identifier of the last summarized message.
+        session_name : str
+            Name of the session.
+        """
+        ...
+
+    @abstractmethod
+    def iter_messages(
+        self, session_name: str, batch_size: int = 1000
+    ) -> Iterator[MessageWithTime]:
+        """
+        Iterates over the messages of a session without loading all of them into memory.
+
+        Parameters
+        ----------
+        session_name : str
+            Name of the session.
+        batch_size : int
+            Number of rows fetched from the database at once.
+
+        Yields
+        ------
+        MessageWithTime
+            Messages in chronological order.
+        """
+        ...
+
+    @abstractmethod
+    def iter_messages_after(
+        self, after_id: int, batch_size: int = 1000
+    ) -> Iterator[IndexedMessage]:
+        """
+        Iterates over the user and assistant messages of every session that were stored after a
+        given one.
+
+        Parameters
+        ----------
+        after_id : int
+            Identifier of the last known message.
+        batch_size : int
+            Number of rows fetched from the database at once.
+
+        Yields
+        ------
+        IndexedMessage
+            Messages in insertion order.
+        """
+        ...
+
+    @abstractmethod
+    def get_messages_by_ids(self, ids: List[int]) -> List[IndexedMessage]:
+        """
+        Finds messages of any session by their identifiers, missing ones are skipped.
+
+        Parameters
+        ----------
+        ids : List[int]
+            Message identifiers.
+
+        Returns
+        -------
+        List[IndexedMessage]
+            Found messages, in no particular order.
+        """
+        ...
+
+    @abstractmethod
+    def list_sessions(self) -> List[str]:
+        """
+        Lists the available sessions.
+
+        Returns
+        -------
+        List[str]
+            Session names.
+        """
+        ...
+
+    @abstractmethod
+    def get_sessions(self) -> List[SessionInfo]:
+        """
+        Lists the metadata of the sessions, the most recently updated first.
+
+        Returns
+        -------
+        List[SessionInfo]
+            Sessions metadata.
+        """
+        ...
+
+    @abstractmethod
+    def set_retention(self, session_name: str, policy: Optional[RetentionPolicy]):
+        """
+        Stores the retention policy of a session.
+
+        Parameters
+        ----------
+        session_name : str
+            Name of the session.
+        policy : Optional[RetentionPolicy]
+            Retention policy, `None` makes the session use the default one.
+        """
+        ...
+
+    @abstractmethod
+    def get_retention(self, session_name: str) -> Optional[RetentionPolicy]:
+        """
+        Finds the retention policy of a session.
+
+        Parameters
+        ----------
+        session_name : str
+            Name of the session.
+
+        Returns
+        -------
+        Optional[RetentionPolicy]
+            Retention policy, `None` if the session uses the default one.
+        """
+        ...
+
+    @abstractmethod
+    def apply_retention(self, default: RetentionPolicy, now: int) -> int:
+        """
+        Deletes the messages that the retention policies don't keep, messages of pending requests
+        are kept.
+
+        Parameters
+        ----------
+        default : RetentionPolicy
+            Policy of the sessions without their own.
+        now : int
+            Current unix time.
+
+        Returns
+        -------
+        int
+            Number of deleted messages.
+        """
+        ...
+
+    @abstractmethod
+    def vacuum_step(self, pages: int) -> int:
+        """
+        Returns free space to the file system in a bounded step.
+
+        Parameters
+        ----------
+        pages : int
+            Maximum number of pages to release, 0 rebuilds the whole database.
+
+        Returns
+        -------
+        int
+            Number of free pages that remain, -1 if they can only be released by rebuilding the
+            whole database.
+        """
+        ...
+
+    @abstractmethod
+    def optimize(self):
+        """
+        Refreshes the statistics that the query planner uses.
+        """
+        ...
+
+    @abstractmethod
+    def get_inactive_sessions(self, before: int) -> List[str]:
+        """
+        Lists the sessions that can be archived: not updated since a time, not archived yet, and
+        without pending requests.
+
+        Parameters
+        ----------
+        before : int
+            Unix time of the last update.
+
+        Returns
+        -------
+        List[str]
+            Session names, the least recently updated first.
+        """
+        ...
+
+    @abstractmethod
+    def archive_session(self, session_name: str) -> int:
+        """
+        Moves the messages of a session to compressed cold storage, the session keeps its metadata,
+        and any access to its messages restores them.
+
+        Parameters
+        ----------
+        session_name : str
+            Name of the session.
+
+        Returns
+        -------
+        int
+            Number of archived messages.
+        """
+        ...
+
+    @abstractmethod
+    def restore_session(self, session_name: str) -> int:
+        """
+        Moves the messages of an archived session back to the database.
+
+        Parameters
+        ----------
+        session_name : str
+            Name of the session.
+
+        Returns
+        -------
+        int
+            Number of restored messages, 0 if the session wasn't archived.
+        """
+        ...
+
+    @abstractmethod
+    def get_data_version(self) -> int:
+        """
+        Finds a counter that changes when other connections store messages, so they can be
+        polled cheaply.
+
+        Returns
+        -------
+        int
+            Data version, only comparable with values of the same connection.
+        """
+        ...
+
+    @abstractmethod
+    def get_last_message_id(self) -> int:
+        """
+        Finds the identifier of the last stored message of any session.
+
+        Returns
+        -------
+        int
+            Message identifier, 0 if there are no messages.
+        """
+        ...
+
+    @abstractmethod
+    def get_lock_stats(self) -> LockStats:
+        """
+        Summarizes the waits of this connection for the write lock.
+
+        Returns
+        -------
+        LockStats
+            Lock waits since the connection was opened.
+        """
+        ...
+
+    @abstractmethod
+    def get_usage(self, group: UsageGroupEnum, since: int = 0) -> List[UsageRow]:
+        """
+        Aggregates the usage metrics.
+
+        Parameters
+        ----------
+        group : UsageGroupEnum
+            How the answers are grouped.
+        since : int
+            Unix time of the oldest answer to include.
+
+        Returns
+        -------
+        List[UsageRow]
+            Usage of each group, the most tokens first.
+        """
+        ...
+
+    @abstractmethod
+    def get_latencies(
+        self, group: UsageGroupEnum, since: int = 0
+    ) -> List[Tuple[str, float]]:
+        """
+        Lists the latency of every answer along with its group.
+
+        Parameters
+        ----------
+        group : UsageGroupEnum
+            How the answers are grouped.
+        since : int
+            Unix time of the oldest answer to include.
+
+        Returns
+        -------
+        List[Tuple[str, float]]
+            Group and latency in milliseconds, in no particular order.
         """
         ...
 
@@ -0,0 +1,83 @@
+"""
+This module defines the job that keeps the database bounded and fast while the app is idle.
+"""
+import time
+from gpttui.database.base import AbstractDB, RetentionPolicy
+from typing import Optional
+
+
+class Maintainer:
+    """
+    Runs the database maintenance in small steps while the user is idle: the retention policies are
+    applied periodically, the freed pages are returned to the file system a few at a time, and the
+    planner statistics are refreshed once in a while.
+
+    Parameters
+    ----------
+    default_policy : RetentionPolicy
+        Policy of the sessions without their own.
+    idle_seconds : float
+        Seconds without activity before any step runs.
+    vacuum_pages : int
+        Maximum number of pages released by a step.
+    retention_every : float
+        Seconds between two applications of the retention policies.
+    optimize_every : float
+        Seconds between two refreshes of the statistics.
+    """
+
+    def __init__(
+        self,
+        default_policy: RetentionPolicy = RetentionPolicy(),
+        idle_seconds: float = 10,
+        vacuum_pages: int = 256,
+        retention_every: float = 3600,
+        optimize_every: float = 6 * 3600,
+    ):
+        self.default_policy = default_policy
+        self.idle_seconds = idle_seconds
+        self.vacuum_pages = vacuum_pages
+        self.retention_every = retention_every
+        self.optimize_every = optimize_every
+        self.last_activity = time.monotonic()
+        self.next_retention = 0.0
+        self.next_optimize = 0.0
+        self.free_pages: Optional[int] = None
+
+    def touch(self):
+        """
+        Records an activity, so the maintenance waits until the user is idle again.
+        """
+        self.last_activity = time.monotonic()
+
+    def step(self, database: AbstractDB) -> Optional[str]:
+        """
+        Runs one bounded unit of maintenance if the user is idle.
+
+        Parameters
+        ----------
+        database : AbstractDB
+            Database to maintain.
+
+        Returns
+        -------
+        Optional[str]
+            `retention`, `vacuum` or `optimize`, `None` if nothing was done.
+        """
+        now = time.monotonic()
+        if now - self.last_activity < self.idle_seconds:
+            return None
+        if now >= self.next_retention:
+            self.next_retention = now + self.retention_every
+            database.apply_retention(self.default_policy, int(time.time()))
+            # NOTE: deleted sessions and cleared messages also free pages, so they're checked again.
+            self.free_pages = None
+            return "retention"
+        if self.free_pages is None or self.free_pages > 0:
+            self.free_pages = database.vacuum_step(self.vacuum_pages)
+            return "vacuum"
+        if now >= self.next_optimize:
+            self.next_optimize = now + self.optimize_every
+            database.optimize()
+            return "optimize"
+        return None
@@ -0,0 +1,350 @@
+"""
+This module defines the versioned schema of the sqlite database. Its version is stored in
+`PRAGMA user_version`, and each migration raises it by one.
+
+A migration has two parts: schema statements, which must be fast and idempotent since they run when
+the database is opened, and an optional batch function that moves or rewrites rows a bounded
+number at a time, so large databases are upgraded in the background. The database must keep working
+while a batch migration is pending, so the rows that it hasn't moved yet are moved on demand.
+"""
+import sqlite3
+from gpttui.database.base import PREVIEW_LENGTH
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+
+class Migration(NamedTuple):
+    """
+    Versioned change of the schema.
+
+    Attributes
+    ----------
+    version : int
+        Value of `user_version` once it's applied.
+    description : str
+        What changes.
+    schema : Tuple[str, ...]
+        Idempotent statements, they run in a single transaction when the database is opened.
+    batch : Optional[Callable[[sqlite3.Cursor, int], bool]]
+        Moves at most a number of rows in an ongoing transaction, and returns whether the migration
+        is complete.
+    """
+
+    version: int
+    description: str
+    schema: Tuple[str, ...] = ()
+    batch: Optional[Callable[[sqlite3.Cursor, int], bool]] = None
+
+
+TABLES = ("sessions", "messages", "requests", "metrics", "retention", "archives")
+LEGACY_COLUMNS = ("id", "role", "content", "timestamp")
+
+
+def is_legacy_table(cursor: sqlite3.Cursor, table: str) -> bool:
+    """
+    Checks whether a table has the columns of a session stored as one table per session.
+
+    Parameters
+    ----------
+    cursor : sqlite3.Cursor
+        Database cursor.
+    table : str
+        Table name.
+
+    Returns
+    -------
+    bool
+        Whether it's a legacy session, `False` if the table doesn't exist.
+    """
+    if table in TABLES:
+        return False
+    cursor.execute("SELECT name FROM pragma_table_info(?) ORDER BY cid ASC;", (table,))
+    return tuple(x[0] for x in cursor.fetchall()) == LEGACY_COLUMNS
+
+
+def legacy_tables(cursor: sqlite3.Cursor) -> List[str]:
+    """
+    Lists the sessions that are still stored as one table per session. Only the tables with the
+    columns of a legacy session are listed, any other table of the database is left alone.
+
+    Parameters
+    ----------
+    cursor : sqlite3.Cursor
+        Database cursor.
+
+    Returns
+    -------
+    List[str]
+        Table names, which are the session names.
+    """
+    cursor.execute(
+        f"""
+            SELECT
+                name
+            FROM
+                sqlite_schema
+            WHERE
+                type = 'table'
+                AND name NOT LIKE 'sqlite_%'
+                AND name NOT IN ({", ".join("?" * len(TABLES))})
+            ORDER BY
+                name ASC
+            ;
+            """,
+        TABLES,
+    )
+    tables = [x[0] for x in cursor.fetchall()]
+    return [table for table in tables if is_legacy_table(cursor, table)]
+
+
+def legacy_session_info(
+    cursor: sqlite3.Cursor, table: str
+) -> Tuple[int, int, int, int, str]:
+    """
+    Computes the metadata of a session that's still stored as a legacy table, including the
+    messages that were already moved into the registry.
+
+    Parameters
+    ----------
+    cursor : sqlite3.Cursor
+        Database cursor.
+    table : str
+        Legacy table, named after its session.
+
+    Returns
+    -------
+    Tuple[int, int, int, int, str]
+        Creation and update times, number of messages, approximated tokens and preview.
+    """
+    quoted = '"{}"'.format(table.replace('"', '""'))
+    created_at, updated_at, message_count, token_total = cursor.execute(
+        f"""
+            SELECT
+                min(timestamp), max(timestamp), count(*),
+                coalesce(sum((length(content) + 3) / 4), 0)
+            FROM (
+                SELECT timestamp, content FROM {quoted}
+                UNION ALL
+                SELECT
+                    timestamp, content
+                FROM
+                    messages
+                WHERE
+                    session_id = (SELECT id FROM sessions WHERE name = ?)
+                )
+            ;
+            """,
+        (table,),
+    ).fetchone()
+    # NOTE: the oldest messages are moved first, so the last one is still in the table.
+    preview = cursor.execute(
+        f"SELECT substr(content, 1, ?) FROM {quoted} ORDER BY id DESC LIMIT 1;",
+        (PREVIEW_LENGTH,),
+    ).fetchone()
+    return (
+        created_at or 0,
+        updated_at or 0,
+        message_count,
+        token_total,
+        preview[0] if preview is not None else "",
+    )
+
+
+def move_legacy_session(cursor: sqlite3.Cursor, table: str, batch_size: int) -> bool:
+    """
+    Moves the oldest messages of a legacy session table into the registry, the table is dropped and
+    the session metadata is computed once it's empty.
+
+    Parameters
+    ----------
+    cursor : sqlite3.Cursor
+        Cursor of an ongoing transaction.
+    table : str
+        Legacy table, named after its session.
+    batch_size : int
+        Maximum number of messages to move.
+
+    Returns
+    -------
+    bool
+        Whether the whole table was moved.
+    """
+    quoted = '"{}"'.format(table.replace('"', '""'))
+    cursor.execute("INSERT OR IGNORE INTO sessions (name) VALUES (?);", (table,))
+    # NOTE: moved rows are deleted in the same transaction, so the progress needs no bookkeeping.
+    cursor.execute(
+        f"""
+            INSERT INTO messages (
+                session_id, role, content, timestamp
+                )
+            SELECT
+                (SELECT id FROM sessions WHERE name = ?), role, content, timestamp
+            FROM
+                {quoted}
+            ORDER BY
+                id ASC
+            LIMIT ?
+            ;
+            """,
+        (table, batch_size),
+    )
+    if cursor.rowcount > 0:
+        cursor.execute(
+            f"DELETE FROM {quoted} WHERE id IN (SELECT id FROM {quoted} ORDER BY id ASC LIMIT ?);",
+            (cursor.rowcount,),
+        )
+    if cursor.execute(f"SELECT 1 FROM {quoted} LIMIT 1;").fetchone() is not None:
+        return False
+    cursor.execute(f"DROP TABLE {quoted};")
+    cursor.execute(
+        """
+            UPDATE
+                sessions
+            SET
+                created_at = coalesce((
+                    SELECT min(timestamp) FROM messages WHERE session_id = sessions.id
+                ), created_at),
+                updated_at = coalesce((
+                    SELECT max(timestamp) FROM messages WHERE session_id = sessions.id
+                ), updated_at),
+                message_count = (
+                    SELECT count(*) FROM messages WHERE session_id = sessions.id
+                ),
+                token_total = coalesce((
+                    SELECT sum((length(content) + 3) / 4) FROM messages
+                    WHERE session_id = sessions.id
+                ), 0),
+                preview = coalesce((
+                    SELECT substr(content, 1, ?) FROM messages
+                    WHERE session_id = sessions.id ORDER BY id DESC LIMIT 1
+                ), '')
+            WHERE
+                name = ?
+            ;
+            """,
+        (PREVIEW_LENGTH, table),
+    )
+    return True
+
+
+def move_legacy_sessions(cursor: sqlite3.Cursor, batch_size: int) -> bool:
+    """
+    Moves a batch of the sessions that were stored as one table per session.
+
+    Parameters
+    ----------
+    cursor : sqlite3.Cursor
+        Cursor of an ongoing transaction.
+    batch_size : int
+        Maximum number of messages to move.
+
+    Returns
+    -------
+    bool
+        Whether every legacy table was moved.
+    """
+    tables = legacy_tables(cursor)
+    if not tables:
+        return True
+    return move_legacy_session(cursor, tables[0], batch_size) and len(tables) == 1
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(
+        1,
+        "Registry of sessions and their messages, and the queue of requests.",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS sessions(
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT UNIQUE NOT NULL,
+                created_at INT NOT NULL DEFAULT 0,
+                updated_at INT NOT NULL DEFAULT 0,
+                message_count INT NOT NULL DEFAULT 0,
+                token_total INT NOT NULL DEFAULT 0,
+                preview TEXT NOT NULL DEFAULT ''
+                );
+            """,
+            "CREATE INDEX IF NOT EXISTS sessions_updated_idx ON sessions(updated_at);",
+            """
+            CREATE TABLE IF NOT EXISTS messages(
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+                role TEXT,
+                content TEXT,
+                timestamp INT,
+                parent_id INTEGER,
+                remote_id TEXT
+                );
+            """,
+            "CREATE INDEX IF NOT EXISTS messages_session_idx ON messages(session_id, id);",
+            """
+            CREATE TABLE IF NOT EXISTS requests(
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+                message_id INTEGER NOT NULL REFERENCES messages(id) ON DELETE CASCADE,
+                status TEXT NOT NULL DEFAULT 'pending',
+                created_at INT NOT NULL DEFAULT 0,
+                completed_at INT
+                );
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS requests_pending_idx ON requests(session_id, id)
+                WHERE status = 'pending';
+            """,
+        ),
+    ),
+    Migration(
+        2,
+        "Metrics of every answer.",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS metrics(
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+                request_id INTEGER,
+                backend TEXT NOT NULL,
+                timestamp INT NOT NULL,
+                latency_ms REAL NOT NULL,
+                prompt_tokens INT NOT NULL,
+                completion_tokens INT NOT NULL,
+                estimated INT NOT NULL DEFAULT 0
+                );
+            """,
+            "CREATE INDEX IF NOT EXISTS metrics_timestamp_idx ON metrics(timestamp);",
+            "CREATE INDEX IF NOT EXISTS metrics_session_idx ON metrics(session_id, timestamp);",
+            "CREATE INDEX IF NOT EXISTS metrics_backend_idx ON metrics(backend, timestamp);",
+        ),
+    ),
+    Migration(
+        3,
+        "Retention policies of the sessions.",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS retention(
+                session_id INTEGER PRIMARY KEY REFERENCES sessions(id) ON DELETE CASCADE,
+                max_age_days INT NOT NULL DEFAULT 0,
+                max_messages INT NOT NULL DEFAULT 0
+                );
+            """,
+        ),
+    ),
+    Migration(
+        4,
+        "Manifest of the archived sessions.",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS archives(
+                session_id INTEGER PRIMARY KEY REFERENCES sessions(id) ON DELETE CASCADE,
+                path TEXT NOT NULL,
+                message_count INT NOT NULL,
+                archived_at INT NOT NULL
+                );
+            """,
+        ),
+    ),
+    Migration(
+        5,
+        "Sessions stored as one table per session are moved into the registry.",
+        batch=move_legacy_sessions,
+    ),
+]
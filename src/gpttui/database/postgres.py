@@ -0,0 +1,1483 @@
+"""
+This file defines the required elements to use postgresql as a database.
+"""
+import gzip, time
+from gpttui.database.archive import ArchivedMessage, decode_archive, encode_archive
+from gpttui.database.base import (
+    AbstractDB,
+    MessageWithTime,
+    Messages,
+    Message,
+    MessageRecord,
+    IndexedMessage,
+    LockStats,
+    PendingRequest,
+    RequestStatusEnum,
+    RetentionPolicy,
+    SessionInfo,
+    TurnMetric,
+    UsageGroupEnum,
+    UsageRow,
+    PREVIEW_LENGTH,
+    SUMMARY_ROLE,
+    approximate_tokens,
+)
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    from psycopg import Connection
+    from psycopg_pool import ConnectionPool
+except ImportError:
+    raise ImportError(
+        "Could not import postgres dependencies, please install it with:\n\tpip install gpttui[postgres]"
+    )
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions(
+    id SERIAL PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL,
+    created_at BIGINT NOT NULL DEFAULT 0,
+    updated_at BIGINT NOT NULL DEFAULT 0,
+    message_count BIGINT NOT NULL DEFAULT 0,
+    token_total BIGINT NOT NULL DEFAULT 0,
+    preview TEXT NOT NULL DEFAULT ''
+    );
+CREATE INDEX IF NOT EXISTS sessions_updated_idx ON sessions(updated_at);
+CREATE TABLE IF NOT EXISTS messages(
+    id BIGSERIAL PRIMARY KEY,
+    session_id INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    role TEXT,
+    content TEXT,
+    timestamp BIGINT,
+    parent_id BIGINT,
+    remote_id TEXT
+    );
+CREATE INDEX IF NOT EXISTS messages_session_idx ON messages(session_id, id);
+CREATE TABLE IF NOT EXISTS requests(
+    id BIGSERIAL PRIMARY KEY,
+    session_id INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    message_id BIGINT NOT NULL REFERENCES messages(id) ON DELETE CASCADE,
+    status TEXT NOT NULL DEFAULT 'pending',
+    created_at BIGINT NOT NULL DEFAULT 0,
+    completed_at BIGINT
+    );
+CREATE INDEX IF NOT EXISTS requests_pending_idx ON requests(session_id, id)
+    WHERE status = 'pending';
+CREATE TABLE IF NOT EXISTS metrics(
+    id BIGSERIAL PRIMARY KEY,
+    session_id INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    request_id BIGINT,
+    backend TEXT NOT NULL,
+    timestamp BIGINT NOT NULL,
+    latency_ms DOUBLE PRECISION NOT NULL,
+    prompt_tokens BIGINT NOT NULL,
+    completion_tokens BIGINT NOT NULL,
+    estimated BOOLEAN NOT NULL DEFAULT FALSE
+    );
+CREATE INDEX IF NOT EXISTS metrics_timestamp_idx ON metrics(timestamp);
+CREATE INDEX IF NOT EXISTS metrics_session_idx ON metrics(session_id, timestamp);
+CREATE INDEX IF NOT EXISTS metrics_backend_idx ON metrics(backend, timestamp);
+CREATE TABLE IF NOT EXISTS retention(
+    session_id INTEGER PRIMARY KEY REFERENCES sessions(id) ON DELETE CASCADE,
+    max_age_days INTEGER NOT NULL DEFAULT 0,
+    max_messages INTEGER NOT NULL DEFAULT 0
+    );
+CREATE TABLE IF NOT EXISTS archives(
+    session_id INTEGER PRIMARY KEY REFERENCES sessions(id) ON DELETE CASCADE,
+    data BYTEA NOT NULL,
+    message_count BIGINT NOT NULL,
+    archived_at BIGINT NOT NULL
+    );
+"""
+_USAGE_KEYS = {
+    UsageGroupEnum.SESSION: "sessions.name",
+    UsageGroupEnum.BACKEND: "metrics.backend",
+    UsageGroupEnum.DAY: "to_char(to_timestamp(metrics.timestamp) AT TIME ZONE 'UTC', 'YYYY-MM-DD')",
+}
+
+
+class PostgresDB(AbstractDB):
+    """
+    This class represents a database based on POSTGRESQL.
+
+    Sessions are rows of a registry table, so every statement is static and can be prepared by the
+    server once per connection.
+
+    Attributes
+    ----------
+    connection : ConnectionPool
+        Pool of connections with a postgresql database.
+    """
+
+    connection: ConnectionPool
+
+    def setup(self, **kwargs: str) -> "AbstractDB":
+        """
+        This method creates a pool of connections with the database.
+
+        Parameters
+        ----------
+        database : str
+            Connection string.
+        min_size : str
+            Minimum number of connections kept open, 1 by default.
+        max_size : str
+            Maximum number of connections, 4 by default.
+
+        Returns
+        -------
+        AbstractDB
+            Instance of the database.
+        """
+        self.connection = ConnectionPool(
+            kwargs["database"],
+            min_size=int(kwargs.get("min_size", 1)),
+            max_size=int(kwargs.get("max_size", 4)),
+            open=True,
+        )
+        self.__session_ids: Dict[str, int] = {}
+        with self.connection.connection() as conn:
+            conn.execute(_SCHEMA)
+        return self
+
+    def __session_id(self, session_name: str, restore: bool = True) -> int:
+        """
+        Finds the identifier of a session, archived sessions are restored on their first access.
+
+        Parameters
+        ----------
+        session_name : str
+            Session name.
+        restore : bool
+            Whether an archived session is restored, operations that don't read its messages skip it.
+
+        Returns
+        -------
+        int
+            Session identifier.
+        """
+        if session_name not in self.__session_ids:
+            with self.connection.connection() as conn:
+                row = conn.execute(
+                    """
+                        SELECT
+                            sessions.id, archives.session_id IS NOT NULL
+                        FROM
+                            sessions
+                            LEFT JOIN archives ON archives.session_id = sessions.id
+                        WHERE
+                            sessions.name = %s
+                        ;
+                        """,
+                    (session_name,),
+                    prepare=True,
+                ).fetchone()
+            if row is None:
+                raise KeyError(f"Session {session_name} doesn't exist.")
+            session_id, archived = row
+            if archived:
+                if not restore:
+                    # NOTE: it isn't cached, so the next access still restores it.
+                    return session_id
+                self.__restore(session_id)
+            self.__session_ids[session_name] = session_id
+        return self.__session_ids[session_name]
+
+    def __restore(self, session_id: int) -> int:
+        """
+        Moves the messages of an archive back into the messages table with their identifiers.
+
+        Parameters
+        ----------
+        session_id : int
+            Session identifier.
+
+        Returns
+        -------
+        int
+            Number of restored messages, 0 if another connection restored them first.
+        """
+        with self.connection.connection() as conn:
+            # NOTE: the manifest row is removed first, so only one connection restores it.
+            row = conn.execute(
+                "DELETE FROM archives WHERE session_id = %s RETURNING data;",
+                (session_id,),
+                prepare=True,
+            ).fetchone()
+            if row is None:
+                return 0
+            with conn.cursor() as cursor:
+                cursor.executemany(
+                    """
+                        INSERT INTO messages (
+                            id, session_id, role, content, timestamp, parent_id, remote_id
+                            )
+                        VALUES (%s, %s, %s, %s, %s, %s, %s)
+                        ON CONFLICT DO NOTHING;
+                        """,
+                    [
+                        (msg.id, session_id, *msg[1:])
+                        for msg in decode_archive(gzip.decompress(row[0]).splitlines())
+                    ],
+                )
+                return cursor.rowcount
+
+    def migrate(self, batch_size: int = 1000) -> int:
+        """
+        The schema of postgresql is created when the pool is opened, so nothing is pending.
+
+        Parameters
+        ----------
+        batch_size : int
+            Ignored.
+
+        Returns
+        -------
+        int
+            Always 0.
+        """
+        return 0
+
+    def create_session(self, session_name: str):
+        """
+        Registers a session in postgresql.
+
+        Parameters
+        ----------
+        session_name : str
+            Session name.
+        """
+        now = int(time.time())
+        with self.connection.connection() as conn:
+            conn.execute(
+                """
+                    INSERT INTO sessions (
+                        name, created_at, updated_at
+                        )
+                    VALUES (%s, %s, %s)
+                    ON CONFLICT DO NOTHING;
+                    """,
+                (session_name, now, now),
+                prepare=True,
+            )
+
+    def delete_session(self, session_name: str):
+        """
+        Deletes a session and its messages in postgresql.
+
+        Parameters
+        ----------
+        session_name : str
+            Session name.
+        """
+        with self.connection.connection() as conn:
+            conn.execute(
+                "DELETE FROM sessions WHERE name = %s;", (session_name,), prepare=True
+            )
+        self.__session_ids.pop(session_name, None)
+
+    def rename_session(self, session_name: str, new_name: str):
+        """
+        Renames a session in postgresql.
+
+        Parameters
+        ----------
+        session_name : str
+            Session name.
+        new_name : str
+            New name.
+        """
+        session_id = self.__session_id(session_name, restore=False)
+        with self.connection.connection() as conn:
+            conn.execute(
+                "UPDATE sessions SET name = %s WHERE id = %s;",
+                (new_name, session_id),
+                prepare=True,
+            )
+        if self.__session_ids.pop(session_name, None) is not None:
+            self.__session_ids[new_name] = session_id
+
+    def add_message(self, msg: MessageWithTime, session_name: str):
+        """
+        Saves a message (row) in the database.
+
+        Parameters
+        ----------
+        msg : MessageWithTime
+            Message to store.
+        session_name : str
+            Session name.
+        """
+        session_id = self.__session_id(session_name)
+        with self.connection.connection() as conn:
+            self.__insert_message(conn, session_id, msg)
+
+    def __insert_message(
+        self, conn: Connection, session_id: int, msg: MessageWithTime
+    ) -> int:
+        """
+        Inserts a message and updates the metadata of its session in an ongoing transaction.
+
+        Parameters
+        ----------
+        conn : Connection
+            Connection of the ongoing transaction.
+        session_id : int
+            Session identifier.
+        msg : MessageWithTime
+            Message to store.
+
+        Returns
+        -------
+        int
+            Message identifier.
+        """
+        (message_id,) = conn.execute(
+            """
+                INSERT INTO messages (
+                    session_id, role, content, timestamp, remote_id
+                    )
+                VALUES (%s, %s, %s, %s, %s)
+                RETURNING id;
+                """,
+            (
+                session_id,
+                msg.message.role,
+                msg.message.content,
+                msg.timestamp,
+                msg.remote_id,
+            ),
+            prepare=True,
+        ).fetchone()
+        self.__update_session(
+            conn,
+            session_id,
+            1,
+            approximate_tokens(msg.message.content),
+            msg.message.content,
+            msg.timestamp,
+        )
+        return message_id
+
+    def enqueue_request(self, msg: MessageWithTime, session_name: str) -> int:
+        """
+        Stores a user message and queues the request to answer it in a single transaction, earlier
+        pending requests of the session are dropped.
+
+        Parameters
+        ----------
+        msg : MessageWithTime
+            User message.
+        session_name : str
+            Session name.
+
+        Returns
+        -------
+        int
+            Request identifier.
+        """
+        session_id = self.__session_id(session_name)
+        with self.connection.connection() as conn:
+            conn.execute(
+                """
+                    UPDATE
+                        requests
+                    SET
+                        status = %s, completed_at = %s
+                    WHERE
+                        session_id = %s AND status = 'pending'
+                    ;
+                    """,
+                (RequestStatusEnum.DROPPED.value, msg.timestamp, session_id),
+                prepare=True,
+            )
+            message_id = self.__insert_message(conn, session_id, msg)
+            (request_id,) = conn.execute(
+                """
+                    INSERT INTO requests (
+                        session_id, message_id, status, created_at
+                        )
+                    VALUES (%s, %s, %s, %s)
+                    RETURNING id;
+                    """,
+                (
+                    session_id,
+                    message_id,
+                    RequestStatusEnum.PENDING.value,
+                    msg.timestamp,
+                ),
+                prepare=True,
+            ).fetchone()
+        return request_id
+
+    def complete_request(
+        self,
+        request_id: int,
+        msg: Optional[MessageWithTime],
+        session_name: str,
+        metric: Optional[TurnMetric] = None,
+    ) -> bool:
+        """
+        Stores the answer of a pending request and marks it as done in a single transaction.
+
+        Parameters
+        ----------
+        request_id : int
+            Request identifier.
+        msg : Optional[MessageWithTime]
+            Assistant message, the request is dropped if it's `None`.
+        session_name : str
+            Session name.
+        metric : Optional[TurnMetric]
+            Measurements of the answer.
+
+        Returns
+        -------
+        bool
+            Whether the request was still pending.
+        """
+        session_id = self.__session_id(session_name)
+        status = (
+            RequestStatusEnum.DONE if msg is not None else RequestStatusEnum.DROPPED
+        )
+        with self.connection.connection() as conn:
+            updated = conn.execute(
+                """
+                    UPDATE
+                        requests
+                    SET
+                        status = %s, completed_at = %s
+                    WHERE
+                        id = %s AND session_id = %s AND status = %s
+                    ;
+                    """,
+                (
+                    status.value,
+                    int(time.time()),
+                    request_id,
+                    session_id,
+                    RequestStatusEnum.PENDING.value,
+                ),
+                prepare=True,
+            ).rowcount
+            if updated and msg is not None:
+                self.__insert_message(conn, session_id, msg)
+            if updated and metric is not None:
+                conn.execute(
+                    """
+                        INSERT INTO metrics (
+                            session_id, request_id, backend, timestamp, latency_ms,
+                            prompt_tokens, completion_tokens, estimated
+                            )
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s);
+                        """,
+                    (session_id, request_id, *metric),
+                    prepare=True,
+                )
+        return updated > 0
+
+    def get_pending_requests(
+        self, session_name: Optional[str] = None
+    ) -> List[PendingRequest]:
+        """
+        Lists the requests that were never answered, oldest first.
+
+        Parameters
+        ----------
+        session_name : Optional[str]
+            Session name, all sessions by default.
+
+        Returns
+        -------
+        List[PendingRequest]
+            Pending requests.
+        """
+        with self.connection.connection() as conn:
+            result = conn.execute(
+                """
+                    SELECT
+                        requests.id, sessions.name, messages.content
+                    FROM
+                        requests
+                        JOIN sessions ON sessions.id = requests.session_id
+                        JOIN messages ON messages.id = requests.message_id
+                    WHERE
+                        requests.status = 'pending'
+                        AND (%s::TEXT IS NULL OR sessions.name = %s)
+                    ORDER BY
+                        requests.id ASC
+                    ;
+                    """,
+                (session_name, session_name),
+                prepare=True,
+            ).fetchall()
+        return list(map(PendingRequest._make, result))
+
+    def __update_session(
+        self,
+        conn: Connection,
+        session_id: int,
+        n_messages: int,
+        n_tokens: int,
+        last_content: str,
+        timestamp: int,
+    ):
+        """
+        Incrementally updates the metadata of a session after adding messages.
+
+        Parameters
+        ----------
+        conn : Connection
+            Connection of the ongoing transaction.
+        session_id : int
+            Session identifier.
+        n_messages : int
+            Number of added messages.
+        n_tokens : int
+            Approximated number of added tokens.
+        last_content : str
+            Content of the last added message.
+        timestamp : int
+            Unix time of the last added message.
+        """
+        conn.execute(
+            """
+                UPDATE
+                    sessions
+                SET
+                    updated_at = greatest(updated_at, %s),
+                    message_count = message_count + %s,
+                    token_total = token_total + %s,
+                    preview = %s
+                WHERE
+                    id = %s
+                ;
+                """,
+            (
+                timestamp,
+                n_messages,
+                n_tokens,
+                last_content[:PREVIEW_LENGTH],
+                session_id,
+            ),
+            prepare=True,
+        )
+
+    def add_messages(self, msgs: Iterable[MessageWithTime], session_name: str) -> int:
+        """
+        Saves several messages (rows) in the database streaming them through `COPY`.
+
+        Parameters
+        ----------
+        msgs : Iterable[MessageWithTime]
+            Messages to store, they're consumed lazily.
+        session_name : str
+            Session name.
+
+        Returns
+        -------
+        int
+            Number of stored messages.
+        """
+        session_id = self.__session_id(session_name)
+        total, tokens, content, timestamp = 0, 0, "", 0
+        with self.connection.connection() as conn:
+            with conn.cursor() as cursor:
+                with cursor.copy(
+                    "COPY messages (session_id, role, content, timestamp) FROM STDIN"
+                ) as copy:
+                    for msg in msgs:
+                        copy.write_row(
+                            (
+                                session_id,
+                                msg.message.role,
+                                msg.message.content,
+                                msg.timestamp,
+                            )
+                        )
+                        total += 1
+                        tokens += approximate_tokens(msg.message.content)
+                        content, timestamp = msg.message.content, msg.timestamp
+            if total:
+                self.__update_session(
+                    conn, session_id, total, tokens, content, timestamp
+                )
+        return total
+
+    def get_messages(self, session_name: str) -> Messages:
+        """
+        Extracts the most recent messages from the database.
+
+        Parameters
+        ----------
+        session_name : str
+            Session name.
+        """
+        session_id = self.__session_id(session_name)
+        with self.connection.connection() as conn:
+            result = conn.execute(
+                """
+                    SELECT
+                        role, content
+                    FROM
+                        messages
+                    WHERE
+                        session_id = %s AND role != %s
+                    ORDER BY
+                        id ASC
+                    ;
+                    """,
+                (session_id, SUMMARY_ROLE),
+                prepare=True,
+            ).fetchall()
+        messages = Messages(values=list(map(MessageRecord._make, result)))
+        return messages
+
+    def get_last_message(
+        self, session_name: str, role: str, offset: int = 0
+    ) -> Optional[str]:
+        """
+        Finds a recent message of a role walking the session index backwards.
+
+        Parameters
+        ----------
+        session_name : str
+            Session name.
+        role : str
+            Role of the message.
+        offset : int
+            Number of newer messages of the role to skip.
+
+        Returns
+        -------
+        Optional[str]
+            Message content, `None` if there's no such message.
+        """
+        session_id = self.__session_id(session_name)
+        with self.connection.connection() as conn:
+            row = conn.execute(
+                """
+                    SELECT
+                        content
+                    FROM
+                        messages
+                    WHERE
+                        session_id = %s AND role = %s
+                    ORDER BY
+                        id DESC
+                    LIMIT 1 OFFSET %s
+                    ;
+                    """,
+                (session_id, role, offset),
+                prepare=True,
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def __latest_summary(
+        self, conn: Connection, session_id: int
+    ) -> Tuple[Optional[str], int]:
+        """
+        Finds the latest summary of a session.
+
+        Parameters
+        ----------
+        conn : Connection
+            Connection to use.
+        session_id : int
+            Session identifier.
+
+        Returns
+        -------
+        Tuple[Optional[str], int]
+            Summary, `None` if there's no summary, and the identifier of the last summarized message.
+        """
+        row = conn.execute(
+            """
+                SELECT
+                    content, parent_id
+                FROM
+                    messages
+                WHERE
+                    session_id = %s AND role = %s
+                ORDER BY
+                    id DESC
+                LIMIT 1
+                ;
+                """,
+            (session_id, SUMMARY_ROLE),
+            prepare=True,
+        ).fetchone()
+        if row is None:
+            return None, 0
+        return row[0], row[1] or 0
+
+    def get_recent_messages(self, session_name: str) -> Messages:
+        """
+        Extracts the system messages, the latest summary and the messages that it doesn't cover.
+
+        Parameters
+        ----------
+        session_name : str
+            Session name.
+        """
+        session_id = self.__session_id(session_name)
+        with self.connection.connection() as conn:
+            summary, until_id = self.__latest_summary(conn, session_id)
+            result = conn.execute(
+                """
+                    SELECT
+                        role, content, id <= %s
+                    FROM
+                        messages
+                    WHERE
+                        session_id = %s AND role != %s AND (id > %s OR role = 'system')
+                    ORDER BY
+                        id ASC
+                    ;
+                    """,
+                (until_id, session_id, SUMMARY_ROLE, until_id),
+                prepare=True,
+            ).fetchall()
+        values = [MessageRecord(x[0], x[1]) for x in result if x[2]]
+        if summary is not None:
+            values.append(MessageRecord(SUMMARY_ROLE, summary))
+        values.extend(MessageRecord(x[0], x[1]) for x in result if not x[2])
+        return Messages(values=values)
+
+    def get_compactable(
+        self, session_name: str, keep: int
+    ) -> Tuple[Messages, Optional[int]]:
+        """
+        Extracts the messages that can be summarized, preceded by the latest summary.
+
+        Parameters
+        ----------
+        session_name : str
+            Session name.
+        keep : int
+            Number of recent messages that mustn't be summarized.
+
+        Returns
+        -------
+        Tuple[Messages, Optional[int]]
+            Messages to summarize and the identifier of the last one.
+        """
+        session_id = self.__session_id(session_name)
+        with self.connection.connection() as conn:
+            summary, until_id = self.__latest_summary(conn, session_id)
+            result = conn.execute(
+                """
+                    SELECT
+                        id, role, content
+                    FROM
+                        messages
+                    WHERE
+                        session_id = %s AND id > %s AND role IN ('user', 'assistant')
+                    ORDER BY
+                        id ASC
+                    ;
+                    """,
+                (session_id, until_id),
+                prepare=True,
+            ).fetchall()
+        result = result[: max(len(result) - keep, 0)]
+        if not result:
+            return Messages(values=[]), None
+        values = [MessageRecord(x[1], x[2]) for x in result]
+        if summary is not None:
+            values.insert(0, MessageRecord(SUMMARY_ROLE, summary))
+        return Messages(values=values), result[-1][0]
+
+    def get_remote_state(self, session_name: str) -> Tuple[Optional[str], int]:
+        """
+        Finds the latest identifier that the model's server gave to a message of the session.
+
+        Parameters
+        ----------
+        session_name : str
+            Session name.
+
+        Returns
+        -------
+        Tuple[Optional[str], int]
+            Remote identifier, `None` if the server has no state, and the identifier of its message.
+        """
+        session_id = self.__session_id(session_name)
+        with self.connection.connection() as conn:
+            row = conn.execute(
+                """
+                    SELECT
+                        remote_id, id
+                    FROM
+                        messages
+                    WHERE
+                        session_id = %s AND remote_id IS NOT NULL
+                    ORDER BY
+                        id DESC
+                    LIMIT 1
+                    ;
+                    """,
+                (session_id,),
+                prepare=True,
+            ).fetchone()
+        if row is None:
+            return None, 0
+        return row[0], row[1]
+
+    def get_messages_after(self, session_name: str, after_id: int) -> Messages:
+        """
+        Extracts the messages stored after a given one.
+
+        Parameters
+        ----------
+        session_name : str
+            Session name.
+        after_id : int
+            Identifier of the last message that must be excluded.
+        """
+        session_id = self.__session_id(session_name)
+        with self.connection.connection() as conn:
+            result = conn.execute(
+                """
+                    SELECT
+                        role, content
+                    FROM
+                        messages
+                    WHERE
+                        session_id = %s AND id > %s AND role != %s
+                    ORDER BY
+                        id ASC
+                    ;
+                    """,
+                (session_id, after_id, SUMMARY_ROLE),
+                prepare=True,
+            ).fetchall()
+        return Messages(values=list(map(MessageRecord._make, result)))
+
+    def add_summary(self, content: str, until_id: int, session_name: str):
+        """
+        Stores a summary as a special row of the session.
+
+        Parameters
+        ----------
+        content : str
+            Summary.
+        until_id : int
+            Identifier of the last summarized message.
+        session_name : str
+            Session name.
+        """
+        session_id = self.__session_id(session_name)
+        with self.connection.connection() as conn:
+            conn.execute(
+                """
+                    INSERT INTO messages (
+                        session_id, role, content, timestamp, parent_id
+                        )
+                    VALUES (%s, %s, %s, %s, %s);
+                    """,
+                (session_id, SUMMARY_ROLE, content, int(time.time()), until_id),
+                prepare=True,
+            )
+
+    def iter_messages(
+        self, session_name: str, batch_size: int = 1000
+    ) -> Iterator[MessageWithTime]:
+        """
+        Iterates over the messages of a session using a server side cursor.
+
+        Parameters
+        ----------
+        session_name : str
+            Session name.
+        batch_size : int
+            Number of rows fetched at once.
+
+        Yields
+        ------
+        MessageWithTime
+            Messages in chronological order.
+        """
+        session_id = self.__session_id(session_name)
+        with self.connection.connection() as conn:
+            with conn.cursor(name="gpttui_iter_messages") as cursor:
+                cursor.itersize = batch_size
+                cursor.execute(
+                    """
+                        SELECT
+                            role, content, timestamp
+                        FROM
+                            messages
+                        WHERE
+                            session_id = %s AND role != %s
+                        ORDER BY
+                            id ASC
+                        ;
+                        """,
+                    (session_id, SUMMARY_ROLE),
+                )
+                for role, content, timestamp in cursor:
+                    yield MessageWithTime.construct(
+                        message=Message.construct(role=role, content=content),
+                        timestamp=timestamp,
+                    )
+
+    def iter_messages_after(
+        self, after_id: int, batch_size: int = 1000
+    ) -> Iterator[IndexedMessage]:
+        """
+        Iterates over the user and assistant messages of every session fetching them in batches.
+
+        Parameters
+        ----------
+        after_id : int
+            Identifier of the last known message.
+        batch_size : int
+            Number of rows fetched at once.
+
+        Yields
+        ------
+        IndexedMessage
+            Messages in insertion order.
+        """
+        with self.connection.connection() as conn:
+            with conn.cursor(name="gpttui_iter_messages_after") as cursor:
+                cursor.itersize = batch_size
+                cursor.execute(
+                    """
+                        SELECT
+                            messages.id, sessions.name, messages.role, messages.content
+                        FROM
+                            messages
+                            JOIN sessions ON sessions.id = messages.session_id
+                        WHERE
+                            messages.id > %s AND messages.role IN ('user', 'assistant')
+                        ORDER BY
+                            messages.id ASC
+                        ;
+                        """,
+                    (after_id,),
+                )
+                yield from map(IndexedMessage._make, cursor)
+
+    def get_messages_by_ids(self, ids: List[int]) -> List[IndexedMessage]:
+        """
+        Finds messages of any session by their identifiers.
+
+        Parameters
+        ----------
+        ids : List[int]
+            Message identifiers.
+
+        Returns
+        -------
+        List[IndexedMessage]
+            Found messages, in no particular order.
+        """
+        with self.connection.connection() as conn:
+            result = conn.execute(
+                """
+                    SELECT
+                        messages.id, sessions.name, messages.role, messages.content
+                    FROM
+                        messages
+                        JOIN sessions ON sessions.id = messages.session_id
+                    WHERE
+                        messages.id = ANY(%s)
+                    ;
+                    """,
+                (list(ids),),
+                prepare=True,
+            ).fetchall()
+        return list(map(IndexedMessage._make, result))
+
+    def list_sessions(self) -> List[str]:
+        """
+        Lists the registered sessions.
+
+        Returns
+        -------
+        List[str]
+            Session names.
+        """
+        with self.connection.connection() as conn:
+            result = conn.execute(
+                "SELECT name FROM sessions ORDER BY name ASC;", prepare=True
+            ).fetchall()
+        return [x[0] for x in result]
+
+    def get_sessions(self) -> List[SessionInfo]:
+        """
+        Lists the metadata of the sessions with a single indexed query.
+
+        Returns
+        -------
+        List[SessionInfo]
+            Sessions metadata, the most recently updated first.
+        """
+        with self.connection.connection() as conn:
+            result = conn.execute(
+                """
+                    SELECT
+                        sessions.name, sessions.created_at, sessions.updated_at,
+                        sessions.message_count, sessions.token_total, sessions.preview,
+                        archives.session_id IS NOT NULL
+                    FROM
+                        sessions
+                        LEFT JOIN archives ON archives.session_id = sessions.id
+                    ORDER BY
+                        sessions.updated_at DESC
+                    ;
+                    """,
+                prepare=True,
+            ).fetchall()
+        return [
+            SessionInfo(
+                name=x[0],
+                created_at=x[1],
+                updated_at=x[2],
+                message_count=x[3],
+                token_total=x[4],
+                preview=x[5],
+                archived=x[6],
+            )
+            for x in result
+        ]
+
+    def set_retention(self, session_name: str, policy: Optional[RetentionPolicy]):
+        """
+        Stores the retention policy of a session.
+
+        Parameters
+        ----------
+        session_name : str
+            Session name.
+        policy : Optional[RetentionPolicy]
+            Retention policy, `None` uses the default one.
+        """
+        session_id = self.__session_id(session_name, restore=False)
+        with self.connection.connection() as conn:
+            if policy is None:
+                conn.execute(
+                    "DELETE FROM retention WHERE session_id = %s;",
+                    (session_id,),
+                    prepare=True,
+                )
+                return
+            conn.execute(
+                """
+                    INSERT INTO retention (
+                        session_id, max_age_days, max_messages
+                        )
+                    VALUES (%s, %s, %s)
+                    ON CONFLICT (session_id) DO UPDATE SET
+                        max_age_days = EXCLUDED.max_age_days,
+                        max_messages = EXCLUDED.max_messages
+                    ;
+                    """,
+                (session_id, *policy),
+                prepare=True,
+            )
+
+    def get_retention(self, session_name: str) -> Optional[RetentionPolicy]:
+        """
+        Finds the retention policy of a session.
+
+        Parameters
+        ----------
+        session_name : str
+            Session name.
+
+        Returns
+        -------
+        Optional[RetentionPolicy]
+            Retention policy, `None` if the session uses the default one.
+        """
+        session_id = self.__session_id(session_name, restore=False)
+        with self.connection.connection() as conn:
+            row = conn.execute(
+                "SELECT max_age_days, max_messages FROM retention WHERE session_id = %s;",
+                (session_id,),
+                prepare=True,
+            ).fetchone()
+        return RetentionPolicy._make(row) if row is not None else None
+
+    def apply_retention(self, default: RetentionPolicy, now: int) -> int:
+        """
+        Deletes the messages that the retention policies don't keep, each session is cleaned in its
+        own transaction.
+
+        Parameters
+        ----------
+        default : RetentionPolicy
+            Policy of the sessions without their own.
+        now : int
+            Current unix time.
+
+        Returns
+        -------
+        int
+            Number of deleted messages.
+        """
+        with self.connection.connection() as conn:
+            candidates = conn.execute(
+                """
+                    SELECT
+                        id, max_age_days, max_messages
+                    FROM (
+                        SELECT
+                            sessions.id,
+                            sessions.message_count,
+                            coalesce(retention.max_age_days, %(age)s) AS max_age_days,
+                            coalesce(retention.max_messages, %(keep)s) AS max_messages,
+                            (
+                                SELECT timestamp FROM messages
+                                WHERE session_id = sessions.id AND role IN ('user', 'assistant')
+                                ORDER BY id ASC LIMIT 1
+                            ) AS oldest
+                        FROM
+                            sessions
+                            LEFT JOIN retention ON retention.session_id = sessions.id
+                        WHERE
+                            sessions.id NOT IN (SELECT session_id FROM archives)
+                        ) AS policies
+                    WHERE
+                        (max_age_days > 0 AND oldest < %(now)s - max_age_days * 86400)
+                        OR (max_messages > 0 AND message_count > max_messages)
+                    ;
+                    """,
+                {"age": default.max_age_days, "keep": default.max_messages, "now": now},
+                prepare=True,
+            ).fetchall()
+        deleted = 0
+        for session_id, max_age_days, max_messages in candidates:
+            with self.connection.connection() as conn:
+                count = conn.execute(
+                    """
+                        DELETE FROM
+                            messages
+                        WHERE
+                            session_id = %(session)s
+                            AND role IN ('user', 'assistant')
+                            AND (
+                                timestamp < %(cutoff)s
+                                OR (%(keep)s > 0 AND id <= coalesce((
+                                    SELECT id FROM messages
+                                    WHERE session_id = %(session)s
+                                        AND role IN ('user', 'assistant')
+                                    ORDER BY id DESC LIMIT 1 OFFSET greatest(%(keep)s, 0)
+                                ), 0))
+                            )
+                            AND id NOT IN (
+                                SELECT message_id FROM requests
+                                WHERE session_id = %(session)s AND status = 'pending'
+                            )
+                        ;
+                        """,
+                    {
+                        "session": session_id,
+                        "cutoff": now - max_age_days * 86400 if max_age_days > 0 else 0,
+                        "keep": max_messages,
+                    },
+                    prepare=True,
+                ).rowcount
+                if count <= 0:
+                    continue
+                deleted += count
+                conn.execute(
+                    """
+                        UPDATE
+                            sessions
+                        SET
+                            message_count = (
+                                SELECT count(*) FROM messages WHERE session_id = sessions.id
+                            ),
+                            token_total = coalesce((
+                                SELECT sum((length(content) + 3) / 4) FROM messages
+                                WHERE session_id = sessions.id
+                            ), 0)
+                        WHERE
+                            id = %s
+                        ;
+                        """,
+                    (session_id,),
+                    prepare=True,
+                )
+        return deleted
+
+    def vacuum_step(self, pages: int) -> int:
+        """
+        Space is reclaimed by the autovacuum daemon of postgresql, so nothing is done here.
+
+        Parameters
+        ----------
+        pages : int
+            Ignored.
+
+        Returns
+        -------
+        int
+            Always 0.
+        """
+        return 0
+
+    def optimize(self):
+        """
+        Refreshes the planner statistics of the gpttui tables.
+        """
+        with self.connection.connection() as conn:
+            conn.execute(
+                "ANALYZE sessions, messages, requests, metrics, retention, archives;"
+            )
+
+    def get_inactive_sessions(self, before: int) -> List[str]:
+        """
+        Lists the sessions that can be archived.
+
+        Parameters
+        ----------
+        before : int
+            Unix time of the last update.
+
+        Returns
+        -------
+        List[str]
+            Session names, the least recently updated first.
+        """
+        # NOTE: the pending status is inlined so the partial index can be used.
+        with self.connection.connection() as conn:
+            result = conn.execute(
+                """
+                    SELECT
+                        name
+                    FROM
+                        sessions
+                    WHERE
+                        updated_at < %s
+                        AND message_count > 0
+                        AND id NOT IN (SELECT session_id FROM archives)
+                        AND id NOT IN (
+                            SELECT session_id FROM requests WHERE status = 'pending'
+                        )
+                    ORDER BY
+                        updated_at ASC
+                    ;
+                    """,
+                (before,),
+                prepare=True,
+            ).fetchall()
+        return [x[0] for x in result]
+
+    def archive_session(self, session_name: str) -> int:
+        """
+        Moves the messages of a session into a gzip compressed row of the archives table, which
+        postgresql stores out of line, so the messages table and its indexes only keep the active
+        sessions. It's done in a single transaction.
+
+        Parameters
+        ----------
+        session_name : str
+            Session name.
+
+        Returns
+        -------
+        int
+            Number of archived messages.
+        """
+        session_id = self.__session_id(session_name, restore=False)
+        with self.connection.connection() as conn:
+            if conn.execute(
+                "SELECT 1 FROM archives WHERE session_id = %s FOR UPDATE;",
+                (session_id,),
+                prepare=True,
+            ).fetchone():
+                return 0
+            rows = [
+                ArchivedMessage._make(row)
+                for row in conn.execute(
+                    """
+                        SELECT
+                            id, role, content, timestamp, parent_id, remote_id
+                        FROM
+                            messages
+                        WHERE
+                            session_id = %s
+                        ORDER BY
+                            id ASC
+                        FOR UPDATE;
+                        """,
+                    (session_id,),
+                    prepare=True,
+                )
+            ]
+            if not rows:
+                return 0
+            conn.execute(
+                """
+                    DELETE FROM
+                        requests
+                    WHERE
+                        session_id = %s AND message_id <= %s AND status != 'pending'
+                    ;
+                    """,
+                (session_id, rows[-1].id),
+                prepare=True,
+            )
+            conn.execute(
+                "DELETE FROM messages WHERE session_id = %s AND id <= %s;",
+                (session_id, rows[-1].id),
+                prepare=True,
+            )
+            conn.execute(
+                """
+                    INSERT INTO archives (
+                        session_id, data, message_count, archived_at
+                        )
+                    VALUES (%s, %s, %s, %s);
+                    """,
+                (
+                    session_id,
+                    gzip.compress(b"".join(encode_archive(rows))),
+                    len(rows),
+                    int(time.time()),
+                ),
+                prepare=True,
+            )
+        self.__session_ids.pop(session_name, None)
+        return len(rows)
+
+    def restore_session(self, session_name: str) -> int:
+        """
+        Moves the messages of an archived session back to postgresql.
+
+        Parameters
+        ----------
+        session_name : str
+            Session name.
+
+        Returns
+        -------
+        int
+            Number of restored messages, 0 if the session wasn't archived.
+        """
+        return self.__restore(self.__session_id(session_name, restore=False))
+
+    def get_data_version(self) -> int:
+        """
+        Finds the last message identifier, it's read from the primary key index.
+
+        Returns
+        -------
+        int
+            Last message identifier, it also changes with the messages of this connection.
+        """
+        with self.connection.connection() as conn:
+            row = conn.execute(
+                "SELECT coalesce(max(id), 0) FROM messages;", prepare=True
+            ).fetchone()
+        return row[0]
+
+    def get_last_message_id(self) -> int:
+        """
+        Finds the identifier of the last stored message, it's read from the primary key index.
+
+        Returns
+        -------
+        int
+            Message identifier, 0 if there are no messages.
+        """
+        return self.get_data_version()
+
+    def get_lock_stats(self) -> LockStats:
+        """
+        Writers of postgresql only wait for the rows they share, so nothing is measured here.
+
+        Returns
+        -------
+        LockStats
+            Always empty.
+        """
+        return LockStats()
+
+    def get_usage(self, group: UsageGroupEnum, since: int = 0) -> List[UsageRow]:
+        """
+        Aggregates the usage metrics in a single query, the time filter uses the timestamp index.
+
+        Parameters
+        ----------
+        group : UsageGroupEnum
+            How the answers are grouped.
+        since : int
+            Unix time of the oldest answer to include.
+
+        Returns
+        -------
+        List[UsageRow]
+            Usage of each group, the most tokens first.
+        """
+        with self.connection.connection() as conn:
+            result = conn.execute(
+                f"""
+                    SELECT
+                        {_USAGE_KEYS[group]},
+                        count(*),
+                        sum(metrics.prompt_tokens),
+                        sum(metrics.completion_tokens),
+                        max(metrics.prompt_tokens),
+                        count(*) FILTER (WHERE metrics.estimated)
+                    FROM
+                        metrics
+                        JOIN sessions ON sessions.id = metrics.session_id
+                    WHERE
+                        metrics.timestamp >= %s
+                    GROUP BY
+                        1
+                    ORDER BY
+                        sum(metrics.prompt_tokens) + sum(metrics.completion_tokens) DESC, 1 ASC
+                    ;
+                    """,
+                (since,),
+                prepare=True,
+            ).fetchall()
+        return [UsageRow(x[0], *map(int, x[1:])) for x in result]
+
+    def get_latencies(
+        self, group: UsageGroupEnum, since: int = 0
+    ) -> List[Tuple[str, float]]:
+        """
+        Lists the latency of every answer along with its group.
+
+        Parameters
+        ----------
+        group : UsageGroupEnum
+            How the answers are grouped.
+        since : int
+            Unix time of the oldest answer to include.
+
+        Returns
+        -------
+        List[Tuple[str, float]]
+            Group and latency in milliseconds.
+        """
+        with self.connection.connection() as conn:
+            result = conn.execute(
+                f"""
+                    SELECT
+                        {_USAGE_KEYS[group]}, metrics.latency_ms
+                    FROM
+                        metrics
+                        JOIN sessions ON sessions.id = metrics.session_id
+                    WHERE
+                        metrics.timestamp >= %s
+                    ;
+                    """,
+                (since,),
+                prepare=True,
+            ).fetchall()
+        return [(x[0], x[1]) for x in result]
+
+    def close(self):
+        """
+        Closes the pool of connections.
+        """
+        self.connection.close()
@@ -1,22 +1,75 @@
 """
 This file defines the required elements to use sqlite as a database.
 """
-import sqlite3
-from gpttui.database.base import AbstractDB, MessageWithTime, Messages, Message
-from typing import Callable, List
+import random, sqlite3, time
+from contextlib import contextmanager
+from pathlib import Path
+from gpttui.codec import dumps
+from gpttui.database.archive import (
+    ArchivedMessage,
+    ARCHIVE_SUFFIX,
+    read_archive,
+    write_archive,
+)
+from gpttui.database.migrations import (
+    MIGRATIONS,
+    is_legacy_table,
+    legacy_session_info,
+    legacy_tables,
+    move_legacy_session,
+)
+from gpttui.database.base import (
+    AbstractDB,
+    MessageWithTime,
+    Messages,
+    Message,
+    MessageRecord,
+    IndexedMessage,
+    LockStats,
+    PendingRequest,
+    RequestStatusEnum,
+    RetentionPolicy,
+    SessionInfo,
+    TurnMetric,
+    UsageGroupEnum,
+    UsageRow,
+    PREVIEW_LENGTH,
+    SUMMARY_ROLE,
+    approximate_tokens,
+)
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+_MIGRATION_BATCH = 1000
+_BACKOFF_SECONDS = 0.05
+_MAX_BACKOFF_SECONDS = 1.0
+_USAGE_KEYS = {
+    UsageGroupEnum.SESSION: "sessions.name",
+    UsageGroupEnum.BACKEND: "metrics.backend",
+    UsageGroupEnum.DAY: "date(metrics.timestamp, 'unixepoch')",
+}
 
 
 class SqliteDB(AbstractDB):
     """
     This class represents a database based on SQLITE.
 
+    Sessions are rows of a registry table instead of tables, so every statement is static and reused
+    from the statement cache of `sqlite3`.
+
+    Several processes can share the database: it uses write-ahead logging so readers never wait for
+    writers, and every write transaction takes the lock upfront with `BEGIN IMMEDIATE`, so it waits
+    for the busy timeout instead of failing halfway.
+
     Attributes
     ----------
     connection : sqlite3.Connection
         Connection with a sqlite database.
+    archive_path : Path
+        Folder of the archived sessions.
     """
 
     connection: sqlite3.Connection
+    archive_path: Path
 
     def setup(self, **kwargs: str) -> "AbstractDB":
         """
@@ -26,15 +79,163 @@ class SqliteDB(AbstractDB):
         ----------
         database : str
             Database filename.
+        archive_path : str
+            Folder of the archived sessions, `<database>.archive` by default.
+        timeout : str
+            Seconds that a write waits for the lock before it's retried, 2 by default.
+        retries : str
+            Times that a write is retried before it fails, 3 by default.
 
         Returns
         -------
         AbstractDB
             Instance of the database.
         """
-        self.connection = sqlite3.connect(kwargs["database"])
+        # NOTE: transactions are explicit, so reads don't keep a transaction open between calls.
+        self.connection = sqlite3.connect(
+            kwargs["database"],
+            timeout=float(kwargs.get("timeout", 2)),
+            isolation_level=None,
+        )
+        self.retries = int(kwargs.get("retries", 3))
+        self.__lock_stats = LockStats()
+        self.archive_path = Path(
+            kwargs.get("archive_path") or f"{kwargs['database']}.archive"
+        )
+        self.__session_ids: Dict[str, int] = {}
+        # NOTE: it only applies to new databases, older ones are converted by `vacuum_step(0)`.
+        self.connection.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+        self.connection.execute("PRAGMA journal_mode = WAL;")
+        self.__upgrade_schema()
+        self.migrate()
         return self
 
+    def __upgrade_schema(self):
+        """
+        Runs the schema statements of the pending migrations in a single transaction, their batches
+        are left to `migrate`. Up to date databases are only read.
+        """
+        version = self.connection.execute("PRAGMA user_version;").fetchone()[0]
+        self.__migrations = [m for m in MIGRATIONS if m.version > version]
+        if not self.__migrations:
+            return
+        with self.__transaction() as cursor:
+            for migration in self.__migrations:
+                for statement in migration.schema:
+                    cursor.execute(statement)
+
+    def migrate(self, batch_size: int = _MIGRATION_BATCH) -> int:
+        """
+        Runs the pending migrations in order, up to the first batch, and raises `user_version` past
+        the ones that are complete. Each step is its own transaction.
+
+        Parameters
+        ----------
+        batch_size : int
+            Maximum number of rows that the batch moves.
+
+        Returns
+        -------
+        int
+            Number of pending migrations.
+        """
+        while self.__migrations:
+            migration = self.__migrations[0]
+            with self.__transaction() as cursor:
+                done = migration.batch is None or migration.batch(cursor, batch_size)
+                version = cursor.execute("PRAGMA user_version;").fetchone()[0]
+                # NOTE: another process may have applied the later migrations already.
+                if done and version < migration.version:
+                    cursor.execute(f"PRAGMA user_version = {migration.version};")
+            if not done:
+                break
+            self.__migrations.pop(0)
+            if migration.batch is not None:
+                break
+        return len(self.__migrations)
+
+    def __move_legacy_session(self, session_name: str):
+        """
+        Moves a session that's still stored as a legacy table before it's used, so its old messages
+        come before the new ones.
+
+        Parameters
+        ----------
+        session_name : str
+            Session name.
+        """
+        pending = lambda cursor: is_legacy_table(cursor, session_name)
+        done = not pending(self.connection.cursor())
+        while not done:
+            with self.__transaction() as cursor:
+                # NOTE: another process may have moved it since it was checked.
+                done = not pending(cursor) or move_legacy_session(
+                    cursor, session_name, _MIGRATION_BATCH
+                )
+
+    def __begin(self):
+        """
+        Starts a write transaction. When the busy timeout expires it's retried after a random
+        exponential backoff, so the processes that wait for the same lock don't retry in lockstep.
+        """
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                self.connection.execute("BEGIN IMMEDIATE;")
+                break
+            except sqlite3.OperationalError as e:
+                busy = str(e).startswith("database is locked")
+                if not busy or attempt >= self.retries:
+                    self.__record_wait(started, attempt, failed=True)
+                    raise
+            backoff = min(_MAX_BACKOFF_SECONDS, _BACKOFF_SECONDS * 2**attempt)
+            time.sleep(random.uniform(0, backoff))
+            attempt += 1
+        self.__record_wait(started, attempt, failed=False)
+
+    def __record_wait(self, started: float, retries: int, failed: bool):
+        """
+        Adds a wait for the write lock to the statistics.
+
+        Parameters
+        ----------
+        started : float
+            Performance counter when the lock was requested.
+        retries : int
+            Times that it was requested again.
+        failed : bool
+            Whether the lock was never acquired.
+        """
+        waited = (time.perf_counter() - started) * 1000
+        stats = self.__lock_stats
+        self.__lock_stats = LockStats(
+            transactions=stats.transactions + 1,
+            contended=stats.contended + (waited >= 1),
+            retries=stats.retries + retries,
+            failures=stats.failures + failed,
+            wait_ms=stats.wait_ms + waited,
+            max_wait_ms=max(stats.max_wait_ms, waited),
+        )
+
+    @contextmanager
+    def __transaction(self) -> Iterator[sqlite3.Cursor]:
+        """
+        Runs a write transaction, it's committed if no exception is raised.
+
+        Yields
+        ------
+        sqlite3.Cursor
+            Cursor of the transaction.
+        """
+        self.__begin()
+        try:
+            yield self.connection.cursor()
+        except BaseException:
+            self.connection.execute("ROLLBACK;")
+            raise
+        self.connection.execute("COMMIT;")
+
     def __write_with_connection(self, f: Callable):
         """
         This method is used to handle the sqlite cursor object for write operations.
@@ -44,9 +245,8 @@ class SqliteDB(AbstractDB):
         f : Callable
             Function with a query that must be executed.
         """
-        cursor = self.connection.cursor()
-        f(cursor)
-        self.connection.commit()
+        with self.__transaction() as cursor:
+            f(cursor)
 
     def __read_with_connection(self, f: Callable) -> List:
         """
@@ -62,42 +262,163 @@ class SqliteDB(AbstractDB):
         result = list(cursor.fetchall())
         return result
 
+    def __session_id(self, session_name: str, restore: bool = True) -> int:
+        """
+        Finds the identifier of a session, archived sessions are restored on their first access.
+
+        Parameters
+        ----------
+        session_name : str
+            Session name.
+        restore : bool
+            Whether an archived session is restored, operations that don't read its messages skip it.
+
+        Returns
+        -------
+        int
+            Session identifier.
+        """
+        if session_name not in self.__session_ids:
+            if self.__migrations:
+                self.__move_legacy_session(session_name)
+            f = lambda cursor: cursor.execute(
+                """
+                    SELECT
+                        sessions.id, archives.path
+                    FROM
+                        sessions
+                        LEFT JOIN archives ON archives.session_id = sessions.id
+                    WHERE
+                        sessions.name = ?
+                    ;
+                    """,
+                (session_name,),
+            )
+            result = self.__read_with_connection(f)
+            if not result:
+                raise KeyError(f"Session {session_name} doesn't exist.")
+            session_id, archive = result[0]
+            if archive is not None:
+                if not restore:
+                    # NOTE: it isn't cached, so the next access still restores it.
+                    return session_id
+                self.__restore(session_id, archive)
+            self.__session_ids[session_name] = session_id
+        return self.__session_ids[session_name]
+
+    def __restore(self, session_id: int, archive: str) -> int:
+        """
+        Moves the messages of an archive back into the messages table with their identifiers.
+
+        Parameters
+        ----------
+        session_id : int
+            Session identifier.
+        archive : str
+            Name of the archive file.
+
+        Returns
+        -------
+        int
+            Number of restored messages, 0 if another connection restored them first.
+        """
+        cursor = self.connection.cursor()
+        with self.__transaction():
+            # NOTE: the manifest row is removed first, so only one connection restores the file.
+            cursor.execute("DELETE FROM archives WHERE session_id = ?;", (session_id,))
+            if cursor.rowcount == 0:
+                return 0
+            cursor.executemany(
+                """
+                    INSERT OR IGNORE INTO messages (
+                        id, session_id, role, content, timestamp, parent_id, remote_id
+                        )
+                    VALUES (?, ?, ?, ?, ?, ?, ?);
+                    """,
+                (
+                    (row.id, session_id, *row[1:])
+                    for row in read_archive(self.archive_path / archive)
+                ),
+            )
+            restored = cursor.rowcount
+        (self.archive_path / archive).unlink(missing_ok=True)
+        return restored
+
     def create_session(self, session_name: str):
         """
-        Creates a session (table) in sqlite.
+        Registers a session in sqlite.
 
         Parameters
         ----------
         session_name : str
             Session name.
         """
+        now = int(time.time())
         f = lambda cursor: cursor.execute(
-            f"""
-                CREATE TABLE IF NOT EXISTS {session_name}(
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    role TEXT,
-                    content TEXT,
-                    timestamp INT
-                    );
-                """
+            """
+                INSERT OR IGNORE INTO sessions (
+                    name, created_at, updated_at
+                    )
+                VALUES (?, ?, ?);
+                """,
+            (session_name, now, now),
         )
         self.__write_with_connection(f)
 
     def delete_session(self, session_name: str):
         """
-        Deletes a session (table) in sqlite.
+        Deletes a session and its messages in sqlite.
+
+        Parameters
+        ----------
+        session_name : str
+            Session name.
+        """
+        session_id = self.__session_id(session_name, restore=False)
+        archives = self.__read_with_connection(
+            lambda cursor: cursor.execute(
+                "SELECT path FROM archives WHERE session_id = ?;", (session_id,)
+            )
+        )
+        with self.__transaction():
+            self.connection.execute(
+                "DELETE FROM archives WHERE session_id = ?;", (session_id,)
+            )
+            self.connection.execute(
+                "DELETE FROM requests WHERE session_id = ?;", (session_id,)
+            )
+            self.connection.execute(
+                "DELETE FROM metrics WHERE session_id = ?;", (session_id,)
+            )
+            self.connection.execute(
+                "DELETE FROM retention WHERE session_id = ?;", (session_id,)
+            )
+            self.connection.execute(
+                "DELETE FROM messages WHERE session_id = ?;", (session_id,)
+            )
+            self.connection.execute("DELETE FROM sessions WHERE id = ?;", (session_id,))
+        self.__session_ids.pop(session_name, None)
+        for (archive,) in archives:
+            (self.archive_path / archive).unlink(missing_ok=True)
+
+    def rename_session(self, session_name: str, new_name: str):
+        """
+        Renames a session in sqlite.
 
         Parameters
         ----------
         session_name : str
             Session name.
+        new_name : str
+            New name.
         """
+        session_id = self.__session_id(session_name, restore=False)
         f = lambda cursor: cursor.execute(
-            f"""
-                DROP TABLE {session_name};
-                """
+            "UPDATE sessions SET name = ? WHERE id = ?;", (new_name, session_id)
         )
         self.__write_with_connection(f)
+        if self.__session_ids.pop(session_name, None) is not None:
+            self.__session_ids[new_name] = session_id
 
     def add_message(self, msg: MessageWithTime, session_name: str):
         """
@@ -110,16 +431,305 @@ class SqliteDB(AbstractDB):
         session_name : str
             Session name.
         """
-        f = lambda cursor: cursor.execute(
-            f"""
-                INSERT INTO {session_name} (
-                    role, content, timestamp
+        session_id = self.__session_id(session_name)
+        self.__write_with_connection(
+            lambda cursor: self.__insert_message(cursor, session_id, msg)
+        )
+
+    def __insert_message(
+        self, cursor: sqlite3.Cursor, session_id: int, msg: MessageWithTime
+    ) -> int:
+        """
+        Inserts a message and updates the metadata of its session in an ongoing transaction.
+
+        Parameters
+        ----------
+        cursor : sqlite3.Cursor
+            Cursor of the ongoing transaction.
+        session_id : int
+            Session identifier.
+        msg : MessageWithTime
+            Message to store.
+
+        Returns
+        -------
+        int
+            Message identifier.
+        """
+        cursor.execute(
+            """
+                INSERT INTO messages (
+                    session_id, role, content, timestamp, remote_id
                     )
-                VALUES (?, ?, ?);
+                VALUES (?, ?, ?, ?, ?);
                 """,
-            (msg.message.role, msg.message.content, msg.timestamp),
+            (
+                session_id,
+                msg.message.role,
+                msg.message.content,
+                msg.timestamp,
+                msg.remote_id,
+            ),
         )
-        self.__write_with_connection(f)
+        message_id = cursor.lastrowid
+        self.__update_session(
+            cursor,
+            session_id,
+            1,
+            approximate_tokens(msg.message.content),
+            msg.message.content,
+            msg.timestamp,
+        )
+        return message_id
+
+    def enqueue_request(self, msg: MessageWithTime, session_name: str) -> int:
+        """
+        Stores a user message and queues the request to answer it in a single transaction, earlier
+        pending requests of the session are dropped.
+
+        Parameters
+        ----------
+        msg : MessageWithTime
+            User message.
+        session_name : str
+            Session name.
+
+        Returns
+        -------
+        int
+            Request identifier.
+        """
+        session_id = self.__session_id(session_name)
+        cursor = self.connection.cursor()
+        # NOTE: the pending status is inlined so the partial index can be used.
+        with self.__transaction():
+            cursor.execute(
+                """
+                    UPDATE
+                        requests
+                    SET
+                        status = ?, completed_at = ?
+                    WHERE
+                        session_id = ? AND status = 'pending'
+                    ;
+                    """,
+                (RequestStatusEnum.DROPPED.value, msg.timestamp, session_id),
+            )
+            message_id = self.__insert_message(cursor, session_id, msg)
+            cursor.execute(
+                """
+                    INSERT INTO requests (
+                        session_id, message_id, status, created_at
+                        )
+                    VALUES (?, ?, ?, ?);
+                    """,
+                (
+                    session_id,
+                    message_id,
+                    RequestStatusEnum.PENDING.value,
+                    msg.timestamp,
+                ),
+            )
+        return cursor.lastrowid
+
+    def complete_request(
+        self,
+        request_id: int,
+        msg: Optional[MessageWithTime],
+        session_name: str,
+        metric: Optional[TurnMetric] = None,
+    ) -> bool:
+        """
+        Stores the answer of a pending request and marks it as done in a single transaction.
+
+        Parameters
+        ----------
+        request_id : int
+            Request identifier.
+        msg : Optional[MessageWithTime]
+            Assistant message, the request is dropped if it's `None`.
+        session_name : str
+            Session name.
+        metric : Optional[TurnMetric]
+            Measurements of the answer.
+
+        Returns
+        -------
+        bool
+            Whether the request was still pending.
+        """
+        session_id = self.__session_id(session_name)
+        status = (
+            RequestStatusEnum.DONE if msg is not None else RequestStatusEnum.DROPPED
+        )
+        cursor = self.connection.cursor()
+        with self.__transaction():
+            cursor.execute(
+                """
+                    UPDATE
+                        requests
+                    SET
+                        status = ?, completed_at = ?
+                    WHERE
+                        id = ? AND session_id = ? AND status = ?
+                    ;
+                    """,
+                (
+                    status.value,
+                    int(time.time()),
+                    request_id,
+                    session_id,
+                    RequestStatusEnum.PENDING.value,
+                ),
+            )
+            if cursor.rowcount == 0:
+                return False
+            if msg is not None:
+                self.__insert_message(cursor, session_id, msg)
+            if metric is not None:
+                cursor.execute(
+                    """
+                        INSERT INTO metrics (
+                            session_id, request_id, backend, timestamp, latency_ms,
+                            prompt_tokens, completion_tokens, estimated
+                            )
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?);
+                        """,
+                    (session_id, request_id, *metric),
+                )
+        return True
+
+    def get_pending_requests(
+        self, session_name: Optional[str] = None
+    ) -> List[PendingRequest]:
+        """
+        Lists the requests that were never answered, oldest first.
+
+        Parameters
+        ----------
+        session_name : Optional[str]
+            Session name, all sessions by default.
+
+        Returns
+        -------
+        List[PendingRequest]
+            Pending requests.
+        """
+        f = lambda cursor: cursor.execute(
+            """
+                SELECT
+                    requests.id, sessions.name, messages.content
+                FROM
+                    requests
+                    JOIN sessions ON sessions.id = requests.session_id
+                    JOIN messages ON messages.id = requests.message_id
+                WHERE
+                    requests.status = 'pending' AND (? IS NULL OR sessions.name = ?)
+                ORDER BY
+                    requests.id ASC
+                ;
+                """,
+            (session_name, session_name),
+        )
+        return list(map(PendingRequest._make, self.__read_with_connection(f)))
+
+    def __update_session(
+        self,
+        cursor: sqlite3.Cursor,
+        session_id: int,
+        n_messages: int,
+        n_tokens: int,
+        last_content: str,
+        timestamp: int,
+    ):
+        """
+        Incrementally updates the metadata of a session after adding messages.
+
+        Parameters
+        ----------
+        cursor : sqlite3.Cursor
+            Cursor of the ongoing transaction.
+        session_id : int
+            Session identifier.
+        n_messages : int
+            Number of added messages.
+        n_tokens : int
+            Approximated number of added tokens.
+        last_content : str
+            Content of the last added message.
+        timestamp : int
+            Unix time of the last added message.
+        """
+        cursor.execute(
+            """
+                UPDATE
+                    sessions
+                SET
+                    updated_at = max(updated_at, ?),
+                    message_count = message_count + ?,
+                    token_total = token_total + ?,
+                    preview = ?
+                WHERE
+                    id = ?
+                ;
+                """,
+            (
+                timestamp,
+                n_messages,
+                n_tokens,
+                last_content[:PREVIEW_LENGTH],
+                session_id,
+            ),
+        )
+
+    def add_messages(self, msgs: Iterable[MessageWithTime], session_name: str) -> int:
+        """
+        Saves several messages (rows) in the database using a single transaction.
+
+        Parameters
+        ----------
+        msgs : Iterable[MessageWithTime]
+            Messages to store, they're consumed lazily by `executemany`.
+        session_name : str
+            Session name.
+
+        Returns
+        -------
+        int
+            Number of stored messages.
+        """
+        session_id = self.__session_id(session_name)
+        stats = {"tokens": 0, "content": "", "timestamp": 0}
+
+        def rows() -> Iterator[tuple]:
+            for msg in msgs:
+                stats["tokens"] += approximate_tokens(msg.message.content)
+                stats["content"] = msg.message.content
+                stats["timestamp"] = msg.timestamp
+                yield (session_id, msg.message.role, msg.message.content, msg.timestamp)
+
+        cursor = self.connection.cursor()
+        with self.__transaction():
+            cursor.executemany(
+                """
+                    INSERT INTO messages (
+                        session_id, role, content, timestamp
+                        )
+                    VALUES (?, ?, ?, ?);
+                    """,
+                rows(),
+            )
+            total = cursor.rowcount
+            if total > 0:
+                self.__update_session(
+                    cursor,
+                    session_id,
+                    total,
+                    stats["tokens"],
+                    stats["content"],
+                    stats["timestamp"],
+                )
+        return max(total, 0)
 
     def get_messages(self, session_name: str) -> Messages:
         """
@@ -130,21 +740,889 @@ class SqliteDB(AbstractDB):
         session_name : str
             Session name.
         """
+        session_id = self.__session_id(session_name)
         f = lambda cursor: cursor.execute(
-            f"""
+            """
                 SELECT
                     role, content
                 FROM
-                    {session_name}
+                    messages
+                WHERE
+                    session_id = ? AND role != ?
                 ORDER BY
-                    timestamp ASC
+                    id ASC
                 ;
-                """
+                """,
+            (session_id, SUMMARY_ROLE),
         )
         result = self.__read_with_connection(f)
-        messages = Messages(values=[Message(role=x[0], content=x[1]) for x in result])
+        messages = Messages(values=list(map(MessageRecord._make, result)))
         return messages
 
+    def get_last_message(
+        self, session_name: str, role: str, offset: int = 0
+    ) -> Optional[str]:
+        """
+        Finds a recent message of a role walking the session index backwards.
+
+        Parameters
+        ----------
+        session_name : str
+            Session name.
+        role : str
+            Role of the message.
+        offset : int
+            Number of newer messages of the role to skip.
+
+        Returns
+        -------
+        Optional[str]
+            Message content, `None` if there's no such message.
+        """
+        session_id = self.__session_id(session_name)
+        f = lambda cursor: cursor.execute(
+            """
+                SELECT
+                    content
+                FROM
+                    messages
+                WHERE
+                    session_id = ? AND role = ?
+                ORDER BY
+                    id DESC
+                LIMIT 1 OFFSET ?
+                ;
+                """,
+            (session_id, role, offset),
+        )
+        result = self.__read_with_connection(f)
+        return result[0][0] if result else None
+
+    def __latest_summary(self, session_id: int) -> Tuple[Optional[str], int]:
+        """
+        Finds the latest summary of a session.
+
+        Parameters
+        ----------
+        session_id : int
+            Session identifier.
+
+        Returns
+        -------
+        Tuple[Optional[str], int]
+            Summary, `None` if there's no summary, and the identifier of the last summarized message.
+        """
+        f = lambda cursor: cursor.execute(
+            """
+                SELECT
+                    content, parent_id
+                FROM
+                    messages
+                WHERE
+                    session_id = ? AND role = ?
+                ORDER BY
+                    id DESC
+                LIMIT 1
+                ;
+                """,
+            (session_id, SUMMARY_ROLE),
+        )
+        result = self.__read_with_connection(f)
+        if not result:
+            return None, 0
+        return result[0][0], result[0][1] or 0
+
+    def get_recent_messages(self, session_name: str) -> Messages:
+        """
+        Extracts the system messages, the latest summary and the messages that it doesn't cover.
+
+        Parameters
+        ----------
+        session_name : str
+            Session name.
+        """
+        session_id = self.__session_id(session_name)
+        summary, until_id = self.__latest_summary(session_id)
+        f = lambda cursor: cursor.execute(
+            """
+                SELECT
+                    role, content, id <= ?
+                FROM
+                    messages
+                WHERE
+                    session_id = ? AND role != ? AND (id > ? OR role = 'system')
+                ORDER BY
+                    id ASC
+                ;
+                """,
+            (until_id, session_id, SUMMARY_ROLE, until_id),
+        )
+        result = self.__read_with_connection(f)
+        values = [MessageRecord(x[0], x[1]) for x in result if x[2]]
+        if summary is not None:
+            values.append(MessageRecord(SUMMARY_ROLE, summary))
+        values.extend(MessageRecord(x[0], x[1]) for x in result if not x[2])
+        return Messages(values=values)
+
+    def get_compactable(
+        self, session_name: str, keep: int
+    ) -> Tuple[Messages, Optional[int]]:
+        """
+        Extracts the messages that can be summarized, preceded by the latest summary.
+
+        Parameters
+        ----------
+        session_name : str
+            Session name.
+        keep : int
+            Number of recent messages that mustn't be summarized.
+
+        Returns
+        -------
+        Tuple[Messages, Optional[int]]
+            Messages to summarize and the identifier of the last one.
+        """
+        session_id = self.__session_id(session_name)
+        summary, until_id = self.__latest_summary(session_id)
+        f = lambda cursor: cursor.execute(
+            """
+                SELECT
+                    id, role, content
+                FROM
+                    messages
+                WHERE
+                    session_id = ? AND id > ? AND role IN ('user', 'assistant')
+                ORDER BY
+                    id ASC
+                ;
+                """,
+            (session_id, until_id),
+        )
+        result = self.__read_with_connection(f)
+        result = result[: max(len(result) - keep, 0)]
+        if not result:
+            return Messages(values=[]), None
+        values = [MessageRecord(x[1], x[2]) for x in result]
+        if summary is not None:
+            values.insert(0, MessageRecord(SUMMARY_ROLE, summary))
+        return Messages(values=values), result[-1][0]
+
+    def get_remote_state(self, session_name: str) -> Tuple[Optional[str], int]:
+        """
+        Finds the latest identifier that the model's server gave to a message of the session.
+
+        Parameters
+        ----------
+        session_name : str
+            Session name.
+
+        Returns
+        -------
+        Tuple[Optional[str], int]
+            Remote identifier, `None` if the server has no state, and the identifier of its message.
+        """
+        session_id = self.__session_id(session_name)
+        f = lambda cursor: cursor.execute(
+            """
+                SELECT
+                    remote_id, id
+                FROM
+                    messages
+                WHERE
+                    session_id = ? AND remote_id IS NOT NULL
+                ORDER BY
+                    id DESC
+                LIMIT 1
+                ;
+                """,
+            (session_id,),
+        )
+        result = self.__read_with_connection(f)
+        if not result:
+            return None, 0
+        return result[0][0], result[0][1]
+
+    def get_messages_after(self, session_name: str, after_id: int) -> Messages:
+        """
+        Extracts the messages stored after a given one.
+
+        Parameters
+        ----------
+        session_name : str
+            Session name.
+        after_id : int
+            Identifier of the last message that must be excluded.
+        """
+        session_id = self.__session_id(session_name)
+        f = lambda cursor: cursor.execute(
+            """
+                SELECT
+                    role, content
+                FROM
+                    messages
+                WHERE
+                    session_id = ? AND id > ? AND role != ?
+                ORDER BY
+                    id ASC
+                ;
+                """,
+            (session_id, after_id, SUMMARY_ROLE),
+        )
+        result = self.__read_with_connection(f)
+        return Messages(values=list(map(MessageRecord._make, result)))
+
+    def add_summary(self, content: str, until_id: int, session_name: str):
+        """
+        Stores a summary as a special row of the session.
+
+        Parameters
+        ----------
+        content : str
+            Summary.
+        until_id : int
+            Identifier of the last summarized message.
+        session_name : str
+            Session name.
+        """
+        session_id = self.__session_id(session_name)
+        f = lambda cursor: cursor.execute(
+            """
+                INSERT INTO messages (
+                    session_id, role, content, timestamp, parent_id
+                    )
+                VALUES (?, ?, ?, ?, ?);
+                """,
+            (session_id, SUMMARY_ROLE, content, int(time.time()), until_id),
+        )
+        self.__write_with_connection(f)
+
+    def iter_messages(
+        self, session_name: str, batch_size: int = 1000
+    ) -> Iterator[MessageWithTime]:
+        """
+        Iterates over the messages of a session fetching them in batches.
+
+        Parameters
+        ----------
+        session_name : str
+            Session name.
+        batch_size : int
+            Number of rows fetched at once.
+
+        Yields
+        ------
+        MessageWithTime
+            Messages in chronological order.
+        """
+        session_id = self.__session_id(session_name)
+        cursor = self.connection.cursor()
+        cursor.execute(
+            """
+                SELECT
+                    role, content, timestamp
+                FROM
+                    messages
+                WHERE
+                    session_id = ? AND role != ?
+                ORDER BY
+                    id ASC
+                ;
+                """,
+            (session_id, SUMMARY_ROLE),
+        )
+        while rows := cursor.fetchmany(batch_size):
+            for role, content, timestamp in rows:
+                yield MessageWithTime.construct(
+                    message=Message.construct(role=role, content=content),
+                    timestamp=timestamp,
+                )
+
+    def iter_messages_after(
+        self, after_id: int, batch_size: int = 1000
+    ) -> Iterator[IndexedMessage]:
+        """
+        Iterates over the user and assistant messages of every session fetching them in batches.
+
+        Parameters
+        ----------
+        after_id : int
+            Identifier of the last known message.
+        batch_size : int
+            Number of rows fetched at once.
+
+        Yields
+        ------
+        IndexedMessage
+            Messages in insertion order.
+        """
+        cursor = self.connection.cursor()
+        cursor.execute(
+            """
+                SELECT
+                    messages.id, sessions.name, messages.role, messages.content
+                FROM
+                    messages
+                    JOIN sessions ON sessions.id = messages.session_id
+                WHERE
+                    messages.id > ? AND messages.role IN ('user', 'assistant')
+                ORDER BY
+                    messages.id ASC
+                ;
+                """,
+            (after_id,),
+        )
+        while rows := cursor.fetchmany(batch_size):
+            yield from map(IndexedMessage._make, rows)
+
+    def get_messages_by_ids(self, ids: List[int]) -> List[IndexedMessage]:
+        """
+        Finds messages of any session by their identifiers.
+
+        Parameters
+        ----------
+        ids : List[int]
+            Message identifiers.
+
+        Returns
+        -------
+        List[IndexedMessage]
+            Found messages, in no particular order.
+        """
+        f = lambda cursor: cursor.execute(
+            """
+                SELECT
+                    messages.id, sessions.name, messages.role, messages.content
+                FROM
+                    messages
+                    JOIN sessions ON sessions.id = messages.session_id
+                WHERE
+                    messages.id IN (SELECT value FROM json_each(?))
+                ;
+                """,
+            (dumps(list(ids)).decode(),),
+        )
+        return list(map(IndexedMessage._make, self.__read_with_connection(f)))
+
+    def list_sessions(self) -> List[str]:
+        """
+        Lists the registered sessions, and the ones that are still stored as legacy tables.
+
+        Returns
+        -------
+        List[str]
+            Session names.
+        """
+        f = lambda cursor: cursor.execute(
+            "SELECT name FROM sessions ORDER BY name ASC;"
+        )
+        names = [x[0] for x in self.__read_with_connection(f)]
+        if self.__migrations:
+            # NOTE: the sessions that aren't moved yet are listed as well.
+            names = sorted(set(names).union(legacy_tables(self.connection.cursor())))
+        return names
+
+    def get_sessions(self) -> List[SessionInfo]:
+        """
+        Lists the metadata of the sessions with a single indexed query, the metadata of the sessions
+        that are still stored as legacy tables is computed from their messages.
+
+        Returns
+        -------
+        List[SessionInfo]
+            Sessions metadata, the most recently updated first.
+        """
+        f = lambda cursor: cursor.execute(
+            """
+                SELECT
+                    sessions.name, sessions.created_at, sessions.updated_at,
+                    sessions.message_count, sessions.token_total, sessions.preview,
+                    archives.session_id IS NOT NULL
+                FROM
+                    sessions
+                    LEFT JOIN archives ON archives.session_id = sessions.id
+                ORDER BY
+                    sessions.updated_at DESC
+                ;
+                """
+        )
+        sessions = [
+            SessionInfo(
+                name=x[0],
+                created_at=x[1],
+                updated_at=x[2],
+                message_count=x[3],
+                token_total=x[4],
+                preview=x[5],
+                archived=x[6],
+            )
+            for x in self.__read_with_connection(f)
+        ]
+        if not self.__migrations:
+            return sessions
+        cursor = self.connection.cursor()
+        legacy = {
+            table: legacy_session_info(cursor, table) for table in legacy_tables(cursor)
+        }
+        sessions = [info for info in sessions if info.name not in legacy]
+        sessions += [
+            SessionInfo(
+                name=table,
+                created_at=x[0],
+                updated_at=x[1],
+                message_count=x[2],
+                token_total=x[3],
+                preview=x[4],
+            )
+            for table, x in legacy.items()
+        ]
+        return sorted(sessions, key=lambda info: info.updated_at, reverse=True)
+
+    def set_retention(self, session_name: str, policy: Optional[RetentionPolicy]):
+        """
+        Stores the retention policy of a session.
+
+        Parameters
+        ----------
+        session_name : str
+            Session name.
+        policy : Optional[RetentionPolicy]
+            Retention policy, `None` uses the default one.
+        """
+        session_id = self.__session_id(session_name, restore=False)
+        if policy is None:
+            f = lambda cursor: cursor.execute(
+                "DELETE FROM retention WHERE session_id = ?;", (session_id,)
+            )
+        else:
+            f = lambda cursor: cursor.execute(
+                """
+                    INSERT OR REPLACE INTO retention (
+                        session_id, max_age_days, max_messages
+                        )
+                    VALUES (?, ?, ?);
+                    """,
+                (session_id, *policy),
+            )
+        self.__write_with_connection(f)
+
+    def get_retention(self, session_name: str) -> Optional[RetentionPolicy]:
+        """
+        Finds the retention policy of a session.
+
+        Parameters
+        ----------
+        session_name : str
+            Session name.
+
+        Returns
+        -------
+        Optional[RetentionPolicy]
+            Retention policy, `None` if the session uses the default one.
+        """
+        session_id = self.__session_id(session_name, restore=False)
+        f = lambda cursor: cursor.execute(
+            "SELECT max_age_days, max_messages FROM retention WHERE session_id = ?;",
+            (session_id,),
+        )
+        result = self.__read_with_connection(f)
+        return RetentionPolicy._make(result[0]) if result else None
+
+    def apply_retention(self, default: RetentionPolicy, now: int) -> int:
+        """
+        Deletes the messages that the retention policies don't keep. Sessions are filtered through
+        their first message and their message count, and each one is cleaned in its own transaction
+        so other statements don't wait for all of them.
+
+        Parameters
+        ----------
+        default : RetentionPolicy
+            Policy of the sessions without their own.
+        now : int
+            Current unix time.
+
+        Returns
+        -------
+        int
+            Number of deleted messages.
+        """
+        f = lambda cursor: cursor.execute(
+            """
+                SELECT
+                    id, max_age_days, max_messages
+                FROM (
+                    SELECT
+                        sessions.id,
+                        sessions.message_count,
+                        coalesce(retention.max_age_days, :age) AS max_age_days,
+                        coalesce(retention.max_messages, :keep) AS max_messages,
+                        (
+                            SELECT timestamp FROM messages
+                            WHERE session_id = sessions.id AND role IN ('user', 'assistant')
+                            ORDER BY id ASC LIMIT 1
+                        ) AS oldest
+                    FROM
+                        sessions
+                        LEFT JOIN retention ON retention.session_id = sessions.id
+                    WHERE
+                        sessions.id NOT IN (SELECT session_id FROM archives)
+                    )
+                WHERE
+                    (max_age_days > 0 AND oldest < :now - max_age_days * 86400)
+                    OR (max_messages > 0 AND message_count > max_messages)
+                ;
+                """,
+            {"age": default.max_age_days, "keep": default.max_messages, "now": now},
+        )
+        deleted = 0
+        for session_id, max_age_days, max_messages in self.__read_with_connection(f):
+            cursor = self.connection.cursor()
+            with self.__transaction():
+                # NOTE: the pending status is inlined so the partial index can be used.
+                cursor.execute(
+                    """
+                        DELETE FROM
+                            messages
+                        WHERE
+                            session_id = :session
+                            AND role IN ('user', 'assistant')
+                            AND (
+                                timestamp < :cutoff
+                                OR (:keep > 0 AND id <= coalesce((
+                                    SELECT id FROM messages
+                                    WHERE session_id = :session AND role IN ('user', 'assistant')
+                                    ORDER BY id DESC LIMIT 1 OFFSET :keep
+                                ), 0))
+                            )
+                            AND id NOT IN (
+                                SELECT message_id FROM requests
+                                WHERE session_id = :session AND status = 'pending'
+                            )
+                        ;
+                        """,
+                    {
+                        "session": session_id,
+                        "cutoff": now - max_age_days * 86400 if max_age_days > 0 else 0,
+                        "keep": max_messages,
+                    },
+                )
+                if cursor.rowcount <= 0:
+                    continue
+                deleted += cursor.rowcount
+                cursor.execute(
+                    """
+                        DELETE FROM
+                            requests
+                        WHERE
+                            session_id = :session
+                            AND message_id NOT IN (
+                                SELECT id FROM messages WHERE session_id = :session
+                            )
+                        ;
+                        """,
+                    {"session": session_id},
+                )
+                cursor.execute(
+                    """
+                        UPDATE
+                            sessions
+                        SET
+                            message_count = (
+                                SELECT count(*) FROM messages WHERE session_id = sessions.id
+                            ),
+                            token_total = coalesce((
+                                SELECT sum((length(content) + 3) / 4) FROM messages
+                                WHERE session_id = sessions.id
+                            ), 0)
+                        WHERE
+                            id = ?
+                        ;
+                        """,
+                    (session_id,),
+                )
+        return deleted
+
+    def vacuum_step(self, pages: int) -> int:
+        """
+        Releases free pages with `PRAGMA incremental_vacuum`, a full `VACUUM` also converts the
+        databases that were created before `auto_vacuum` was enabled.
+
+        Parameters
+        ----------
+        pages : int
+            Maximum number of pages to release, 0 runs a full `VACUUM`.
+
+        Returns
+        -------
+        int
+            Number of free pages that remain, -1 if the database must be rebuilt with a full
+            `VACUUM` before they can be released incrementally.
+        """
+        if pages <= 0:
+            self.connection.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+            self.connection.execute("VACUUM;")
+        else:
+            # NOTE: each step of the statement releases a page, `execute` would only step it once.
+            self.connection.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+        # NOTE: with write-ahead logging the file only shrinks once the log is checkpointed.
+        self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+        if self.connection.execute("PRAGMA auto_vacuum;").fetchone()[0] != 2:
+            return -1
+        return self.connection.execute("PRAGMA freelist_count;").fetchone()[0]
+
+    def optimize(self):
+        """
+        Gathers the planner statistics with a bounded `ANALYZE` the first time, and refreshes the
+        stale ones with `PRAGMA optimize` afterwards.
+        """
+        analyzed = self.__read_with_connection(
+            lambda cursor: cursor.execute(
+                "SELECT 1 FROM sqlite_schema WHERE name = 'sqlite_stat1';"
+            )
+        )
+        self.connection.execute("PRAGMA analysis_limit = 1000;")
+        self.connection.execute("PRAGMA optimize;" if analyzed else "ANALYZE;")
+
+    def get_inactive_sessions(self, before: int) -> List[str]:
+        """
+        Lists the sessions that can be archived.
+
+        Parameters
+        ----------
+        before : int
+            Unix time of the last update.
+
+        Returns
+        -------
+        List[str]
+            Session names, the least recently updated first.
+        """
+        # NOTE: the pending status is inlined so the partial index can be used.
+        f = lambda cursor: cursor.execute(
+            """
+                SELECT
+                    name
+                FROM
+                    sessions
+                WHERE
+                    updated_at < ?
+                    AND message_count > 0
+                    AND id NOT IN (SELECT session_id FROM archives)
+                    AND id NOT IN (SELECT session_id FROM requests WHERE status = 'pending')
+                ORDER BY
+                    updated_at ASC
+                ;
+                """,
+            (before,),
+        )
+        return [x[0] for x in self.__read_with_connection(f)]
+
+    def archive_session(self, session_name: str) -> int:
+        """
+        Writes the messages of a session into a gzip compressed file of the archive folder, and
+        deletes them along with their finished requests. Messages that arrive while the file is
+        written stay in the database.
+
+        Parameters
+        ----------
+        session_name : str
+            Session name.
+
+        Returns
+        -------
+        int
+            Number of archived messages.
+        """
+        session_id = self.__session_id(session_name, restore=False)
+        archived = self.__read_with_connection(
+            lambda cursor: cursor.execute(
+                "SELECT 1 FROM archives WHERE session_id = ?;", (session_id,)
+            )
+        )
+        if archived:
+            return 0
+        archive = f"{session_id}{ARCHIVE_SUFFIX}"
+        last_id = 0
+
+        def rows() -> Iterator[ArchivedMessage]:
+            nonlocal last_id
+            cursor = self.connection.execute(
+                """
+                    SELECT
+                        id, role, content, timestamp, parent_id, remote_id
+                    FROM
+                        messages
+                    WHERE
+                        session_id = ?
+                    ORDER BY
+                        id ASC
+                    ;
+                    """,
+                (session_id,),
+            )
+            for row in cursor:
+                last_id = row[0]
+                yield ArchivedMessage._make(row)
+
+        total = write_archive(self.archive_path / archive, rows())
+        if total == 0:
+            (self.archive_path / archive).unlink(missing_ok=True)
+            return 0
+        with self.__transaction():
+            self.connection.execute(
+                """
+                    DELETE FROM
+                        requests
+                    WHERE
+                        session_id = ? AND message_id <= ? AND status != 'pending'
+                    ;
+                    """,
+                (session_id, last_id),
+            )
+            self.connection.execute(
+                "DELETE FROM messages WHERE session_id = ? AND id <= ?;",
+                (session_id, last_id),
+            )
+            self.connection.execute(
+                """
+                    INSERT INTO archives (
+                        session_id, path, message_count, archived_at
+                        )
+                    VALUES (?, ?, ?, ?);
+                    """,
+                (session_id, archive, total, int(time.time())),
+            )
+        self.__session_ids.pop(session_name, None)
+        return total
+
+    def restore_session(self, session_name: str) -> int:
+        """
+        Moves the messages of an archived session back to sqlite.
+
+        Parameters
+        ----------
+        session_name : str
+            Session name.
+
+        Returns
+        -------
+        int
+            Number of restored messages, 0 if the session wasn't archived.
+        """
+        session_id = self.__session_id(session_name, restore=False)
+        result = self.__read_with_connection(
+            lambda cursor: cursor.execute(
+                "SELECT path FROM archives WHERE session_id = ?;", (session_id,)
+            )
+        )
+        return self.__restore(session_id, result[0][0]) if result else 0
+
+    def get_data_version(self) -> int:
+        """
+        Reads `PRAGMA data_version`, which only changes when other connections commit.
+
+        Returns
+        -------
+        int
+            Data version of this connection.
+        """
+        return self.connection.execute("PRAGMA data_version;").fetchone()[0]
+
+    def get_last_message_id(self) -> int:
+        """
+        Finds the identifier of the last stored message, it's read from the end of the rowid tree.
+
+        Returns
+        -------
+        int
+            Message identifier, 0 if there are no messages.
+        """
+        f = lambda cursor: cursor.execute("SELECT coalesce(max(id), 0) FROM messages;")
+        return self.__read_with_connection(f)[0][0]
+
+    def get_lock_stats(self) -> LockStats:
+        """
+        Summarizes the waits of this connection for the write lock.
+
+        Returns
+        -------
+        LockStats
+            Lock waits since the connection was opened.
+        """
+        return self.__lock_stats
+
+    def get_usage(self, group: UsageGroupEnum, since: int = 0) -> List[UsageRow]:
+        """
+        Aggregates the usage metrics in a single query, the time filter uses the timestamp index.
+
+        Parameters
+        ----------
+        group : UsageGroupEnum
+            How the answers are grouped.
+        since : int
+            Unix time of the oldest answer to include.
+
+        Returns
+        -------
+        List[UsageRow]
+            Usage of each group, the most tokens first.
+        """
+        f = lambda cursor: cursor.execute(
+            f"""
+                SELECT
+                    {_USAGE_KEYS[group]},
+                    count(*),
+                    sum(metrics.prompt_tokens),
+                    sum(metrics.completion_tokens),
+                    max(metrics.prompt_tokens),
+                    sum(metrics.estimated)
+                FROM
+                    metrics
+                    JOIN sessions ON sessions.id = metrics.session_id
+                WHERE
+                    metrics.timestamp >= ?
+                GROUP BY
+                    1
+                ORDER BY
+                    sum(metrics.prompt_tokens) + sum(metrics.completion_tokens) DESC, 1 ASC
+                ;
+                """,
+            (since,),
+        )
+        return list(map(UsageRow._make, self.__read_with_connection(f)))
+
+    def get_latencies(
+        self, group: UsageGroupEnum, since: int = 0
+    ) -> List[Tuple[str, float]]:
+        """
+        Lists the latency of every answer along with its group.
+
+        Parameters
+        ----------
+        group : UsageGroupEnum
+            How the answers are grouped.
+        since : int
+            Unix time of the oldest answer to include.
+
+        Returns
+        -------
+        List[Tuple[str, float]]
+            Group and latency in milliseconds.
+        """
+        f = lambda cursor: cursor.execute(
+            f"""
+                SELECT
+                    {_USAGE_KEYS[group]}, metrics.latency_ms
+                FROM
+                    metrics
+                    JOIN sessions ON sessions.id = metrics.session_id
+                WHERE
+                    metrics.timestamp >= ?
+                ;
+                """,
+            (since,),
+        )
+        return self.__read_with_connection(f)
+
     def close(self):
         """
         Closes the connection with the database.
@@ -0,0 +1,227 @@
+"""
+This module allows exporting and importing sessions between databases.
+"""
+from enum import Enum
+from itertools import groupby
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List
+from gpttui.database.base import AbstractDB, Message, MessageWithTime
+from gpttui.codec import dumps, loads
+
+
+class TransferFormatsEnum(Enum):
+    """
+    Enum that specifies the supported export formats.
+    """
+
+    JSONL = "JSONL"
+    PARQUET = "PARQUET"
+
+
+def _import_pyarrow() -> Any:
+    """
+    Imports the optional parquet dependencies.
+
+    Returns
+    -------
+    Any
+        The `pyarrow.parquet` module.
+    """
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError(
+            "Could not import parquet dependencies, please install it with:\n\tpip install gpttui[parquet]"
+        )
+    return pq
+
+
+def _iter_rows(
+    db: AbstractDB, sessions: Iterable[str], batch_size: int
+) -> Iterator[Dict[str, Any]]:
+    """
+    Streams the rows of the given sessions.
+
+    Parameters
+    ----------
+    db : AbstractDB
+        Database to read from.
+    sessions : Iterable[str]
+        Sessions to export.
+    batch_size : int
+        Number of rows fetched from the database at once.
+
+    Yields
+    ------
+    Dict[str, Any]
+        A flat row with the session name and the message.
+    """
+    for session in sessions:
+        for msg in db.iter_messages(session_name=session, batch_size=batch_size):
+            yield {
+                "session": session,
+                "role": msg.message.role,
+                "content": msg.message.content,
+                "timestamp": msg.timestamp,
+            }
+
+
+def _load_rows(db: AbstractDB, rows: Iterable[Dict[str, Any]]) -> int:
+    """
+    Stores a stream of flat rows, one bulk insert per consecutive session.
+
+    Parameters
+    ----------
+    db : AbstractDB
+        Database to write into.
+    rows : Iterable[Dict[str, Any]]
+        Flat rows with the session name and the message.
+
+    Returns
+    -------
+    int
+        Number of imported messages.
+    """
+    total = 0
+    for session, group in groupby(rows, key=lambda row: row["session"]):
+        db.create_session(session_name=session)
+        # NOTE: fields are coerced explicitly instead of validating a model per row.
+        msgs = (
+            MessageWithTime.construct(
+                message=Message.construct(
+                    role=str(row["role"]), content=str(row["content"])
+                ),
+                timestamp=int(row["timestamp"]),
+            )
+            for row in group
+        )
+        total += db.add_messages(msgs=msgs, session_name=session)
+    return total
+
+
+def export_jsonl(
+    db: AbstractDB, sessions: Iterable[str], path: Path, batch_size: int = 1000
+) -> int:
+    """
+    Exports sessions into a JSON lines file.
+
+    Parameters
+    ----------
+    db : AbstractDB
+        Database to read from.
+    sessions : Iterable[str]
+        Sessions to export.
+    path : Path
+        Output file.
+    batch_size : int
+        Number of rows fetched from the database at once.
+
+    Returns
+    -------
+    int
+        Number of exported messages.
+    """
+    total = 0
+    with open(path, "wb") as f:
+        for row in _iter_rows(db, sessions, batch_size):
+            f.write(dumps(row))
+            f.write(b"\n")
+            total += 1
+    return total
+
+
+def import_jsonl(db: AbstractDB, path: Path) -> int:
+    """
+    Imports sessions from a JSON lines file.
+
+    Parameters
+    ----------
+    db : AbstractDB
+        Database to write into.
+    path : Path
+        Input file.
+
+    Returns
+    -------
+    int
+        Number of imported messages.
+    """
+    with open(path, "rb") as f:
+        rows = (loads(line) for line in f if line.strip())
+        return _load_rows(db, rows)
+
+
+def export_parquet(
+    db: AbstractDB, sessions: Iterable[str], path: Path, batch_size: int = 1000
+) -> int:
+    """
+    Exports sessions into a parquet file, writing one row group per batch.
+
+    Parameters
+    ----------
+    db : AbstractDB
+        Database to read from.
+    sessions : Iterable[str]
+        Sessions to export.
+    path : Path
+        Output file.
+    batch_size : int
+        Number of rows per row group.
+
+    Returns
+    -------
+    int
+        Number of exported messages.
+    """
+    pq = _import_pyarrow()
+    import pyarrow as pa
+
+    schema = pa.schema(
+        [
+            ("session", pa.string()),
+            ("role", pa.string()),
+            ("content", pa.string()),
+            ("timestamp", pa.int64()),
+        ]
+    )
+    total = 0
+    batch: List[Dict[str, Any]] = []
+    with pq.ParquetWriter(str(path), schema) as writer:
+        for row in _iter_rows(db, sessions, batch_size):
+            batch.append(row)
+            if len(batch) == batch_size:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                total += len(batch)
+                batch = []
+        if batch:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            total += len(batch)
+    return total
+
+
+def import_parquet(db: AbstractDB, path: Path, batch_size: int = 1000) -> int:
+    """
+    Imports sessions from a parquet file, reading it in batches.
+
+    Parameters
+    ----------
+    db : AbstractDB
+        Database to write into.
+    path : Path
+        Input file.
+    batch_size : int
+        Number of rows read at once.
+
+    Returns
+    -------
+    int
+        Number of imported messages.
+    """
+    pq = _import_pyarrow()
+    parquet_file = pq.ParquetFile(str(path))
+    rows = (
+        row
+        for batch in parquet_file.iter_batches(batch_size=batch_size)
+        for row in batch.to_pylist()
+    )
+    return _load_rows(db, rows)
@@ -0,0 +1,107 @@
+"""
+This module aggregates the usage metrics that are stored with every answer, the latency percentiles of
+all the groups are computed at once with numpy.
+"""
+try:
+    import numpy as np
+except ImportError:
+    raise ImportError(
+        "Could not import stats dependencies, please install it with:\n\tpip install gpttui[stats]"
+    )
+from gpttui.database.base import AbstractDB, UsageGroupEnum, UsageRow
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+
+class UsageStats(NamedTuple):
+    """
+    Usage of a group of answers and their latency.
+
+    Attributes
+    ----------
+    usage : UsageRow
+        Aggregated tokens.
+    latencies_ms : Tuple[float, ...]
+        Latency percentiles, in the requested order.
+    """
+
+    usage: UsageRow
+    latencies_ms: Tuple[float, ...]
+
+
+def grouped_percentiles(
+    rows: Sequence[Tuple[str, float]], percentiles: Sequence[float]
+) -> Dict[str, np.ndarray]:
+    """
+    Percentiles with linear interpolation of the values of each group, the values are sorted once
+    and every percentile of every group is read with a single fancy index.
+
+    Parameters
+    ----------
+    rows : Sequence[Tuple[str, float]]
+        Group and value.
+    percentiles : Sequence[float]
+        Percentiles between 0 and 100.
+
+    Returns
+    -------
+    Dict[str, np.ndarray]
+        Percentiles of each group.
+
+    Raises
+    ------
+    ValueError
+        If a percentile is outside of 0 and 100.
+    """
+    invalid = [q for q in percentiles if not 0 <= q <= 100]
+    if invalid:
+        raise ValueError(f"Percentiles must be between 0 and 100, got {invalid}.")
+    if not rows:
+        return {}
+    keys, values = zip(*rows)
+    groups, inverse = np.unique(np.asarray(keys), return_inverse=True)
+    values = np.asarray(values, dtype=np.float64)
+    order = np.lexsort((values, inverse))
+    values = values[order]
+    counts = np.bincount(inverse, minlength=len(groups))
+    starts = np.cumsum(counts) - counts
+    positions = (counts[:, None] - 1) * np.asarray(percentiles, dtype=np.float64) / 100
+    low = np.floor(positions).astype(np.int64)
+    high = np.minimum(low + 1, counts[:, None] - 1)
+    lower = values[starts[:, None] + low]
+    upper = values[starts[:, None] + high]
+    result = lower + (upper - lower) * (positions - low)
+    return {str(group): result[i] for i, group in enumerate(groups)}
+
+
+def usage_stats(
+    database: AbstractDB,
+    group: UsageGroupEnum,
+    since: int = 0,
+    percentiles: Sequence[float] = (50, 90, 99),
+) -> List[UsageStats]:
+    """
+    Aggregates the tokens in the database and the latency percentiles here.
+
+    Parameters
+    ----------
+    database : AbstractDB
+        Database with the metrics.
+    group : UsageGroupEnum
+        How the answers are grouped.
+    since : int
+        Unix time of the oldest answer to include.
+    percentiles : Sequence[float]
+        Latency percentiles between 0 and 100.
+
+    Returns
+    -------
+    List[UsageStats]
+        Usage of each group, the most tokens first.
+    """
+    latencies = grouped_percentiles(
+        database.get_latencies(group, since=since), percentiles
+    )
+    return [
+        UsageStats(usage=row, latencies_ms=tuple(latencies[row.key].tolist()))
+        for row in database.get_usage(group, since=since)
+    ]
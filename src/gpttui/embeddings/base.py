@@ -0,0 +1,78 @@
+"""
+This module defines the general classes required to integrate different embedding models.
+"""
+from abc import ABC, abstractmethod
+from enum import Enum
+from pydantic import BaseModel
+from typing import TYPE_CHECKING, List
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+class EmbeddersEnum(Enum):
+    """
+    This enum defines the available embedding models.
+    """
+
+    HASHING = "HASHING"
+    OPENAI = "OPENAI"
+
+
+class AbstractEmbedder(ABC):
+    """
+    This abstract class defines any model that turns texts into vectors.
+
+    Attributes
+    ----------
+    config : BaseModel
+        Embedder's configuration, it must have a `dim` field.
+    """
+
+    config: BaseModel
+
+    @property
+    def name(self) -> str:
+        """
+        Identifies the vector space of the embedder, vectors of different spaces can't be compared.
+
+        Returns
+        -------
+        str
+            Embedder name and dimension.
+        """
+        return f"{type(self).__name__.lower()}-{self.config.dim}"
+
+    @abstractmethod
+    def setup(self, config: BaseModel) -> "AbstractEmbedder":
+        """
+        This method is used to setup any embedder.
+
+        Parameters
+        ----------
+        config : BaseModel
+            Dataclass with the embedder's config options.
+
+        Returns
+        -------
+        AbstractEmbedder
+            Instance of the embedder to use as a builder.
+        """
+        ...
+
+    @abstractmethod
+    async def embed(self, texts: List[str]) -> "np.ndarray":
+        """
+        Computes the vectors of several texts.
+
+        Parameters
+        ----------
+        texts : List[str]
+            Input texts.
+
+        Returns
+        -------
+        np.ndarray
+            `float32` matrix with one L2 normalized row per text.
+        """
+        ...
@@ -0,0 +1,89 @@
+"""
+This module contains a local embedder that runs on the CPU without any model weights.
+"""
+import re, zlib
+from pydantic import BaseModel
+from gpttui.embeddings.base import AbstractEmbedder
+from gpttui.embeddings.vectors import normalize, np
+from typing import List
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class HashingConf(BaseModel):
+    """
+    Dataclass to setup the hashing embedder.
+    """
+
+    dim: int = 128
+    bigrams: bool = True
+
+
+class HashingEmbedder(AbstractEmbedder):
+    """
+    Embeds texts by hashing their words (and pairs of words) into a fixed number of signed buckets,
+    it finds messages that share vocabulary, not meaning.
+    """
+
+    config: HashingConf
+
+    def setup(self, config: HashingConf) -> "HashingEmbedder":
+        """
+        Sets the configuration.
+
+        Parameters
+        ----------
+        config : HashingConf
+            Embedder's configuration.
+
+        Returns
+        -------
+        HashingEmbedder
+            Instance of the embedder to use as a builder.
+        """
+        self.config = config
+        return self
+
+    def features(self, text: str) -> List[str]:
+        """
+        Extracts the hashed features of a text.
+
+        Parameters
+        ----------
+        text : str
+            Input text.
+
+        Returns
+        -------
+        List[str]
+            Words, and pairs of consecutive words if enabled.
+        """
+        words = TOKEN_PATTERN.findall(text.lower())
+        if self.config.bigrams:
+            return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        return words
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Computes the vectors of several texts.
+
+        Parameters
+        ----------
+        texts : List[str]
+            Input texts.
+
+        Returns
+        -------
+        np.ndarray
+            `float32` matrix with one L2 normalized row per text.
+        """
+        rows, cols, signs = [], [], []
+        for i, text in enumerate(texts):
+            for feature in self.features(text):
+                h = zlib.crc32(feature.encode())
+                rows.append(i)
+                cols.append(h % self.config.dim)
+                signs.append(1.0 if h & 0x80000000 else -1.0)
+        vectors = np.zeros((len(texts), self.config.dim), dtype=np.float32)
+        np.add.at(vectors, (rows, cols), signs)
+        return normalize(vectors)
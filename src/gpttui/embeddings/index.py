@@ -0,0 +1,190 @@
+"""
+This module defines the on-disk index of message vectors, two append-only files that are memory
+mapped and searched with a single matrix-vector product.
+"""
+import os, zlib
+from pathlib import Path
+from gpttui.embeddings.vectors import np
+from typing import List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+def session_key(session_name: str) -> int:
+    """
+    Stable numeric key of a session, it lets searches skip a session without joining names.
+
+    Parameters
+    ----------
+    session_name : str
+        Session name.
+
+    Returns
+    -------
+    int
+        Session key.
+    """
+    return zlib.crc32(session_name.encode())
+
+
+class EmbeddingIndex:
+    """
+    Index of message vectors stored next to the database: `<path>.<space>.f32` holds one `float32`
+    row per message and `<path>.<space>.ids` the `int64` message id and session key of each row.
+
+    Parameters
+    ----------
+    path : Path
+        Prefix of the index files.
+    space : str
+        Name of the embedder's vector space, each space has its own files.
+    dim : int
+        Dimension of the vectors.
+    """
+
+    def __init__(self, path: Path, space: str, dim: int):
+        self.vectors_path = path.with_name(f"{path.name}.{space}.f32")
+        self.ids_path = path.with_name(f"{path.name}.{space}.ids")
+        self.lock_path = path.with_name(f"{path.name}.{space}.lock")
+        self.dim = dim
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.ids = np.zeros((0, 2), dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def stored_rows(self) -> int:
+        """
+        Number of complete rows in both files, a row written only partially is ignored.
+
+        Returns
+        -------
+        int
+            Number of rows.
+        """
+        if not self.vectors_path.exists() or not self.ids_path.exists():
+            return 0
+        return min(
+            self.vectors_path.stat().st_size // (4 * self.dim),
+            self.ids_path.stat().st_size // 16,
+        )
+
+    def load(self) -> "EmbeddingIndex":
+        """
+        Maps the files into memory again if other writers appended rows.
+
+        Returns
+        -------
+        EmbeddingIndex
+            Loaded index.
+        """
+        n = self.stored_rows()
+        if n != len(self) and n > 0:
+            self.vectors = np.memmap(
+                self.vectors_path, dtype=np.float32, mode="r", shape=(n, self.dim)
+            )
+            self.ids = np.memmap(self.ids_path, dtype=np.int64, mode="r", shape=(n, 2))
+        return self
+
+    def last_id(self) -> int:
+        """
+        Identifier of the last indexed message.
+
+        Returns
+        -------
+        int
+            Message identifier, 0 if the index is empty.
+        """
+        self.load()
+        return int(self.ids[-1, 0]) if len(self) else 0
+
+    def try_lock(self) -> Optional[int]:
+        """
+        Takes the writer lock without waiting, so a single process updates the index.
+
+        Returns
+        -------
+        Optional[int]
+            Descriptor of the lock, `None` if another process holds it.
+        """
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        if fcntl is None:
+            return fd
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+
+    @staticmethod
+    def unlock(fd: int) -> None:
+        """
+        Releases the writer lock.
+
+        Parameters
+        ----------
+        fd : int
+            Descriptor of the lock.
+        """
+        os.close(fd)
+
+    def append(self, ids: List[int], keys: List[int], vectors: np.ndarray) -> None:
+        """
+        Appends rows to the index, the caller must hold the writer lock.
+
+        Parameters
+        ----------
+        ids : List[int]
+            Message identifiers.
+        keys : List[int]
+            Session keys.
+        vectors : np.ndarray
+            Normalized vectors.
+        """
+        n = self.stored_rows()
+        # NOTE: drop the tail of an interrupted append, so both files stay aligned.
+        for path, row_size in ((self.vectors_path, 4 * self.dim), (self.ids_path, 16)):
+            with open(path, "ab") as f:
+                f.truncate(n * row_size)
+        with open(self.vectors_path, "ab") as f:
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        with open(self.ids_path, "ab") as f:
+            f.write(np.column_stack([ids, keys]).astype(np.int64).tobytes())
+        self.load()
+
+    def search(
+        self, query: np.ndarray, k: int, exclude_key: Optional[int] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Finds the messages most similar to a query.
+
+        Parameters
+        ----------
+        query : np.ndarray
+            Normalized query vector.
+        k : int
+            Number of results.
+        exclude_key : Optional[int]
+            Session whose messages are skipped, usually the current one.
+
+        Returns
+        -------
+        List[Tuple[int, float]]
+            Message identifiers and cosine similarities, the most similar first.
+        """
+        self.load()
+        if not len(self) or k <= 0:
+            return []
+        scores = self.vectors @ np.asarray(query, dtype=np.float32)
+        if exclude_key is not None:
+            scores[self.ids[:, 1] == exclude_key] = -np.inf
+        k = min(k, len(scores))
+        top = np.argpartition(scores, -k)[-k:]
+        top = top[np.argsort(scores[top])[::-1]]
+        return [
+            (int(self.ids[i, 0]), float(scores[i])) for i in top if scores[i] > -np.inf
+        ]
@@ -0,0 +1,83 @@
+"""
+This module contains the integration with OpenAI embedding models.
+"""
+import httpx
+from pydantic import BaseModel
+from gpttui.codec import dumps, loads
+from gpttui.embeddings.base import AbstractEmbedder
+from gpttui.embeddings.vectors import normalize, np
+from typing import List
+
+
+class OpenAIEmbeddingConf(BaseModel):
+    """
+    Dataclass to setup OpenAI embedding models.
+    """
+
+    timeout: int = 30
+    model_name: str = "text-embedding-3-small"
+    dim: int = 256
+    organization: str = ""
+    api_key: str = ""
+    base_url: str = "https://api.openai.com/v1"
+
+
+class OpenAIEmbedder(AbstractEmbedder):
+    """
+    This class computes embeddings with any openai embedding model through its API.
+    """
+
+    config: OpenAIEmbeddingConf
+
+    def setup(self, config: OpenAIEmbeddingConf) -> "OpenAIEmbedder":
+        """
+        Sets the configuration and the credentials for OpenAI.
+
+        Parameters
+        ----------
+        config : OpenAIEmbeddingConf
+            Embedder's configuration.
+
+        Returns
+        -------
+        OpenAIEmbedder
+            Instance of the embedder to use as a builder.
+        """
+        self.config = config
+        return self
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Computes the vectors of several texts in a single request.
+
+        Parameters
+        ----------
+        texts : List[str]
+            Input texts.
+
+        Returns
+        -------
+        np.ndarray
+            `float32` matrix with one L2 normalized row per text.
+        """
+        headers = {
+            "Authorization": f"Bearer {self.config.api_key}",
+            "Content-Type": "application/json",
+        }
+        if self.config.organization:
+            headers["OpenAI-Organization"] = self.config.organization
+        body = {
+            "model": self.config.model_name,
+            "input": texts,
+            "dimensions": self.config.dim,
+        }
+        async with httpx.AsyncClient() as client:
+            r = await client.post(
+                f"{self.config.base_url}/embeddings",
+                content=dumps(body),
+                headers=headers,
+                timeout=self.config.timeout,
+            )
+        r.raise_for_status()
+        data = sorted(loads(r.content)["data"], key=lambda item: item["index"])
+        return normalize([item["embedding"] for item in data])
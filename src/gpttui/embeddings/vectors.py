@@ -0,0 +1,28 @@
+"""
+This module contains the helpers shared by the embedders and the index.
+"""
+try:
+    import numpy as np
+except ImportError:
+    raise ImportError(
+        "Could not import recall dependencies, please install it with:\n\tpip install gpttui[recall]"
+    )
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """
+    Scales the rows of a matrix to unit length, so dot products are cosine similarities.
+
+    Parameters
+    ----------
+    vectors : np.ndarray
+        Input matrix.
+
+    Returns
+    -------
+    np.ndarray
+        `float32` matrix, zero rows are kept.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, np.finfo(np.float32).tiny)
@@ -3,9 +3,52 @@ This module defines the general classes required to integrate different models.
 """
 import time
 from abc import ABC, abstractmethod
+from contextvars import ContextVar
 from pydantic import BaseModel
-from gpttui.database.base import AbstractDB, Messages, Message, MessageWithTime
+from gpttui.database.base import (
+    AbstractDB,
+    Messages,
+    Message,
+    MessageRecord,
+    MessageWithTime,
+    TurnMetric,
+    SUMMARY_ROLE,
+    approximate_tokens,
+)
+from gpttui.models.compaction import Compactor
 from enum import Enum
+from typing import TYPE_CHECKING, AsyncIterator, Callable, NamedTuple, Optional, Tuple
+
+if TYPE_CHECKING:
+    from gpttui.models.recall import Retriever
+
+
+class StateMismatch(Exception):
+    """
+    Raised when a model's server doesn't know the state that a stateful request refers to.
+    """
+
+    ...
+
+
+class Usage(NamedTuple):
+    """
+    Tokens that a model's server reported for an answer.
+
+    Attributes
+    ----------
+    prompt_tokens : int
+        Tokens sent to the model.
+    completion_tokens : int
+        Tokens of the answer.
+    """
+
+    prompt_tokens: int
+    completion_tokens: int
+
+
+# NOTE: each task has its own value, so background summaries don't mix with the answer's usage.
+USAGE: ContextVar[Optional[Usage]] = ContextVar("usage", default=None)
 
 
 class ModelsEnum(Enum):
@@ -16,6 +59,7 @@ class ModelsEnum(Enum):
     OPENAI = "OPENAI"
     CHATSONIC = "CHATSONIC"
     COLOSSAL = "COLOSSAL"
+    LOCAL = "LOCAL"
 
 
 class AbstractModel(ABC):
@@ -32,12 +76,18 @@ class AbstractModel(ABC):
         Context given to the model.
     database : AbstractDB
         Database to store the messages.
+    compactor : Optional[Compactor]
+        Background job that summarizes old messages.
+    retriever : Optional[Retriever]
+        Recalls relevant messages from other sessions.
     """
 
     config: BaseModel
     session_name: str
     context: str
     database: AbstractDB
+    compactor: Optional[Compactor] = None
+    retriever: Optional["Retriever"] = None
 
     def add_context(self, context: str) -> "AbstractModel":
         """
@@ -56,9 +106,44 @@ class AbstractModel(ABC):
         self.context = context
         return self
 
+    def add_compactor(self, compactor: Compactor) -> "AbstractModel":
+        """
+        Sets the job that summarizes old messages.
+
+        Parameters
+        ----------
+        compactor : Compactor
+            Compaction job.
+
+        Returns
+        -------
+        AbstractModel
+            Instance of the model to use as a builder.
+        """
+        self.compactor = compactor
+        return self
+
+    def add_retriever(self, retriever: "Retriever") -> "AbstractModel":
+        """
+        Sets the retrieval of relevant messages from other sessions.
+
+        Parameters
+        ----------
+        retriever : Retriever
+            Retrieval job.
+
+        Returns
+        -------
+        AbstractModel
+            Instance of the model to use as a builder.
+        """
+        self.retriever = retriever
+        return self
+
     def last_messages(self) -> Messages:
         """
-        Extracts the most recent messages from the database.
+        Extracts the most recent messages from the database, old messages are replaced by their
+        summary.
 
         Returns
         -------
@@ -66,7 +151,7 @@ class AbstractModel(ABC):
             Most recent messages.
         """
         self.database.create_session(session_name=self.session_name)
-        last_msgs = self.database.get_messages(session_name=self.session_name)
+        last_msgs = self.database.get_recent_messages(session_name=self.session_name)
         if not len(last_msgs.values):
             msg = MessageWithTime(
                 message=Message(role="system", content=self.context),
@@ -74,6 +159,11 @@ class AbstractModel(ABC):
             )
             self.database.add_message(msg=msg, session_name=self.session_name)
             return self.last_messages()
+        for i, msg in enumerate(last_msgs.values):
+            if msg.role == SUMMARY_ROLE:
+                last_msgs.values[i] = MessageRecord(
+                    "system", f"Summary of the previous conversation:\n{msg.content}"
+                )
         return last_msgs
 
     @abstractmethod
@@ -100,18 +190,254 @@ class AbstractModel(ABC):
         ...
 
     @abstractmethod
-    async def get_answer(self, message: str) -> str:
+    async def generate(self, msgs: Messages) -> str:
+        """
+        Generates an answer for a conversation without storing anything, models whose server
+        reports the tokens set `USAGE`.
+
+        Parameters
+        ----------
+        msgs : Messages
+            Conversation, the last message is the one to answer.
+
+        Returns
+        -------
+        str
+            Response.
+        """
+        ...
+
+    async def stream(self, msgs: Messages) -> AsyncIterator[str]:
+        """
+        Generates an answer piece by piece, models that can't stream yield it at once.
+
+        Parameters
+        ----------
+        msgs : Messages
+            Conversation, the last message is the one to answer.
+
+        Yields
+        ------
+        str
+            Piece of the response.
+        """
+        yield await self.generate(msgs)
+
+    async def close(self) -> None:
+        """
+        Releases the resources of the model, like its connections.
         """
-        Generates an answer given an input message.
+        ...
+
+    def backend(self) -> str:
+        """
+        Identifies the model in the usage metrics.
+
+        Returns
+        -------
+        str
+            Backend name.
+        """
+        return type(self).__name__
+
+    def measure(
+        self, msgs: Optional[Messages], response: str, started: float
+    ) -> TurnMetric:
+        """
+        Measures an answer, the tokens are approximated if the server didn't report them through
+        `USAGE`.
+
+        Parameters
+        ----------
+        msgs : Optional[Messages]
+            Messages sent to the model, `None` if only the server knows them.
+        response : str
+            Answer.
+        started : float
+            `time.perf_counter` value when the generation started.
+
+        Returns
+        -------
+        TurnMetric
+            Measurements of the answer.
+        """
+        latency_ms = (time.perf_counter() - started) * 1000
+        usage = USAGE.get()
+        if usage is not None:
+            return TurnMetric(
+                self.backend(), int(time.time()), latency_ms, *usage, False
+            )
+        prompt_tokens = (
+            sum(approximate_tokens(msg.content) for msg in msgs)
+            if msgs is not None
+            else 0
+        )
+        return TurnMetric(
+            self.backend(),
+            int(time.time()),
+            latency_ms,
+            prompt_tokens,
+            approximate_tokens(response),
+            True,
+        )
+
+    def is_stateful(self) -> bool:
+        """
+        Whether the model's server keeps the conversation, so only new messages must be sent.
+
+        Returns
+        -------
+        bool
+            `True` if `generate_stateful` must be used.
+        """
+        return False
+
+    async def generate_stateful(
+        self, msgs: Messages, remote_id: Optional[str]
+    ) -> Tuple[str, Optional[str]]:
+        """
+        Generates an answer continuing a conversation that the server already knows.
+
+        Parameters
+        ----------
+        msgs : Messages
+            Messages that the server hasn't seen, or the whole conversation if `remote_id` is `None`.
+        remote_id : Optional[str]
+            Server identifier of the last known message.
+
+        Returns
+        -------
+        Tuple[str, Optional[str]]
+            Response and its server identifier.
+
+        Raises
+        ------
+        StateMismatch
+            If the server doesn't know `remote_id`.
+        """
+        raise NotImplementedError(f"{type(self).__name__} isn't stateful.")
+
+    async def generate_delta(self) -> Tuple[str, Optional[str]]:
+        """
+        Sends the messages that the server hasn't seen, or the whole conversation if its state is
+        unknown.
+
+        Returns
+        -------
+        Tuple[str, Optional[str]]
+            Response and its server identifier.
+        """
+        remote_id, seen_id = self.database.get_remote_state(self.session_name)
+        if remote_id is not None:
+            delta = self.database.get_messages_after(self.session_name, seen_id)
+            try:
+                return await self.generate_stateful(delta, remote_id)
+            except StateMismatch:
+                ...
+        return await self.generate_stateful(self.last_messages(), None)
+
+    async def get_answer(
+        self, message: str, on_text: Optional[Callable[[str], None]] = None
+    ) -> str:
+        """
+        Generates an answer given an input message, both are stored in the session. The turn is
+        queued in the database first, so it can be resumed if it's interrupted.
 
         Parameters
         ----------
         message : str
             Input text.
+        on_text : Optional[Callable[[str], None]]
+            Receives the pieces of the answer as they're generated.
 
         Returns
         -------
         str
             Response.
         """
-        ...
+        self.last_messages()
+        new_msg = MessageWithTime(
+            message=Message(role="user", content=message), timestamp=int(time.time())
+        )
+        request_id = self.database.enqueue_request(
+            msg=new_msg, session_name=self.session_name
+        )
+        return await self.answer_request(request_id, on_text)
+
+    async def answer_request(
+        self, request_id: int, on_text: Optional[Callable[[str], None]] = None
+    ) -> str:
+        """
+        Answers a queued request, its user message must be the last one of the session. The answer
+        is stored and the request completed in a single transaction.
+
+        Parameters
+        ----------
+        request_id : int
+            Request identifier.
+        on_text : Optional[Callable[[str], None]]
+            Receives the pieces of the answer as they're generated.
+
+        Returns
+        -------
+        str
+            Response.
+        """
+        n_messages = 0
+        USAGE.set(None)
+        if self.is_stateful():
+            started = time.perf_counter()
+            response, remote_id = await self.generate_delta()
+            metric = self.measure(None, response, started)
+            if on_text is not None:
+                on_text(response)
+        else:
+            last_msgs = self.last_messages()
+            n_messages = len(last_msgs.values) + 1
+            if self.retriever is not None:
+                last_msgs = await self.retriever.recall(self, last_msgs)
+            started = time.perf_counter()
+            if on_text is None:
+                response = await self.generate(last_msgs)
+            else:
+                pieces = []
+                async for text in self.stream(last_msgs):
+                    on_text(text)
+                    pieces.append(text)
+                response = "".join(pieces)
+            metric = self.measure(last_msgs, response, started)
+            remote_id = None
+        new_msg = MessageWithTime(
+            message=Message(role="assistant", content=response),
+            timestamp=int(time.time()),
+            remote_id=remote_id,
+        )
+        self.database.complete_request(
+            request_id=request_id,
+            msg=new_msg,
+            session_name=self.session_name,
+            metric=metric,
+        )
+        if self.compactor is not None:
+            self.compactor.schedule(self, n_messages)
+        if self.retriever is not None:
+            self.retriever.schedule(self.database)
+        return response
+
+    async def resume_requests(self) -> Optional[Tuple[str, str]]:
+        """
+        Answers the turn of the session that was interrupted (crash, network error), if any.
+
+        Returns
+        -------
+        Optional[Tuple[str, str]]
+            User message and its response, `None` if nothing was pending.
+        """
+        pending = self.database.get_pending_requests(session_name=self.session_name)
+        if not pending:
+            return None
+        for request in pending[:-1]:
+            self.database.complete_request(
+                request_id=request.id, msg=None, session_name=self.session_name
+            )
+        return pending[-1].content, await self.answer_request(pending[-1].id)
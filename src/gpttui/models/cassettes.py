@@ -0,0 +1,295 @@
+"""
+This module defines cassettes, files with the HTTP traffic of the models and the arrival time of
+each chunk, so conversations can be replayed without network.
+"""
+import asyncio, base64, httpx, os, time
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional
+from gpttui.codec import dumps, loads
+
+
+class CassetteMiss(Exception):
+    """
+    Raised when a replayed request isn't in the cassette.
+    """
+
+    ...
+
+
+def parse_body(content: bytes) -> Any:
+    """
+    Body of a request as it's stored, JSON bodies are compared by value so the encoding of the
+    codec doesn't matter.
+
+    Parameters
+    ----------
+    content : bytes
+        Raw body.
+
+    Returns
+    -------
+    Any
+        Decoded JSON, or text if it isn't JSON.
+    """
+    if not content:
+        return None
+    try:
+        return loads(content)
+    except ValueError:
+        return content.decode(errors="replace")
+
+
+def encode_chunk(offset: float, chunk: bytes) -> Dict[str, Any]:
+    """
+    Stores a chunk of a response, as text when it's valid UTF-8.
+
+    Parameters
+    ----------
+    offset : float
+        Seconds since the request was sent.
+    chunk : bytes
+        Raw chunk.
+
+    Returns
+    -------
+    Dict[str, Any]
+        Stored chunk.
+    """
+    try:
+        return {"t": round(offset, 6), "text": chunk.decode()}
+    except UnicodeDecodeError:
+        return {"t": round(offset, 6), "b64": base64.b64encode(chunk).decode()}
+
+
+def decode_chunk(chunk: Dict[str, Any]) -> bytes:
+    """
+    Restores a stored chunk.
+
+    Parameters
+    ----------
+    chunk : Dict[str, Any]
+        Stored chunk.
+
+    Returns
+    -------
+    bytes
+        Raw chunk.
+    """
+    if "text" in chunk:
+        return chunk["text"].encode()
+    return base64.b64decode(chunk["b64"])
+
+
+class Cassette:
+    """
+    Recorded interactions, each one has the request (method, url and body) and the response
+    (status, content type and timed chunks). Credentials and other headers aren't stored.
+
+    Parameters
+    ----------
+    path : Path
+        JSON file of the cassette.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.interactions: List[Dict[str, Any]] = []
+        if path.exists():
+            self.interactions = loads(path.read_bytes())["interactions"]
+        self.used = [False] * len(self.interactions)
+
+    @staticmethod
+    def request_key(request: httpx.Request) -> Dict[str, Any]:
+        """
+        Part of a request that identifies it.
+
+        Parameters
+        ----------
+        request : httpx.Request
+            Request.
+
+        Returns
+        -------
+        Dict[str, Any]
+            Method, url and body.
+        """
+        return {
+            "method": request.method,
+            "url": str(request.url),
+            "body": parse_body(request.content),
+        }
+
+    def find(self, request: httpx.Request) -> Dict[str, Any]:
+        """
+        Takes the first unused interaction that matches a request, so repeated requests replay
+        their responses in order.
+
+        Parameters
+        ----------
+        request : httpx.Request
+            Request.
+
+        Returns
+        -------
+        Dict[str, Any]
+            Recorded response.
+
+        Raises
+        ------
+        CassetteMiss
+            If no unused interaction matches.
+        """
+        key = Cassette.request_key(request)
+        for i, interaction in enumerate(self.interactions):
+            if not self.used[i] and interaction["request"] == key:
+                self.used[i] = True
+                return interaction["response"]
+        raise CassetteMiss(f"{key['method']} {key['url']} isn't in {self.path}")
+
+    def append(self, request: httpx.Request, response: Dict[str, Any]) -> None:
+        """
+        Records an interaction and saves the cassette, the file is replaced atomically.
+
+        Parameters
+        ----------
+        request : httpx.Request
+            Request.
+        response : Dict[str, Any]
+            Recorded response.
+        """
+        self.interactions.append(
+            {"request": Cassette.request_key(request), "response": response}
+        )
+        self.used.append(True)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}")
+        tmp.write_bytes(dumps({"interactions": self.interactions}))
+        os.replace(tmp, self.path)
+
+
+class ReplayStream(httpx.AsyncByteStream):
+    """
+    Body of a replayed response.
+
+    Parameters
+    ----------
+    chunks : List[Dict[str, Any]]
+        Stored chunks.
+    realtime : bool
+        Whether to wait until each chunk arrived when it was recorded.
+    """
+
+    def __init__(self, chunks: List[Dict[str, Any]], realtime: bool):
+        self.chunks = chunks
+        self.realtime = realtime
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        start = time.perf_counter()
+        for chunk in self.chunks:
+            if self.realtime:
+                await asyncio.sleep(max(0, chunk["t"] - (time.perf_counter() - start)))
+            yield decode_chunk(chunk)
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """
+    Answers the requests with the responses of a cassette, without network.
+
+    Parameters
+    ----------
+    cassette : Cassette
+        Recorded interactions.
+    realtime : bool
+        Replay at the recorded speed (time to the first chunk included) instead of as fast as
+        possible.
+    """
+
+    def __init__(self, cassette: Cassette, realtime: bool = False):
+        self.cassette = cassette
+        self.realtime = realtime
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        response = self.cassette.find(request)
+        return httpx.Response(
+            response["status"],
+            headers={"content-type": response["content_type"]},
+            stream=ReplayStream(response["chunks"], self.realtime),
+        )
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """
+    Sends the requests through the network and records them in a cassette.
+
+    Parameters
+    ----------
+    cassette : Cassette
+        Cassette to extend.
+    transport : Optional[httpx.AsyncBaseTransport]
+        Transport that reaches the network, a default one if not given.
+    """
+
+    def __init__(
+        self,
+        cassette: Cassette,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.cassette = cassette
+        self.transport = (
+            transport if transport is not None else httpx.AsyncHTTPTransport()
+        )
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        # NOTE: uncompressed responses keep the chunks readable and their timing meaningful.
+        request.headers["accept-encoding"] = "identity"
+        await request.aread()
+        start = time.perf_counter()
+        response = await self.transport.handle_async_request(request)
+        chunks = []
+        try:
+            async for chunk in response.stream:
+                chunks.append(encode_chunk(time.perf_counter() - start, chunk))
+        finally:
+            await response.aclose()
+        recorded = {
+            "status": response.status_code,
+            "content_type": response.headers.get("content-type", ""),
+            "chunks": chunks,
+        }
+        self.cassette.append(request, recorded)
+        return httpx.Response(
+            recorded["status"],
+            headers={"content-type": recorded["content_type"]},
+            stream=ReplayStream(chunks, realtime=False),
+        )
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+def cassette_transport(
+    path: Path, record: bool = False, realtime: bool = False
+) -> httpx.AsyncBaseTransport:
+    """
+    Transport for the models that records or replays a cassette.
+
+    Parameters
+    ----------
+    path : Path
+        JSON file of the cassette.
+    record : bool
+        Whether to send the requests and record them, the cassette is started from scratch.
+    realtime : bool
+        Whether replays wait the recorded time of each chunk.
+
+    Returns
+    -------
+    httpx.AsyncBaseTransport
+        Transport to give to the models.
+    """
+    if record:
+        if path.exists():
+            path.unlink()
+        return RecordingTransport(Cassette(path))
+    return ReplayTransport(Cassette(path), realtime=realtime)
@@ -1,18 +1,14 @@
 """
 This module contains the integration with ChatSonic.
 """
-import time
-from typing import List
+from typing import Any, Dict, Iterator, Optional
 from pydantic import BaseModel
 from gpttui.models.base import AbstractModel
-from gpttui.database.base import Messages, Message, MessageWithTime, AbstractDB
+from gpttui.models.turns import iter_turns
+from gpttui.codec import ArrayEncoder, dumps_object, loads
+from gpttui.database.base import Messages, AbstractDB
 
-try:
-    import httpx
-except ImportError:
-    raise ImportError(
-        "Could not import chatsonic dependencies, please install it with:\n\tpip install gpttui[chatsonic]"
-    )
+import httpx
 
 
 class ChatSonicConf(BaseModel):
@@ -22,24 +18,21 @@ class ChatSonicConf(BaseModel):
     enable_google_results: bool = True
 
 
-class ChatSonicMessage(BaseModel):
-    is_sent: bool
-    message: str
-
-
-class ChatSonicMessages(BaseModel):
-    values: List[ChatSonicMessage]
-
-
 class ChatSonicModel(AbstractModel):
     """
     This class allows loading and interacting with any openai model through its API.
     """
 
     config: ChatSonicConf
+    history_encoder: ArrayEncoder
+    client: httpx.AsyncClient
 
     def setup(
-        self, config: ChatSonicConf, session_name: str, database: AbstractDB
+        self,
+        config: ChatSonicConf,
+        session_name: str,
+        database: AbstractDB,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
     ) -> "ChatSonicModel":
         """
         Initializes the model and collects credentials for OpenAI.
@@ -48,6 +41,8 @@ class ChatSonicModel(AbstractModel):
         ----------
         url : str
             Chatsonic URL.
+        transport : Optional[httpx.AsyncBaseTransport]
+            Transport of the client, the network by default.
 
         Returns
         -------
@@ -57,69 +52,79 @@ class ChatSonicModel(AbstractModel):
         self.config = config
         self.session_name = session_name
         self.database = database
+        self.history_encoder = ArrayEncoder()
+        self.client = httpx.AsyncClient(
+            headers={
+                "accept": "application/json",
+                "content-type": "application/json",
+                "X-API-KEY": config.api_key,
+            },
+            transport=transport,
+        )
         return self
 
     @staticmethod
-    def parse_messages(msgs: Messages) -> ChatSonicMessages:
+    def parse_messages(msgs: Messages) -> Iterator[Dict[str, Any]]:
         """
-        This method parses general messages into chatsonic specific messages.
+        This method serializes general messages into the chatsonic history format.
 
         Parameters
         ----------
         msgs : Messages
             Input messages.
 
-        Returns
-        -------
-        ChatSonicMessages
-            Parsed messages.
+        Yields
+        ------
+        Dict[str, Any]
+            Chatsonic messages.
         """
-        parsed_msgs = []
-        for msg in msgs.values:
-            if msg.role not in ["assistant", "user"]:
-                continue
-            is_sent = msg.role == "user"
-            parsed_msgs.append(ChatSonicMessage(is_sent=is_sent, message=msg.content))
-        return ChatSonicMessages(values=parsed_msgs)
-
-    async def get_answer(self, message: str) -> str:
+        for umsg, amsg in iter_turns(msgs):
+            yield {"is_sent": True, "message": umsg.content}
+            if amsg is not None:
+                yield {"is_sent": False, "message": amsg.content}
+
+    async def generate(self, msgs: Messages) -> str:
         """
-        Obtains an answer form any message.
+        Obtains an answer for a conversation.
 
         Parameters
         ----------
-        message : str
-            Input message.
+        msgs : Messages
+            Conversation.
 
         Returns
         -------
         str
             Generated response.
         """
-        last_msgs = self.last_messages()
-        new_msg = MessageWithTime(
-            message=Message(role="user", content=message), timestamp=int(time.time())
-        )
-        self.database.add_message(msg=new_msg, session_name=self.session_name)
-        last_msgs = self.last_messages()
-        payload = {
-            "enable_memory": self.config.enable_memory,
-            "enable_google_results": self.config.enable_google_results,
-            "input_text": self.context,
-            "history_data": ChatSonicModel.parse_messages(last_msgs).dict()["values"],
-        }
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "X-API-KEY": self.config.api_key,
-        }
-        async with httpx.AsyncClient() as client:
-            r = await client.post(self.config.url, json=payload, headers=headers)
-            response = r.json()["message"]
-
-        new_msg = MessageWithTime(
-            message=Message(role="assistant", content=response),
-            timestamp=int(time.time()),
+        payload = dumps_object(
+            {
+                "enable_memory": self.config.enable_memory,
+                "enable_google_results": self.config.enable_google_results,
+                "input_text": self.context,
+            },
+            {
+                "history_data": self.history_encoder.encode(
+                    ChatSonicModel.parse_messages(msgs)
+                )
+            },
         )
-        self.database.add_message(msg=new_msg, session_name=self.session_name)
-        return response
+        r = await self.client.post(self.config.url, content=payload)
+        return loads(r.content)["message"]
+
+    def backend(self) -> str:
+        """
+        Identifies the model in the usage metrics.
+
+        Returns
+        -------
+        str
+            `chatsonic`, its server doesn't report the tokens.
+        """
+        return "chatsonic"
+
+    async def close(self) -> None:
+        """
+        Closes the connections of the client.
+        """
+        await self.client.aclose()
@@ -1,18 +1,14 @@
 """
 This module contains the integration with ChatSonic.
 """
-import time
-from typing import List
+from typing import Dict, Iterator, Optional
 from pydantic import BaseModel
 from gpttui.models.base import AbstractModel
-from gpttui.database.base import Messages, Message, MessageWithTime, AbstractDB
+from gpttui.models.turns import iter_turns
+from gpttui.codec import ArrayEncoder, dumps_object
+from gpttui.database.base import Messages, AbstractDB
 
-try:
-    import httpx, ssl
-except ImportError:
-    raise ImportError(
-        "Could not import colossal dependencies, please install it with:\n\tpip install gpttui[colossal]"
-    )
+import httpx, ssl
 
 
 class ColossalConf(BaseModel):
@@ -29,32 +25,21 @@ class ColossalConf(BaseModel):
     timeout: float = 30
 
 
-class ColossalMessage(BaseModel):
-    """
-    Represents a single message.
-    """
-
-    instruction: str
-    response: str
-
-
-class ColossalMessages(BaseModel):
-    """
-    Represents the history of messages.
-    """
-
-    values: List[ColossalMessage]
-
-
 class ColossalModel(AbstractModel):
     """
     This class allows loading and interacting with colossal model.
     """
 
     config: ColossalConf
+    history_encoder: ArrayEncoder
+    client: httpx.AsyncClient
 
     def setup(
-        self, config: ColossalConf, session_name: str, database: AbstractDB
+        self,
+        config: ColossalConf,
+        session_name: str,
+        database: AbstractDB,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
     ) -> "ColossalModel":
         """
         Initializes the model.
@@ -67,6 +52,8 @@ class ColossalModel(AbstractModel):
             Session name.
         database : AbstractDB
             Database.
+        transport : Optional[httpx.AsyncBaseTransport]
+            Transport of the client, the network by default.
 
         Returns
         -------
@@ -76,71 +63,79 @@ class ColossalModel(AbstractModel):
         self.config = config
         self.session_name = session_name
         self.database = database
+        self.history_encoder = ArrayEncoder()
+        self.client = httpx.AsyncClient(
+            headers={"content-type": "application/json"},
+            verify=ssl._create_unverified_context(),
+            timeout=httpx.Timeout(config.timeout),
+            transport=transport,
+        )
         return self
 
     @staticmethod
-    def parse_messages(msgs: Messages) -> ColossalMessages:
+    def parse_messages(msgs: Messages) -> Iterator[Dict[str, str]]:
         """
-        This method parses general messages into colossal specific messages.
+        This method serializes general messages into the colossal history format, the open turn is
+        the instruction to answer.
 
         Parameters
         ----------
         msgs : Messages
             Input messages.
 
-        Returns
-        -------
-        ChatSonicMessages
-            Parsed messages.
+        Yields
+        ------
+        Dict[str, str]
+            Colossal turns.
         """
-        parsed_msgs = []
-        user = filter(lambda x: x.role == "user", msgs.values)
-        assistant = filter(lambda x: x.role == "assistant", msgs.values)
-        for umsg, amsg in zip(user, assistant):
-            parsed_msgs.append(
-                ColossalMessage(instruction=umsg.content, response=amsg.content)
-            )
-        return ColossalMessages(values=parsed_msgs)
-
-    async def get_answer(self, message: str) -> str:
+        for umsg, amsg in iter_turns(msgs):
+            response = amsg.content if amsg is not None else ""
+            yield {"instruction": umsg.content, "response": response}
+
+    async def generate(self, msgs: Messages) -> str:
         """
-        Obtains an answer form any message.
+        Obtains an answer for a conversation.
 
         Parameters
         ----------
-        message : str
-            Input message.
+        msgs : Messages
+            Conversation, its open turn is the instruction to answer.
 
         Returns
         -------
         str
             Generated response.
         """
-        last_msgs = self.last_messages()
-        new_msg = MessageWithTime(
-            message=Message(role="user", content=message), timestamp=int(time.time())
+        payload = dumps_object(
+            {
+                "repetition_penalty": self.config.repetition_penalty,
+                "top_k": self.config.top_k,
+                "top_p": self.config.top_p,
+                "temperature": self.config.temperature,
+                "max_new_tokens": self.config.max_new_tokens,
+            },
+            {
+                "history": self.history_encoder.encode(
+                    ColossalModel.parse_messages(msgs)
+                )
+            },
         )
-        self.database.add_message(msg=new_msg, session_name=self.session_name)
-        last_msgs = self.last_messages()
-        history = ColossalModel.parse_messages(last_msgs)
-        history.values.append(ColossalMessage(instruction=message, response=""))
-        payload = {
-            "repetition_penalty": self.config.repetition_penalty,
-            "top_k": self.config.top_k,
-            "top_p": self.config.top_p,
-            "temperature": self.config.temperature,
-            "max_new_tokens": self.config.max_new_tokens,
-            "history": history.dict()["values"],
-        }
-        context = ssl._create_unverified_context()
-        timeout = httpx.Timeout(self.config.timeout)
-        async with httpx.AsyncClient(verify=context, timeout=timeout) as client:
-            r = await client.post(self.config.url, json=payload)
-            response = r.text
-
-        new_msg = MessageWithTime(
-            message=Message(role="assistant", content=response),
-            timestamp=int(time.time()),
-        )
-        self.database.add_message(msg=new_msg, session_name=self.session_name)
-        return response
+        r = await self.client.post(self.config.url, content=payload)
+        return r.text
+
+    def backend(self) -> str:
+        """
+        Identifies the model in the usage metrics.
+
+        Returns
+        -------
+        str
+            `colossal`, its server doesn't report the tokens.
+        """
+        return "colossal"
+
+    async def close(self) -> None:
+        """
+        Closes the connections of the client.
+        """
+        await self.client.aclose()
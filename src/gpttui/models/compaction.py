@@ -0,0 +1,109 @@
+"""
+This module defines the background job that summarizes old messages of long sessions.
+"""
+import asyncio
+from gpttui.database.base import Messages, MessageRecord, SUMMARY_ROLE
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from gpttui.models.base import AbstractModel
+
+SUMMARY_INSTRUCTION = (
+    "Summarize the following conversation between a user and an assistant. Keep the facts, "
+    "decisions, names and code that are needed to continue the conversation, be concise."
+)
+
+
+class Compactor:
+    """
+    Summarizes the oldest messages of a session once it crosses a size, so only the summary and the
+    recent messages are sent to the model.
+
+    Parameters
+    ----------
+    max_messages : int
+        Number of messages sent to the model that triggers a compaction.
+    keep_messages : int
+        Number of recent messages that are never summarized.
+    """
+
+    def __init__(self, max_messages: int = 40, keep_messages: int = 10):
+        self.max_messages = max_messages
+        self.keep_messages = keep_messages
+        self.task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def build_prompt(msgs: Messages) -> Messages:
+        """
+        Builds the conversation that asks a model for a summary.
+
+        Parameters
+        ----------
+        msgs : Messages
+            Messages to summarize, preceded by the previous summary if any.
+
+        Returns
+        -------
+        Messages
+            Summarization request.
+        """
+        transcript = "\n\n".join(f"{msg.role}: {msg.content}" for msg in msgs.values)
+        return Messages(
+            values=[
+                MessageRecord("system", SUMMARY_INSTRUCTION),
+                MessageRecord("user", transcript),
+            ]
+        )
+
+    async def compact(self, model: "AbstractModel") -> bool:
+        """
+        Summarizes the old messages of the model's session.
+
+        Parameters
+        ----------
+        model : AbstractModel
+            Model used to generate the summary, its session is compacted.
+
+        Returns
+        -------
+        bool
+            Whether a summary was stored.
+        """
+        session_name = model.session_name
+        msgs, until_id = model.database.get_compactable(
+            session_name=session_name, keep=self.keep_messages
+        )
+        if until_id is None or all(msg.role == SUMMARY_ROLE for msg in msgs.values):
+            return False
+        summary = await model.generate(Compactor.build_prompt(msgs))
+        model.database.add_summary(
+            content=summary, until_id=until_id, session_name=session_name
+        )
+        return True
+
+    def schedule(
+        self, model: "AbstractModel", n_messages: int
+    ) -> Optional[asyncio.Task]:
+        """
+        Starts a compaction in the background if the session is too long and none is running.
+
+        Parameters
+        ----------
+        model : AbstractModel
+            Model whose session may be compacted.
+        n_messages : int
+            Number of messages that are currently sent to the model.
+
+        Returns
+        -------
+        Optional[asyncio.Task]
+            The started compaction, if any.
+        """
+        if self.max_messages <= 0 or n_messages <= self.max_messages:
+            return None
+        if self.task is not None and not self.task.done():
+            return None
+        self.task = asyncio.create_task(self.compact(model))
+        # NOTE: a failed compaction is retried on the next turn, it must never break the chat.
+        self.task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return self.task
@@ -0,0 +1,218 @@
+"""
+This module contains the integration with local GGUF models, running on CPU in worker processes.
+"""
+try:
+    import llama_cpp
+except ImportError:
+    raise ImportError(
+        "Could not import local dependencies, please install it with:\n\tpip install gpttui[local]"
+    )
+import os
+from multiprocessing.connection import Connection
+from pydantic import BaseModel
+from typing import AsyncIterator, Dict, Iterator, List, Tuple
+from gpttui.models.base import AbstractModel
+from gpttui.models.turns import iter_conversation
+from gpttui.models.workers import WorkerPool, send_all
+from gpttui.database.base import AbstractDB, Messages
+
+__LOADED: Dict[Tuple[str, int, int], "llama_cpp.Llama"] = {}
+__POOLS: Dict[str, WorkerPool] = {}
+
+
+class LocalConf(BaseModel):
+    """
+    Dataclass to setup local models.
+    """
+
+    model_path: str = ""
+    context_length: int = 2048
+    max_new_tokens: int = 512
+    temperature: float = 0.7
+    threads: int = 0
+    workers: int = 1
+
+
+def load_model(model_path: str, context_length: int, threads: int) -> "llama_cpp.Llama":
+    """
+    Loads a model once per worker, its weights are memory mapped so every worker shares the same
+    pages of the file.
+
+    Parameters
+    ----------
+    model_path : str
+        GGUF file.
+    context_length : int
+        Maximum number of tokens in the prompt and the response.
+    threads : int
+        Threads of the worker, 0 uses llama.cpp's default.
+
+    Returns
+    -------
+    llama_cpp.Llama
+        Loaded model.
+    """
+    key = (model_path, context_length, threads)
+    if key not in __LOADED:
+        __LOADED[key] = llama_cpp.Llama(
+            model_path=model_path,
+            n_ctx=context_length,
+            n_threads=threads or None,
+            use_mmap=True,
+            verbose=False,
+        )
+    return __LOADED[key]
+
+
+def iter_tokens(config: LocalConf, messages: List[Dict[str, str]]) -> Iterator[str]:
+    """
+    Generates the pieces of text of a response.
+
+    Parameters
+    ----------
+    config : LocalConf
+        Model's configuration.
+    messages : List[Dict[str, str]]
+        Conversation in the chat format.
+
+    Yields
+    ------
+    str
+        Piece of the response.
+    """
+    model = load_model(config.model_path, config.context_length, config.threads)
+    for chunk in model.create_chat_completion(
+        messages=messages,
+        max_tokens=config.max_new_tokens,
+        temperature=config.temperature,
+        stream=True,
+    ):
+        text = chunk["choices"][0]["delta"].get("content")
+        if text:
+            yield text
+
+
+def shared_pool(config: LocalConf) -> WorkerPool:
+    """
+    Pool of workers for a configuration, the models of every session share it so the weights are
+    loaded once per worker.
+
+    Parameters
+    ----------
+    config : LocalConf
+        Model's configuration.
+
+    Returns
+    -------
+    WorkerPool
+        Pool, its processes start on the first request.
+    """
+    key = config.json()
+    if key not in __POOLS:
+        __POOLS[key] = WorkerPool(workers=config.workers)
+    return __POOLS[key]
+
+
+def run_generation(
+    config: LocalConf, messages: List[Dict[str, str]], conn: Connection
+) -> None:
+    """
+    Job that streams a response from a worker process.
+
+    Parameters
+    ----------
+    config : LocalConf
+        Model's configuration.
+    messages : List[Dict[str, str]]
+        Conversation in the chat format.
+    conn : Connection
+        Pipe to the main process.
+    """
+    send_all(conn, iter_tokens(config, messages))
+
+
+class LocalModel(AbstractModel):
+    """
+    This class allows running GGUF models on the CPU without network, generation happens in a pool
+    of processes so it never blocks the TUI.
+    """
+
+    config: LocalConf
+    pool: WorkerPool
+
+    def setup(
+        self, config: LocalConf, session_name: str, database: AbstractDB
+    ) -> "LocalModel":
+        """
+        Initializes the model, the workers load it on the first request.
+
+        Parameters
+        ----------
+        config : LocalConf
+            Configuration options.
+        session_name : str
+            Session name.
+        database : AbstractDB
+            Database to store the messages.
+
+        Returns
+        -------
+        LocalModel
+            Instance of the model to be used as a builder.
+        """
+        self.config = config
+        self.session_name = session_name
+        self.database = database
+        self.pool = shared_pool(config)
+        return self
+
+    async def stream(self, msgs: Messages) -> AsyncIterator[str]:
+        """
+        Streams the answer for a conversation as it's generated.
+
+        Parameters
+        ----------
+        msgs : Messages
+            Conversation.
+
+        Yields
+        ------
+        str
+            Piece of the response.
+        """
+        messages = [msg._asdict() for msg in iter_conversation(msgs)]
+        async for text in self.pool.stream(run_generation, self.config, messages):
+            yield text
+
+    async def generate(self, msgs: Messages) -> str:
+        """
+        Obtains an answer for a conversation.
+
+        Parameters
+        ----------
+        msgs : Messages
+            Conversation.
+
+        Returns
+        -------
+        str
+            Generated response.
+        """
+        return "".join([text async for text in self.stream(msgs)])
+
+    def backend(self) -> str:
+        """
+        Identifies the model in the usage metrics.
+
+        Returns
+        -------
+        str
+            `local/` followed by the file name of the weights.
+        """
+        return f"local/{os.path.basename(self.config.model_path)}"
+
+    async def close(self) -> None:
+        """
+        Stops the workers.
+        """
+        self.pool.close()
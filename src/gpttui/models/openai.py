@@ -1,16 +1,13 @@
 """
 This module contains the integration with OpenAI models.
 """
-try:
-    import openai, time
-    from openai.error import Timeout
-except ImportError:
-    raise ImportError(
-        "Could not import openai library, please install it with:\n\tpip install gpttui[openai]"
-    )
+import httpx
 from pydantic import BaseModel
-from gpttui.models.base import AbstractModel
-from gpttui.database.base import AbstractDB, Message, MessageWithTime
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+from gpttui.codec import dumps, loads
+from gpttui.models.base import USAGE, AbstractModel, StateMismatch, Usage
+from gpttui.models.turns import iter_conversation
+from gpttui.database.base import AbstractDB, Messages
 
 
 class OpenAIConf(BaseModel):
@@ -23,29 +20,40 @@ class OpenAIConf(BaseModel):
     model_name: str = "gpt-3.5-turbo"
     organization: str = ""
     api_key: str = ""
+    stateful: bool = False
+    base_url: str = "https://api.openai.com/v1"
+    max_connections: int = 10
 
 
 class OpenAIModel(AbstractModel):
     """
-    This class allows loading and interacting with any openai model through its API.
+    This class allows loading and interacting with any openai model through its API, each instance
+    owns a client with its own connection pool and credentials.
     """
 
     config: OpenAIConf
+    client: httpx.AsyncClient
 
     def setup(
-        self, config: OpenAIConf, session_name: str, database: AbstractDB
+        self,
+        config: OpenAIConf,
+        session_name: str,
+        database: AbstractDB,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
     ) -> "OpenAIModel":
         """
-        Initializes the model and collects credentials for OpenAI.
+        Initializes the model and its client for OpenAI.
 
         Parameters
         ----------
-        model_name : str
-            Model name.
+        config : OpenAIConf
+            Model's configuration and credentials.
         session_name : str
             Session name.
         database : AbstractDB
             Database to store the messages.
+        transport : Optional[httpx.AsyncBaseTransport]
+            Transport of the client, the network by default.
 
         Returns
         -------
@@ -55,47 +63,194 @@ class OpenAIModel(AbstractModel):
         self.config = config
         self.session_name = session_name
         self.database = database
-        openai.organization = config.organization
-        openai.api_key = config.api_key
+        headers = {"content-type": "application/json"}
+        if config.api_key:
+            headers["authorization"] = f"Bearer {config.api_key}"
+        if config.organization:
+            headers["openai-organization"] = config.organization
+        self.client = httpx.AsyncClient(
+            base_url=config.base_url,
+            headers=headers,
+            timeout=httpx.Timeout(config.timeout),
+            limits=httpx.Limits(
+                max_connections=config.max_connections,
+                max_keepalive_connections=config.max_connections,
+            ),
+            transport=transport,
+        )
         return self
 
-    async def get_answer(self, message: str) -> str:
+    async def post(self, path: str, payload: Dict[str, Any]) -> httpx.Response:
+        """
+        Sends a request through the pooled client, retrying on timeouts.
+
+        Parameters
+        ----------
+        path : str
+            Endpoint relative to the base url.
+        payload : Dict[str, Any]
+            Body of the request.
+
+        Returns
+        -------
+        httpx.Response
+            Response of the API.
+        """
+        content = dumps(payload)
+        for _ in range(self.config.max_retries):
+            try:
+                return await self.client.post(path, content=content)
+            except httpx.TimeoutException:
+                ...
+        raise httpx.TimeoutException("Maximum number of retries achieved.")
+
+    async def generate(self, msgs: Messages) -> str:
         """
-        Obtains an answer form any message.
+        Obtains an answer for a conversation.
 
         Parameters
         ----------
-        message : str
-            Input message.
+        msgs : Messages
+            Conversation.
 
         Returns
         -------
         str
             Generated response.
         """
-        last_msgs = self.last_messages()
-        new_msg = MessageWithTime(
-            message=Message(role="user", content=message), timestamp=int(time.time())
+        r = await self.post(
+            "/chat/completions",
+            {
+                "model": self.config.model_name,
+                "messages": [msg._asdict() for msg in iter_conversation(msgs)],
+            },
         )
-        self.database.add_message(msg=new_msg, session_name=self.session_name)
-        last_msgs = self.last_messages()
-        response = ""
-        retries = 0
-        while not response and retries < self.config.max_retries:
-            try:
-                response = await openai.ChatCompletion.acreate(
-                    model=self.config.model_name,
-                    messages=last_msgs.dict()["values"],
-                    request_timeout=self.config.timeout,
+        r.raise_for_status()
+        response = loads(r.content)
+        if response.get("usage"):
+            USAGE.set(
+                Usage(
+                    response["usage"]["prompt_tokens"],
+                    response["usage"]["completion_tokens"],
+                )
+            )
+        return str(response["choices"][0]["message"]["content"])
+
+    async def stream(self, msgs: Messages) -> AsyncIterator[str]:
+        """
+        Streams the answer for a conversation through server-sent events.
+
+        Parameters
+        ----------
+        msgs : Messages
+            Conversation.
+
+        Yields
+        ------
+        str
+            Piece of the response.
+        """
+        payload = {
+            "model": self.config.model_name,
+            "messages": [msg._asdict() for msg in iter_conversation(msgs)],
+            "stream": True,
+            "stream_options": {"include_usage": True},
+        }
+        async with self.client.stream(
+            "POST", "/chat/completions", content=dumps(payload)
+        ) as r:
+            if r.is_error:
+                await r.aread()
+                r.raise_for_status()
+            async for line in r.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:") :].strip()
+                if data == "[DONE]":
+                    break
+                chunk = loads(data)
+                if chunk.get("usage"):
+                    USAGE.set(
+                        Usage(
+                            chunk["usage"]["prompt_tokens"],
+                            chunk["usage"]["completion_tokens"],
+                        )
+                    )
+                choices = chunk["choices"]
+                text = choices[0]["delta"].get("content") if choices else None
+                if text:
+                    yield text
+
+    async def close(self) -> None:
+        """
+        Closes the connections of the client.
+        """
+        await self.client.aclose()
+
+    def backend(self) -> str:
+        """
+        Identifies the model in the usage metrics.
+
+        Returns
+        -------
+        str
+            `openai/` followed by the model name.
+        """
+        return f"openai/{self.config.model_name}"
+
+    def is_stateful(self) -> bool:
+        """
+        Whether the responses API must keep the conversation in the server.
+
+        Returns
+        -------
+        bool
+            The `stateful` config option.
+        """
+        return self.config.stateful
+
+    async def generate_stateful(
+        self, msgs: Messages, remote_id: Optional[str]
+    ) -> Tuple[str, Optional[str]]:
+        """
+        Obtains an answer through the responses API, continuing a stored response if given.
+
+        Parameters
+        ----------
+        msgs : Messages
+            Messages that the server hasn't seen, or the whole conversation.
+        remote_id : Optional[str]
+            Identifier of the previous response.
+
+        Returns
+        -------
+        Tuple[str, Optional[str]]
+            Generated response and its identifier.
+        """
+        payload = {
+            "model": self.config.model_name,
+            "input": [msg._asdict() for msg in iter_conversation(msgs)],
+            "store": True,
+        }
+        if remote_id is not None:
+            payload["previous_response_id"] = remote_id
+        r = await self.post("/responses", payload)
+        if remote_id is not None and r.status_code in (400, 404):
+            raise StateMismatch(r.text)
+        r.raise_for_status()
+        response = loads(r.content)
+        if response.get("usage"):
+            USAGE.set(
+                Usage(
+                    response["usage"]["input_tokens"],
+                    response["usage"]["output_tokens"],
                 )
-            except Timeout:
-                retries += 1
-        if retries == self.config.max_retries:
-            raise Timeout("Maximum number of retries achieved.")
-        response = str(response.choices[0].message.content)  # type: ignore
-        new_msg = MessageWithTime(
-            message=Message(role="assistant", content=response),
-            timestamp=int(time.time()),
+            )
+        text = "".join(
+            part["text"]
+            for item in response["output"]
+            if item["type"] == "message"
+            for part in item["content"]
+            if part["type"] == "output_text"
         )
-        self.database.add_message(msg=new_msg, session_name=self.session_name)
-        return response
+        return text, response["id"]
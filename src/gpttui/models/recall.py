@@ -0,0 +1,178 @@
+"""
+This module defines the retrieval of relevant messages from past sessions, they're added to the
+conversation that is sent to the model.
+"""
+import asyncio
+from gpttui.database.base import AbstractDB, IndexedMessage, Messages, MessageRecord
+from gpttui.embeddings.base import AbstractEmbedder
+from gpttui.embeddings.index import EmbeddingIndex, session_key
+from typing import TYPE_CHECKING, List, Optional
+
+if TYPE_CHECKING:
+    from gpttui.models.base import AbstractModel
+
+RECALL_INSTRUCTION = "Relevant excerpts from previous conversations:"
+SNIPPET_LENGTH = 300
+
+
+class Retriever:
+    """
+    Embeds the messages of every session into an index, and recalls the ones that are similar to
+    the last user message.
+
+    Parameters
+    ----------
+    embedder : AbstractEmbedder
+        Model that computes the vectors.
+    index : EmbeddingIndex
+        Vectors of the stored messages.
+    top_k : int
+        Maximum number of recalled messages.
+    min_score : float
+        Minimum cosine similarity of a recalled message.
+    batch_size : int
+        Number of messages embedded at once.
+    """
+
+    def __init__(
+        self,
+        embedder: AbstractEmbedder,
+        index: EmbeddingIndex,
+        top_k: int = 3,
+        min_score: float = 0.2,
+        batch_size: int = 256,
+    ):
+        self.embedder = embedder
+        self.index = index
+        self.top_k = top_k
+        self.min_score = min_score
+        self.batch_size = batch_size
+        self.task: Optional[asyncio.Task] = None
+
+    async def update(self, database: AbstractDB) -> int:
+        """
+        Embeds the messages that were stored since the last update, nothing is done if another
+        process is updating the index.
+
+        Parameters
+        ----------
+        database : AbstractDB
+            Database with the messages.
+
+        Returns
+        -------
+        int
+            Number of indexed messages.
+        """
+        fd = self.index.try_lock()
+        if fd is None:
+            return 0
+        total = 0
+        try:
+            msgs = database.iter_messages_after(
+                self.index.last_id(), batch_size=self.batch_size
+            )
+            batch = []
+            for msg in msgs:
+                batch.append(msg)
+                if len(batch) == self.batch_size:
+                    total += await self.__add(batch)
+                    batch = []
+            if batch:
+                total += await self.__add(batch)
+        finally:
+            self.index.unlock(fd)
+        return total
+
+    async def __add(self, batch: List[IndexedMessage]) -> int:
+        """
+        Embeds a batch of messages and appends them to the index.
+
+        Parameters
+        ----------
+        batch : List[IndexedMessage]
+            Messages to index.
+
+        Returns
+        -------
+        int
+            Number of indexed messages.
+        """
+        vectors = await self.embedder.embed([msg.content for msg in batch])
+        self.index.append(
+            [msg.id for msg in batch],
+            [session_key(msg.session_name) for msg in batch],
+            vectors,
+        )
+        return len(batch)
+
+    async def recall(self, model: "AbstractModel", msgs: Messages) -> Messages:
+        """
+        Adds the messages of other sessions that are similar to the last user message, as a system
+        message after the leading system messages.
+
+        Parameters
+        ----------
+        model : AbstractModel
+            Model whose session is being answered.
+        msgs : Messages
+            Conversation that will be sent to the model.
+
+        Returns
+        -------
+        Messages
+            Conversation with the recalled messages, if any.
+        """
+        query = None
+        for msg in msgs.view("user"):
+            query = msg.content
+        if query is None:
+            return msgs
+        vector = (await self.embedder.embed([query]))[0]
+        hits = {
+            message_id: score
+            for message_id, score in self.index.search(
+                vector, self.top_k, exclude_key=session_key(model.session_name)
+            )
+            if score >= self.min_score
+        }
+        if not hits:
+            return msgs
+        found = model.database.get_messages_by_ids(list(hits))
+        found.sort(key=lambda msg: hits[msg.id], reverse=True)
+        excerpts = "\n".join(
+            f"- ({msg.session_name}) {msg.role}: {msg.content[:SNIPPET_LENGTH]}"
+            for msg in found
+            if msg.session_name != model.session_name
+        )
+        if not excerpts:
+            return msgs
+        position = 0
+        while position < len(msgs.values) and msgs.values[position].role == "system":
+            position += 1
+        values = list(msgs.values)
+        values.insert(
+            position, MessageRecord("system", f"{RECALL_INSTRUCTION}\n{excerpts}")
+        )
+        return Messages(values=values)
+
+    def schedule(self, database: AbstractDB) -> Optional[asyncio.Task]:
+        """
+        Starts an update of the index in the background if none is running.
+
+        Parameters
+        ----------
+        database : AbstractDB
+            Database with the messages.
+
+        Returns
+        -------
+        Optional[asyncio.Task]
+            The started update, if any.
+        """
+        if self.task is not None and not self.task.done():
+            return None
+        self.task = asyncio.create_task(self.update(database))
+        # NOTE: a failed update is retried on the next turn, it must never break the chat.
+        self.task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return self.task
@@ -0,0 +1,65 @@
+"""
+This module pairs the messages of a conversation into turns, it's shared by every model.
+"""
+from gpttui.database.base import MessageRecord
+from typing import Iterable, Iterator, Optional, Tuple
+
+
+def iter_conversation(msgs: Iterable[MessageRecord]) -> Iterator[MessageRecord]:
+    """
+    Iterates over a conversation in a single pass, keeping only well formed turns. User messages that
+    never got an answer (failed requests) and unrequested assistant messages are skipped, other roles
+    are kept in place.
+
+    Parameters
+    ----------
+    msgs : Iterable[MessageRecord]
+        Messages in chronological order.
+
+    Yields
+    ------
+    MessageRecord
+        Messages where each user message is followed by its answer, except the last one if the turn
+        is still open.
+    """
+    pending: Optional[MessageRecord] = None
+    for msg in msgs:
+        if msg.role == "user":
+            pending = msg
+        elif msg.role == "assistant":
+            if pending is not None:
+                yield pending
+                yield msg
+                pending = None
+        else:
+            yield msg
+    if pending is not None:
+        yield pending
+
+
+def iter_turns(
+    msgs: Iterable[MessageRecord],
+) -> Iterator[Tuple[MessageRecord, Optional[MessageRecord]]]:
+    """
+    Pairs each user message with the assistant message that answers it in a single pass, messages
+    that aren't part of a turn are skipped.
+
+    Parameters
+    ----------
+    msgs : Iterable[MessageRecord]
+        Messages in chronological order.
+
+    Yields
+    ------
+    Tuple[MessageRecord, Optional[MessageRecord]]
+        User message and its answer, the last turn has no answer if it's still open.
+    """
+    pending: Optional[MessageRecord] = None
+    for msg in iter_conversation(msgs):
+        if msg.role == "user":
+            pending = msg
+        elif msg.role == "assistant" and pending is not None:
+            yield pending, msg
+            pending = None
+    if pending is not None:
+        yield pending, None
@@ -0,0 +1,129 @@
+"""
+This module defines a pool of worker processes whose jobs stream their results back through a
+pipe, so heavy generation never blocks the event loop.
+"""
+import asyncio
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import Pipe
+from multiprocessing.connection import Connection
+from typing import Any, AsyncIterator, Callable, Optional, Set
+
+_FINISHED = object()
+
+
+class WorkerPool:
+    """
+    Pool of processes started on the first job. A job is a picklable function that receives a
+    `Connection` as its last argument, sends each value through it and sends `None` at the end.
+
+    Parameters
+    ----------
+    workers : int
+        Number of processes.
+    """
+
+    def __init__(self, workers: int = 1):
+        self.workers = workers
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.pending: Set[Future] = set()
+
+    def start(self) -> ProcessPoolExecutor:
+        """
+        Starts the processes if they aren't running.
+
+        Returns
+        -------
+        ProcessPoolExecutor
+            Running executor.
+        """
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self.executor
+
+    async def stream(self, fn: Callable[..., None], *args: Any) -> AsyncIterator[Any]:
+        """
+        Runs a job in a worker and yields the values that it sends.
+
+        Parameters
+        ----------
+        fn : Callable[..., None]
+            Job, a module level function.
+        *args : Any
+            Picklable arguments of the job, the connection is appended.
+
+        Yields
+        ------
+        Any
+            Values sent by the job.
+
+        Raises
+        ------
+        BrokenProcessPool
+            If a worker died, the next job starts new processes.
+        """
+        recv, send = Pipe(duplex=False)
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+
+        def read() -> None:
+            try:
+                queue.put_nowait(recv.recv())
+            except EOFError:
+                queue.put_nowait(None)
+
+        # NOTE: the pipe is read when it's ready instead of in a thread, a dead worker never
+        # closes it because forked workers inherit its ends, so its future wakes the queue up.
+        loop.add_reader(recv.fileno(), read)
+        job = self.start().submit(fn, *args, send)
+        self.pending.add(job)
+        job.add_done_callback(self.pending.discard)
+        future = asyncio.wrap_future(job)
+        future.add_done_callback(lambda _: queue.put_nowait(_FINISHED))
+        try:
+            while True:
+                value = await queue.get()
+                if value is None:
+                    break
+                if value is _FINISHED:
+                    if future.exception() is not None:
+                        future.result()
+                    continue
+                yield value
+            await future
+        except BrokenProcessPool:
+            self.executor = None
+            raise
+        finally:
+            loop.remove_reader(recv.fileno())
+            recv.close()
+            send.close()
+
+    def close(self) -> None:
+        """
+        Stops the processes, the jobs that didn't start are cancelled.
+        """
+        if self.executor is not None:
+            for job in list(self.pending):
+                job.cancel()
+            self.executor.shutdown()
+            self.executor = None
+
+
+def send_all(conn: Connection, values: Any) -> None:
+    """
+    Sends every value of an iterable from a job and marks the end, even if it fails.
+
+    Parameters
+    ----------
+    conn : Connection
+        Connection received by the job.
+    values : Any
+        Iterable of picklable values.
+    """
+    try:
+        for value in values:
+            conn.send(value)
+    finally:
+        conn.send(None)
+        conn.close()
@@ -0,0 +1,557 @@
+"""
+This module defines the thin clients of the gpttui daemon, a database and a model that forward every
+call through the daemon's Unix socket.
+"""
+import asyncio
+import socket
+import threading
+from itertools import count
+from pathlib import Path
+from pydantic import BaseModel
+from gpttui.database.base import (
+    AbstractDB,
+    Messages,
+    IndexedMessage,
+    LockStats,
+    MessageRecord,
+    MessageWithTime,
+    PendingRequest,
+    RetentionPolicy,
+    SessionInfo,
+    TurnMetric,
+    UsageGroupEnum,
+    UsageRow,
+)
+from gpttui.models.base import AbstractModel, ModelsEnum
+from gpttui.server.protocol import (
+    LINE_LIMIT,
+    RemoteError,
+    decode_line,
+    encode_line,
+    to_wire,
+)
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+def _to_messages(values: List[List[str]]) -> Messages:
+    return Messages(values=[MessageRecord(*value) for value in values])
+
+
+def _result(response: Dict[str, Any]) -> Any:
+    if "error" in response:
+        raise RemoteError(response["error"])
+    return response["result"]
+
+
+class RemoteDB(AbstractDB):
+    """
+    Database served by a gpttui daemon, a lock keeps the requests of several threads apart so the
+    TUI can run its calls in an executor.
+    """
+
+    thread_safe = True
+
+    def setup(self, **kwargs: str) -> "RemoteDB":
+        """
+        Connects to the daemon.
+
+        Parameters
+        ----------
+        socket : str
+            Path of the daemon's Unix socket.
+
+        Returns
+        -------
+        RemoteDB
+            Instance of the database to use as a builder.
+        """
+        self.socket_path = kwargs["socket"]
+        self.connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.connection.connect(self.socket_path)
+        self.stream = self.connection.makefile("rwb")
+        self.ids = count()
+        self.lock = threading.Lock()
+        return self
+
+    def call(self, method: str, **params: Any) -> Any:
+        """
+        Sends a request to the daemon and waits for its result.
+
+        Parameters
+        ----------
+        method : str
+            Requested method.
+        params : Any
+            Keyword arguments of the method.
+
+        Returns
+        -------
+        Any
+            Result.
+
+        Raises
+        ------
+        RemoteError
+            If the daemon fails to process the request.
+        """
+        with self.lock:
+            self.stream.write(
+                encode_line({"id": next(self.ids), "method": method, "params": params})
+            )
+            self.stream.flush()
+            line = self.stream.readline()
+        if not line:
+            raise RemoteError("The daemon closed the connection.")
+        return _result(decode_line(line))
+
+    def create_session(self, session_name: str):
+        """
+        Forwards `AbstractDB.create_session` to the daemon.
+        """
+        self.call("create_session", session_name=session_name)
+
+    def delete_session(self, session_name: str):
+        """
+        Forwards `AbstractDB.delete_session` to the daemon.
+        """
+        self.call("delete_session", session_name=session_name)
+
+    def rename_session(self, session_name: str, new_name: str):
+        """
+        Forwards `AbstractDB.rename_session` to the daemon.
+        """
+        self.call("rename_session", session_name=session_name, new_name=new_name)
+
+    def add_message(self, msg: MessageWithTime, session_name: str):
+        """
+        Forwards `AbstractDB.add_message` to the daemon.
+        """
+        self.call("add_message", msg=msg.dict(), session_name=session_name)
+
+    def add_messages(self, msgs: Iterable[MessageWithTime], session_name: str) -> int:
+        """
+        Forwards `AbstractDB.add_messages` to the daemon.
+        """
+        return self.call(
+            "add_messages",
+            msgs=[msg.dict() for msg in msgs],
+            session_name=session_name,
+        )
+
+    def enqueue_request(self, msg: MessageWithTime, session_name: str) -> int:
+        """
+        Forwards `AbstractDB.enqueue_request` to the daemon.
+        """
+        return self.call("enqueue_request", msg=msg.dict(), session_name=session_name)
+
+    def complete_request(
+        self,
+        request_id: int,
+        msg: Optional[MessageWithTime],
+        session_name: str,
+        metric: Optional[TurnMetric] = None,
+    ) -> bool:
+        """
+        Forwards `AbstractDB.complete_request` to the daemon.
+        """
+        return self.call(
+            "complete_request",
+            request_id=request_id,
+            msg=msg.dict() if msg is not None else None,
+            session_name=session_name,
+            metric=list(metric) if metric is not None else None,
+        )
+
+    def get_pending_requests(
+        self, session_name: Optional[str] = None
+    ) -> List[PendingRequest]:
+        """
+        Forwards `AbstractDB.get_pending_requests` to the daemon.
+        """
+        return [
+            PendingRequest(*request)
+            for request in self.call("get_pending_requests", session_name=session_name)
+        ]
+
+    def get_messages(self, session_name: str) -> Messages:
+        """
+        Forwards `AbstractDB.get_messages` to the daemon.
+        """
+        return _to_messages(self.call("get_messages", session_name=session_name))
+
+    def get_last_message(
+        self, session_name: str, role: str, offset: int = 0
+    ) -> Optional[str]:
+        """
+        Forwards `AbstractDB.get_last_message` to the daemon.
+        """
+        return self.call(
+            "get_last_message", session_name=session_name, role=role, offset=offset
+        )
+
+    def get_recent_messages(self, session_name: str) -> Messages:
+        """
+        Forwards `AbstractDB.get_recent_messages` to the daemon.
+        """
+        return _to_messages(self.call("get_recent_messages", session_name=session_name))
+
+    def get_compactable(
+        self, session_name: str, keep: int
+    ) -> Tuple[Messages, Optional[int]]:
+        """
+        Forwards `AbstractDB.get_compactable` to the daemon.
+        """
+        values, until_id = self.call(
+            "get_compactable", session_name=session_name, keep=keep
+        )
+        return _to_messages(values), until_id
+
+    def get_remote_state(self, session_name: str) -> Tuple[Optional[str], int]:
+        """
+        Forwards `AbstractDB.get_remote_state` to the daemon.
+        """
+        remote_id, seen_id = self.call("get_remote_state", session_name=session_name)
+        return remote_id, seen_id
+
+    def get_messages_after(self, session_name: str, after_id: int) -> Messages:
+        """
+        Forwards `AbstractDB.get_messages_after` to the daemon.
+        """
+        return _to_messages(
+            self.call(
+                "get_messages_after", session_name=session_name, after_id=after_id
+            )
+        )
+
+    def add_summary(self, content: str, until_id: int, session_name: str):
+        """
+        Forwards `AbstractDB.add_summary` to the daemon.
+        """
+        self.call(
+            "add_summary", content=content, until_id=until_id, session_name=session_name
+        )
+
+    def iter_messages(
+        self, session_name: str, batch_size: int = 1000
+    ) -> Iterator[MessageWithTime]:
+        """
+        Forwards `AbstractDB.iter_messages` to the daemon, it streams the session one batch per
+        request.
+        """
+        page = self.call(
+            "iter_messages", session_name=session_name, batch_size=batch_size
+        )
+        try:
+            while True:
+                yield from (MessageWithTime.parse_obj(msg) for msg in page["batch"])
+                if page["cursor"] is None:
+                    break
+                page = self.call(
+                    "next_batch", cursor=page["cursor"], batch_size=batch_size
+                )
+        finally:
+            if page["cursor"] is not None:
+                self.call("close_cursor", cursor=page["cursor"])
+
+    def iter_messages_after(
+        self, after_id: int, batch_size: int = 1000
+    ) -> Iterator[IndexedMessage]:
+        """
+        Forwards `AbstractDB.iter_messages_after` to the daemon, one batch per request.
+        """
+        while batch := self.call(
+            "iter_messages_after", after_id=after_id, batch_size=batch_size
+        ):
+            yield from (IndexedMessage(*msg) for msg in batch)
+            after_id = batch[-1][0]
+
+    def get_messages_by_ids(self, ids: List[int]) -> List[IndexedMessage]:
+        """
+        Forwards `AbstractDB.get_messages_by_ids` to the daemon.
+        """
+        return [
+            IndexedMessage(*msg) for msg in self.call("get_messages_by_ids", ids=ids)
+        ]
+
+    def list_sessions(self) -> List[str]:
+        """
+        Forwards `AbstractDB.list_sessions` to the daemon.
+        """
+        return self.call("list_sessions")
+
+    def get_sessions(self) -> List[SessionInfo]:
+        """
+        Forwards `AbstractDB.get_sessions` to the daemon.
+        """
+        return [SessionInfo.parse_obj(info) for info in self.call("get_sessions")]
+
+    def set_retention(self, session_name: str, policy: Optional[RetentionPolicy]):
+        """
+        Forwards `AbstractDB.set_retention` to the daemon.
+        """
+        self.call(
+            "set_retention",
+            session_name=session_name,
+            policy=list(policy) if policy is not None else None,
+        )
+
+    def get_retention(self, session_name: str) -> Optional[RetentionPolicy]:
+        """
+        Forwards `AbstractDB.get_retention` to the daemon.
+        """
+        policy = self.call("get_retention", session_name=session_name)
+        return RetentionPolicy(*policy) if policy is not None else None
+
+    def apply_retention(self, default: RetentionPolicy, now: int) -> int:
+        """
+        Forwards `AbstractDB.apply_retention` to the daemon.
+        """
+        return self.call("apply_retention", default=list(default), now=now)
+
+    def vacuum_step(self, pages: int) -> int:
+        """
+        Forwards `AbstractDB.vacuum_step` to the daemon.
+        """
+        return self.call("vacuum_step", pages=pages)
+
+    def optimize(self):
+        """
+        Forwards `AbstractDB.optimize` to the daemon.
+        """
+        self.call("optimize")
+
+    def get_inactive_sessions(self, before: int) -> List[str]:
+        """
+        Forwards `AbstractDB.get_inactive_sessions` to the daemon.
+        """
+        return self.call("get_inactive_sessions", before=before)
+
+    def archive_session(self, session_name: str) -> int:
+        """
+        Forwards `AbstractDB.archive_session` to the daemon.
+        """
+        return self.call("archive_session", session_name=session_name)
+
+    def restore_session(self, session_name: str) -> int:
+        """
+        Forwards `AbstractDB.restore_session` to the daemon.
+        """
+        return self.call("restore_session", session_name=session_name)
+
+    def migrate(self, batch_size: int = 1000) -> int:
+        """
+        Forwards `AbstractDB.migrate` to the daemon.
+        """
+        return self.call("migrate", batch_size=batch_size)
+
+    def get_data_version(self) -> int:
+        """
+        Forwards `AbstractDB.get_data_version` to the daemon.
+        """
+        return self.call("get_data_version")
+
+    def get_last_message_id(self) -> int:
+        """
+        Forwards `AbstractDB.get_last_message_id` to the daemon.
+        """
+        return self.call("get_last_message_id")
+
+    def get_lock_stats(self) -> LockStats:
+        """
+        Forwards `AbstractDB.get_lock_stats` to the daemon, they're the waits of its connection.
+        """
+        return LockStats(*self.call("get_lock_stats"))
+
+    def get_usage(self, group: UsageGroupEnum, since: int = 0) -> List[UsageRow]:
+        """
+        Forwards `AbstractDB.get_usage` to the daemon.
+        """
+        return [
+            UsageRow(*row)
+            for row in self.call("get_usage", group=group.value, since=since)
+        ]
+
+    def get_latencies(
+        self, group: UsageGroupEnum, since: int = 0
+    ) -> List[Tuple[str, float]]:
+        """
+        Forwards `AbstractDB.get_latencies` to the daemon.
+        """
+        return [
+            (key, latency)
+            for key, latency in self.call(
+                "get_latencies", group=group.value, since=since
+            )
+        ]
+
+    def close(self):
+        """
+        Closes the connection, the daemon keeps its database open.
+        """
+        with self.lock:
+            self.stream.close()
+            self.connection.close()
+
+
+class RemoteConf(BaseModel):
+    """
+    Dataclass with the configuration of a model served by a gpttui daemon.
+
+    Attributes
+    ----------
+    model_kind : ModelsEnum
+        Which model the daemon uses.
+    model_config : str
+        Json file with the model's configuration, relative to the daemon's config folder.
+    """
+
+    model_kind: ModelsEnum
+    model_config: str
+
+
+class RemoteModel(AbstractModel):
+    """
+    Model served by a gpttui daemon, the daemon stores the messages and applies the global rate
+    limit.
+    """
+
+    database: RemoteDB
+
+    def setup(
+        self, config: RemoteConf, session_name: str, database: RemoteDB
+    ) -> "RemoteModel":
+        """
+        Sets the daemon's model.
+
+        Parameters
+        ----------
+        config : RemoteConf
+            Which model the daemon uses.
+        session_name : str
+            Session name.
+        database : RemoteDB
+            Connection with the daemon.
+
+        Returns
+        -------
+        RemoteModel
+            Instance of the model to use as a builder.
+        """
+        self.config = config
+        self.session_name = session_name
+        self.database = database
+        return self
+
+    async def call(self, method: str, **params: Any) -> Any:
+        """
+        Sends a request to the daemon on its own connection, so slow answers don't block the
+        database calls.
+
+        Parameters
+        ----------
+        method : str
+            Requested method.
+        params : Any
+            Keyword arguments of the method.
+
+        Returns
+        -------
+        Any
+            Result.
+        """
+        reader, writer = await asyncio.open_unix_connection(
+            self.database.socket_path, limit=LINE_LIMIT
+        )
+        try:
+            writer.write(encode_line({"id": 0, "method": method, "params": params}))
+            await writer.drain()
+            line = await reader.readline()
+        finally:
+            writer.close()
+        if not line:
+            raise RemoteError("The daemon closed the connection.")
+        return _result(decode_line(line))
+
+    async def generate(self, msgs: Messages) -> str:
+        """
+        Asks the daemon's model to answer some messages, they aren't stored.
+
+        Parameters
+        ----------
+        msgs : Messages
+            Messages to send to the model.
+
+        Returns
+        -------
+        str
+            Response.
+        """
+        return await self.call("generate", msgs=to_wire(msgs), **self.model_params())
+
+    def model_params(self) -> Dict[str, str]:
+        """
+        Identifies the daemon's model of this client.
+
+        Returns
+        -------
+        Dict[str, str]
+            Model kind, configuration, session and context.
+        """
+        return {
+            "model_kind": self.config.model_kind.value,
+            "model_config": self.config.model_config,
+            "session": self.session_name,
+            "context": self.context,
+        }
+
+    async def get_answer(
+        self, message: str, on_text: Optional[Callable[[str], None]] = None
+    ) -> str:
+        """
+        Asks the daemon for an answer, the daemon stores both messages.
+
+        Parameters
+        ----------
+        message : str
+            Input text.
+        on_text : Optional[Callable[[str], None]]
+            Receives the whole answer, the daemon doesn't stream.
+
+        Returns
+        -------
+        str
+            Response.
+        """
+        answer = await self.call("get_answer", message=message, **self.model_params())
+        if on_text is not None:
+            on_text(answer)
+        return answer
+
+    async def resume_requests(self) -> Optional[Tuple[str, str]]:
+        """
+        Asks the daemon to answer the interrupted turn of the session, if any.
+
+        Returns
+        -------
+        Optional[Tuple[str, str]]
+            User message and its response, `None` if nothing was pending.
+        """
+        result = await self.call("resume_requests", **self.model_params())
+        return tuple(result) if result is not None else None
+
+
+def default_socket(config_path: Path) -> Path:
+    """
+    Path of the daemon's socket for a config folder.
+
+    Parameters
+    ----------
+    config_path : Path
+        Folder to save gpttui data.
+
+    Returns
+    -------
+    Path
+        Unix socket.
+    """
+    return config_path / "gpttui.sock"
@@ -0,0 +1,528 @@
+"""
+This module defines the gpttui daemon, it owns the database and the models and serves them to every
+client through a Unix socket, so terminals share warm caches and a single rate limit.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from itertools import count, islice
+from pathlib import Path
+from pydantic import BaseModel
+from gpttui.database.base import (
+    AbstractDB,
+    MessageRecord,
+    Messages,
+    MessageWithTime,
+    RetentionPolicy,
+    TurnMetric,
+    UsageGroupEnum,
+)
+from gpttui.models.base import AbstractModel, ModelsEnum
+from gpttui.models.compaction import Compactor
+from gpttui.server.protocol import (
+    DB_METHODS,
+    LINE_LIMIT,
+    WRITE_METHODS,
+    decode_line,
+    encode_line,
+    to_wire,
+)
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterator,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+)
+
+if TYPE_CHECKING:
+    from gpttui.models.recall import Retriever
+
+
+class RateLimiter:
+    """
+    Token bucket shared by every request to the models, it also bounds the number of concurrent
+    requests.
+
+    Parameters
+    ----------
+    rate : float
+        Requests per second, 0 disables the limit.
+    burst : int
+        Number of requests that can be sent at once after being idle.
+    concurrency : int
+        Maximum number of requests in flight.
+    """
+
+    def __init__(self, rate: float = 0, burst: int = 1, concurrency: int = 4):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """
+        Waits until a request can be sent.
+        """
+        await self.semaphore.acquire()
+        if self.rate <= 0:
+            return
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.updated_at) * self.rate
+                )
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def release(self) -> None:
+        """
+        Marks a request as finished.
+        """
+        self.semaphore.release()
+
+    async def __aenter__(self) -> "RateLimiter":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        self.release()
+
+
+class Daemon:
+    """
+    Serves a database and the models that use it through a Unix socket.
+
+    Attributes
+    ----------
+    database : AbstractDB
+        Database of the models.
+    limiter : RateLimiter
+        Global rate limit for the models.
+    models : OrderedDict[Tuple[ModelsEnum, str, str, str], AbstractModel]
+        Models already built, by kind, config file, session and context, the least recently used
+        first.
+    cursors : Dict[int, Iterator[Any]]
+        Streamed results that clients are still paging through.
+    """
+
+    database: AbstractDB
+    limiter: RateLimiter
+    models: "OrderedDict[Tuple[ModelsEnum, str, str, str], AbstractModel]"
+    cursors: Dict[int, Iterator[Any]]
+
+    def setup(
+        self,
+        database: AbstractDB,
+        config_path: Path,
+        models: Dict[ModelsEnum, Type[AbstractModel]],
+        confs: Dict[ModelsEnum, Type[BaseModel]],
+        load_config: Callable[[Path, Type[BaseModel]], BaseModel],
+        limiter: Optional[RateLimiter] = None,
+        compact_after: int = 0,
+        compact_keep: int = 10,
+        retriever: Optional["Retriever"] = None,
+        max_models: int = 32,
+        open_database: Optional[Callable[[], AbstractDB]] = None,
+    ) -> "Daemon":
+        """
+        Sets up the daemon.
+
+        Parameters
+        ----------
+        database : AbstractDB
+            Database of the models.
+        config_path : Path
+            Folder with the models' configuration files.
+        models : Dict[ModelsEnum, Type[AbstractModel]]
+            Available models.
+        confs : Dict[ModelsEnum, Type[BaseModel]]
+            Configuration of each model.
+        load_config : Callable[[Path, Type[BaseModel]], BaseModel]
+            Reads a configuration file.
+        limiter : Optional[RateLimiter]
+            Global rate limit, unlimited by default.
+        compact_after : int
+            Number of messages that triggers a summarization, 0 disables it.
+        compact_keep : int
+            Number of recent messages that are never summarized.
+        retriever : Optional[Retriever]
+            Recall shared by every model, disabled by default.
+        max_models : int
+            Maximum number of idle models kept, the least recently used ones are closed.
+        open_database : Optional[Callable[[], AbstractDB]]
+            Opens the connection for the database calls of the clients, they run in a worker thread
+            so slow queries don't stall the other clients. By default `database` is used, so it must
+            accept calls from other threads.
+
+        Returns
+        -------
+        Daemon
+            Instance of the daemon to use as a builder.
+        """
+        self.database = database
+        self.config_path = config_path
+        self.model_types = models
+        self.confs = confs
+        self.load_config = load_config
+        self.limiter = limiter if limiter is not None else RateLimiter()
+        self.compact_after = compact_after
+        self.compact_keep = compact_keep
+        self.retriever = retriever
+        self.max_models = max_models
+        self.open_database = open_database
+        self.models = OrderedDict()
+        self.busy: Dict[Tuple[ModelsEnum, str, str, str], int] = {}
+        self.configs: Dict[Tuple[ModelsEnum, str], BaseModel] = {}
+        # NOTE: a single thread keeps the calls of the clients serialized, like a connection.
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="gpttui-db"
+        )
+        self.client_database: Optional[AbstractDB] = None
+        self.cursors = {}
+        self.cursor_ids = count(1)
+        self.writes = 0
+        return self
+
+    @asynccontextmanager
+    async def use_model(
+        self, model_kind: str, model_config: str, session: str, context: str
+    ) -> AsyncIterator[AbstractModel]:
+        """
+        Builds a model, or reuses it if a client already asked for it. It isn't evicted while it's
+        used.
+
+        Parameters
+        ----------
+        model_kind : str
+            Which model to use.
+        model_config : str
+            Json file with the model's configuration.
+        session : str
+            Session name.
+        context : str
+            Context for the model.
+
+        Yields
+        ------
+        AbstractModel
+            Ready to use model.
+        """
+        kind = ModelsEnum(model_kind)
+        key = (kind, model_config, session, context)
+        self.busy[key] = self.busy.get(key, 0) + 1
+        try:
+            yield self.get_model(key)
+        finally:
+            self.busy[key] -= 1
+            if self.busy[key] == 0:
+                del self.busy[key]
+            await self.evict()
+
+    def get_model(self, key: Tuple[ModelsEnum, str, str, str]) -> AbstractModel:
+        """
+        Builds a model, or reuses it and marks it as the most recently used.
+
+        Parameters
+        ----------
+        key : Tuple[ModelsEnum, str, str, str]
+            Kind, config file, session and context of the model.
+
+        Returns
+        -------
+        AbstractModel
+            Ready to use model.
+        """
+        kind, model_config, session, context = key
+        if key in self.models:
+            self.models.move_to_end(key)
+        else:
+            if (kind, model_config) not in self.configs:
+                self.configs[kind, model_config] = self.load_config(
+                    self.config_path / model_config, self.confs[kind]
+                )
+            model = (
+                self.model_types[kind]()
+                .add_context(context=context)
+                .setup(
+                    config=self.configs[kind, model_config],
+                    database=self.database,
+                    session_name=session,
+                )
+            )
+            if self.compact_after > 0:
+                model.add_compactor(
+                    Compactor(
+                        max_messages=self.compact_after,
+                        keep_messages=self.compact_keep,
+                    )
+                )
+            if self.retriever is not None:
+                model.add_retriever(self.retriever)
+            self.models[key] = model
+        return self.models[key]
+
+    async def evict(self) -> None:
+        """
+        Closes the least recently used models that exceed the limit, the ones in use are kept.
+        """
+        idle = [key for key in self.models if key not in self.busy]
+        for key in idle[: max(0, len(self.models) - self.max_models)]:
+            await self.models.pop(key).close()
+
+    def get_database(self) -> AbstractDB:
+        """
+        Finds the connection for the database calls of the clients, it's opened in the worker
+        thread the first time.
+
+        Returns
+        -------
+        AbstractDB
+            Database connection.
+        """
+        if self.client_database is None:
+            if self.open_database is None:
+                self.client_database = self.database
+            else:
+                self.client_database = self.open_database()
+        return self.client_database
+
+    def next_batch(self, cursor: int, batch_size: int) -> Dict[str, Any]:
+        """
+        Reads the next batch of a streamed result, the cursor is closed once it's exhausted.
+
+        Parameters
+        ----------
+        cursor : int
+            Cursor identifier.
+        batch_size : int
+            Maximum number of values.
+
+        Returns
+        -------
+        Dict[str, Any]
+            Serializable batch and the cursor to read the rest, `None` if there's nothing left.
+        """
+        result = self.cursors.pop(cursor)
+        batch = list(islice(result, batch_size))
+        if len(batch) < batch_size:
+            result.close()
+            return {"cursor": None, "batch": to_wire(batch)}
+        self.cursors[cursor] = result
+        return {"cursor": cursor, "batch": to_wire(batch)}
+
+    def close_cursor(self, cursor: int) -> None:
+        """
+        Closes a streamed result that a client stopped reading.
+
+        Parameters
+        ----------
+        cursor : int
+            Cursor identifier.
+        """
+        result = self.cursors.pop(cursor, None)
+        if result is not None:
+            result.close()
+
+    def call_database(self, method: str, params: Dict[str, Any]) -> Any:
+        """
+        Runs a database method for a client, it's called in the worker thread.
+
+        Parameters
+        ----------
+        method : str
+            Name of the `AbstractDB` method.
+        params : Dict[str, Any]
+            Keyword arguments of the method.
+
+        Returns
+        -------
+        Any
+            Serializable result.
+        """
+        if method in ("add_message", "enqueue_request", "complete_request"):
+            if params["msg"] is not None:
+                params["msg"] = MessageWithTime.parse_obj(params["msg"])
+            if params.get("metric") is not None:
+                params["metric"] = TurnMetric(*params["metric"])
+        elif method in ("get_usage", "get_latencies"):
+            params["group"] = UsageGroupEnum(params["group"])
+        elif method == "set_retention" and params["policy"] is not None:
+            params["policy"] = RetentionPolicy(*params["policy"])
+        elif method == "apply_retention":
+            params["default"] = RetentionPolicy(*params["default"])
+        elif method == "add_messages":
+            params["msgs"] = (MessageWithTime.parse_obj(msg) for msg in params["msgs"])
+        result = getattr(self.get_database(), method)(**params)
+        if method in WRITE_METHODS:
+            self.writes += 1
+        elif method == "get_data_version":
+            result += self.writes
+        elif method == "iter_messages":
+            # NOTE: the session is streamed, clients read the rest with `next_batch`.
+            cursor = next(self.cursor_ids)
+            self.cursors[cursor] = result
+            return self.next_batch(cursor, params["batch_size"])
+        elif method == "iter_messages_after":
+            # NOTE: every session can be huge, so clients page through it one batch at a time.
+            batch = list(islice(result, params["batch_size"]))
+            result.close()
+            result = batch
+        return to_wire(result)
+
+    async def call(
+        self, method: str, params: Dict[str, Any], cursors: Optional[Set[int]] = None
+    ) -> Any:
+        """
+        Dispatches a request.
+
+        Parameters
+        ----------
+        method : str
+            Requested method.
+        params : Dict[str, Any]
+            Keyword arguments of the method.
+        cursors : Optional[Set[int]]
+            Streamed results of the client, they're closed when it disconnects.
+
+        Returns
+        -------
+        Any
+            Serializable result.
+        """
+        if method == "ping":
+            return "pong"
+        if method in ("get_answer", "resume_requests", "generate"):
+            async with self.use_model(
+                params["model_kind"],
+                params["model_config"],
+                params["session"],
+                params["context"],
+            ) as model:
+                async with self.limiter:
+                    if method == "get_answer":
+                        return await model.get_answer(params["message"])
+                    if method == "generate":
+                        msgs = [MessageRecord(*msg) for msg in params["msgs"]]
+                        return await model.generate(Messages(values=msgs))
+                    return to_wire(await model.resume_requests())
+        if method in ("next_batch", "close_cursor"):
+            f = partial(getattr(self, method), **params)
+        elif method in DB_METHODS:
+            f = partial(self.call_database, method, params)
+        else:
+            raise ValueError(f"Unknown method {method}.")
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(self.executor, f)
+        if cursors is not None and method in ("iter_messages", "next_batch"):
+            cursors.discard(params.get("cursor"))
+            if result["cursor"] is not None:
+                cursors.add(result["cursor"])
+        elif cursors is not None and method == "close_cursor":
+            cursors.discard(params["cursor"])
+        return result
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """
+        Serves the requests of a client, one at a time.
+
+        Parameters
+        ----------
+        reader : asyncio.StreamReader
+            Incoming requests.
+        writer : asyncio.StreamWriter
+            Outgoing responses.
+        """
+        cursors: Set[int] = set()
+        try:
+            while line := await reader.readline():
+                request = decode_line(line)
+                response: Dict[str, Any] = {"id": request.get("id")}
+                try:
+                    response["result"] = await self.call(
+                        request["method"], request.get("params", {}), cursors
+                    )
+                except Exception as error:
+                    response["error"] = f"{type(error).__name__}: {error}"
+                writer.write(encode_line(response))
+                await writer.drain()
+        except ConnectionError:
+            ...
+        finally:
+            writer.close()
+            try:
+                for cursor in cursors:
+                    self.executor.submit(self.close_cursor, cursor)
+            except RuntimeError:
+                # NOTE: the daemon is shutting down, it closes every cursor itself.
+                ...
+
+    async def serve(self, socket_path: Path) -> None:
+        """
+        Listens on the socket until cancelled.
+
+        Parameters
+        ----------
+        socket_path : Path
+            Unix socket to listen on.
+
+        Raises
+        ------
+        RuntimeError
+            If another daemon is listening on the socket.
+        """
+        if socket_path.exists():
+            try:
+                _, writer = await asyncio.open_unix_connection(str(socket_path))
+            except (ConnectionError, OSError):
+                # NOTE: nothing answers, the socket was left by a daemon that crashed.
+                socket_path.unlink()
+            else:
+                writer.close()
+                raise RuntimeError(f"A daemon is already listening on {socket_path}.")
+        server = await asyncio.start_unix_server(
+            self.handle, path=str(socket_path), limit=LINE_LIMIT
+        )
+        os.chmod(socket_path, 0o600)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if socket_path.exists():
+                socket_path.unlink()
+            for model in self.models.values():
+                await model.close()
+            self.executor.submit(self.close_client_database).result()
+            self.executor.shutdown()
+            self.database.close()
+
+    def close_client_database(self) -> None:
+        """
+        Closes the streamed results and the connection of the clients, it's called in the worker
+        thread.
+        """
+        for cursor in list(self.cursors):
+            self.close_cursor(cursor)
+        if (
+            self.client_database is not None
+            and self.client_database is not self.database
+        ):
+            self.client_database.close()
+        self.client_database = None
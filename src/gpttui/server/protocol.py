@@ -0,0 +1,132 @@
+"""
+This module defines the wire format between the gpttui daemon and its clients: one JSON document per
+line, requests are `{"id", "method", "params"}` and responses are `{"id", "result"}` or
+`{"id", "error"}`. Streamed results are `{"cursor", "batch"}` pages, the rest is read with
+`next_batch` until the cursor is `None`, or released early with `close_cursor`.
+"""
+from pydantic import BaseModel
+from gpttui.codec import dumps, loads
+from gpttui.database.base import Messages
+from typing import Any, Dict
+
+
+LINE_LIMIT = 2**26
+DB_METHODS = {
+    "create_session",
+    "delete_session",
+    "rename_session",
+    "add_message",
+    "add_messages",
+    "enqueue_request",
+    "complete_request",
+    "get_pending_requests",
+    "get_messages",
+    "get_recent_messages",
+    "get_last_message",
+    "get_compactable",
+    "add_summary",
+    "get_remote_state",
+    "get_messages_after",
+    "iter_messages",
+    "iter_messages_after",
+    "get_messages_by_ids",
+    "list_sessions",
+    "get_sessions",
+    "get_usage",
+    "get_latencies",
+    "set_retention",
+    "get_retention",
+    "apply_retention",
+    "vacuum_step",
+    "optimize",
+    "get_inactive_sessions",
+    "archive_session",
+    "restore_session",
+    "get_data_version",
+    "get_last_message_id",
+    "get_lock_stats",
+    "migrate",
+}
+
+# NOTE: the clients share a connection, whose own commits don't change `PRAGMA data_version`, so
+# the daemon counts these calls into the data version that it reports.
+WRITE_METHODS = {
+    "create_session",
+    "delete_session",
+    "rename_session",
+    "add_message",
+    "add_messages",
+    "enqueue_request",
+    "complete_request",
+    "add_summary",
+    "set_retention",
+    "apply_retention",
+    "archive_session",
+    "restore_session",
+    "migrate",
+}
+
+
+class RemoteError(Exception):
+    """
+    Raised by clients when the daemon fails to process a request.
+    """
+
+    ...
+
+
+def to_wire(value: Any) -> Any:
+    """
+    Converts a result into JSON serializable values.
+
+    Parameters
+    ----------
+    value : Any
+        Result of a database or model method.
+
+    Returns
+    -------
+    Any
+        Serializable value, messages become `[role, content]` lists.
+    """
+    if isinstance(value, Messages):
+        return [list(msg) for msg in value.values]
+    if isinstance(value, BaseModel):
+        return value.dict()
+    if isinstance(value, (list, tuple)):
+        return [to_wire(x) for x in value]
+    return value
+
+
+def encode_line(obj: Dict[str, Any]) -> bytes:
+    """
+    Encodes a request or a response.
+
+    Parameters
+    ----------
+    obj : Dict[str, Any]
+        Request or response.
+
+    Returns
+    -------
+    bytes
+        Encoded line.
+    """
+    return dumps(obj) + b"\n"
+
+
+def decode_line(line: bytes) -> Dict[str, Any]:
+    """
+    Decodes a request or a response.
+
+    Parameters
+    ----------
+    line : bytes
+        Encoded line.
+
+    Returns
+    -------
+    Dict[str, Any]
+        Request or response.
+    """
+    return loads(line)
@@ -1,17 +1,23 @@
 """
 This file defines the main TUI App.
 """
-import pyperclip
+import asyncio, gc, time, tracemalloc
+from functools import partial
 from pathlib import Path
 from enum import Enum, auto
-from typing import Any, Type
+from typing import Any, Callable, List, Optional, Tuple, Type, TypeVar
 from textual.app import App, ComposeResult
-from textual.widgets import Input, Markdown, Static
+from textual.widgets import Input, Markdown, OptionList, Static
 from textual.containers import Container
 from textual.events import Key
+from gpttui.database.base import IndexedMessage, Messages as MessagesData
+from gpttui.database.maintenance import Maintainer
 from gpttui.models.base import AbstractModel
+from gpttui.tui.clipboard import code_blocks, copy, paste
 from gpttui.tui.config import KeyBindings
 
+T = TypeVar("T")
+
 
 class ModeEnum(Enum):
     """
@@ -20,6 +26,67 @@ class ModeEnum(Enum):
 
     INSERT = auto()
     NORMAL = auto()
+    SWITCH = auto()
+
+
+class ClearModesEnum(Enum):
+    """
+    This enum represents what happens to the session when the messages are cleared.
+    """
+
+    VIEW = "VIEW"
+    NEW = "NEW"
+    ARCHIVE = "ARCHIVE"
+
+
+def fuzzy_score(query: str, text: str) -> Optional[int]:
+    """
+    Scores how well a query matches a text as a subsequence, lower is better.
+
+    Parameters
+    ----------
+    query : str
+        Characters to look for, in order.
+    text : str
+        Candidate text.
+
+    Returns
+    -------
+    Optional[int]
+        Number of skipped characters between matches, `None` if the query doesn't match.
+    """
+    query, text = query.lower(), text.lower()
+    score, position = 0, 0
+    for char in query:
+        found = text.find(char, position)
+        if found < 0:
+            return None
+        score += found - position
+        position = found + 1
+    return score
+
+
+def fuzzy_filter(query: str, candidates: List[str]) -> List[str]:
+    """
+    Filters and sorts candidates by their fuzzy score, keeping the original order on ties.
+
+    Parameters
+    ----------
+    query : str
+        Characters to look for.
+    candidates : List[str]
+        Candidate texts.
+
+    Returns
+    -------
+    List[str]
+        Matching candidates, the best match first.
+    """
+    scored = [(fuzzy_score(query, candidate), candidate) for candidate in candidates]
+    matches = [
+        (score, i, c) for i, (score, c) in enumerate(scored) if score is not None
+    ]
+    return [candidate for _, _, candidate in sorted(matches)]
 
 
 class NormalIndicator(Static):
@@ -54,7 +121,113 @@ class Prompt(Static):
     def compose(self) -> ComposeResult:
         yield NormalIndicator("NORMAL", id="normal-indicator")
         yield InsertIndicator("INSERT", id="insert-indicator")
-        yield Input(placeholder="Enter some text...")
+        yield Input(placeholder="Enter some text...", id="prompt-input")
+
+
+class SessionSwitcher(Static):
+    """
+    Fuzzy finder to switch between sessions.
+
+    Parameters
+    ----------
+    sessions : List[str]
+        Available sessions, the most recent first.
+    """
+
+    DEFAULT_CSS = """
+    SessionSwitcher {
+        display: none;
+        dock: bottom;
+        height: auto;
+        max-height: 50%;
+    }
+
+    .switch-mode SessionSwitcher {
+        display: block;
+    }
+    """
+
+    sessions: List[str] = []
+
+    def compose(self) -> ComposeResult:
+        """
+        Generator with the switcher components.
+
+        Yields
+        ------
+        ComposeResult
+            Widgets in the switcher.
+        """
+        yield OptionList(id="switcher-options")
+        yield Input(placeholder="Search a session...", id="switcher-input")
+
+    def load(self, sessions: List[str]):
+        """
+        Sets the available sessions and clears the search.
+
+        Parameters
+        ----------
+        sessions : List[str]
+            Available sessions, the most recent first.
+        """
+        self.sessions = sessions
+        self.query_one("#switcher-input", Input).value = ""
+        self.show(sessions)
+
+    def show(self, sessions: List[str]):
+        """
+        Displays the given sessions.
+
+        Parameters
+        ----------
+        sessions : List[str]
+            Sessions to display.
+        """
+        options = self.query_one(OptionList)
+        options.clear_options()
+        options.add_options(sessions)
+        options.highlighted = 0 if sessions else None
+
+    def on_input_changed(self, event: Input.Changed) -> None:
+        """
+        Filters the sessions when the search changes.
+
+        Parameters
+        ----------
+        event : Input.Changed
+            Event with the new search.
+        """
+        self.show(fuzzy_filter(event.value, self.sessions))
+
+    def move(self, step: int):
+        """
+        Moves the highlighted session.
+
+        Parameters
+        ----------
+        step : int
+            Positive to move down, negative to move up.
+        """
+        options = self.query_one(OptionList)
+        if step > 0:
+            options.action_cursor_down()
+        else:
+            options.action_cursor_up()
+
+    def selected(self) -> Optional[str]:
+        """
+        Gets the highlighted session, or the search text to create a new one.
+
+        Returns
+        -------
+        Optional[str]
+            Session name, `None` if there is nothing to select.
+        """
+        options = self.query_one(OptionList)
+        if options.highlighted is not None:
+            return str(options.get_option_at_index(options.highlighted).prompt)
+        query = self.query_one("#switcher-input", Input).value.strip()
+        return query or None
 
 
 class UserText(Static):
@@ -121,6 +294,43 @@ class Messages(Container):
         self.mount(Message(user=user, message=msg))
         self.scroll_end()
 
+    def load_messages(self, msgs: MessagesData):
+        """
+        Replaces the displayed messages with the history of a session.
+
+        Parameters
+        ----------
+        msgs : MessagesData
+            Messages of the session.
+        """
+        self.remove_children()
+        users = {"user": "User", "assistant": "Assistant"}
+        self.mount_all(
+            Message(user=users[msg.role], message=msg.content)
+            for msg in msgs.values
+            if msg.role in users
+        )
+        self.scroll_end()
+
+    def append_messages(self, msgs: List[IndexedMessage]):
+        """
+        Shows the messages that were stored elsewhere after the displayed ones.
+
+        Parameters
+        ----------
+        msgs : List[IndexedMessage]
+            New user and assistant messages of the session.
+        """
+        if not msgs:
+            return
+        users = {"user": "User", "assistant": "Assistant"}
+        self.mount_all(
+            Message(user=users[msg.role], message=msg.content)
+            for msg in msgs
+            if msg.role in users
+        )
+        self.scroll_end()
+
 
 class GptApp(App):
     """
@@ -142,27 +352,46 @@ class GptApp(App):
         Mapping between a keybinding and its function in normal mode.
     insert_commands : str
         Mapping between a keybinding and its function in insert mode.
+    maintainer : Optional[Maintainer]
+        Maintenance of the database while the user is idle.
+    sync_every : float
+        Seconds between the checks for messages stored by other instances, 0 disables them.
     """
 
     CSS_PATH: Path
     KEYBINDINGS: KeyBindings
     model: AbstractModel
+    maintainer: Optional[Maintainer] = None
+    sync_every: float = 0
 
     def __init__(self, *args: Any, **kwargs: Any):
         super(GptApp, self).__init__(*args, **kwargs)
         self.mode = ModeEnum.NORMAL
+        self.count = ""
+        self.turns = 0
+        self.data_version: Optional[int] = None
+        self.last_id = 0
+        self.traces_memory = False
         self.normal_commands = {
             self.KEYBINDINGS.insert: self.insert,
             self.KEYBINDINGS.quit: self.quit,
             self.KEYBINDINGS.yank: self.yank,
+            self.KEYBINDINGS.yank_code: self.yank_code,
             self.KEYBINDINGS.paste: self.paste,
             self.KEYBINDINGS.clear: self.clear,
             self.KEYBINDINGS.delete: self.delete,
+            self.KEYBINDINGS.switch: self.switch,
         }
         self.insert_commands = {
             self.KEYBINDINGS.normal: self.normal,
             self.KEYBINDINGS.send: self.send,
         }
+        self.switch_commands = {
+            self.KEYBINDINGS.normal: self.close_switcher,
+            self.KEYBINDINGS.send: self.select_session,
+            "up": lambda: self.move_switcher(-1),
+            "down": lambda: self.move_switcher(1),
+        }
 
     @classmethod
     def setup_cls(cls, css_path: Path, keybindings: KeyBindings) -> Type["GptApp"]:
@@ -170,7 +399,14 @@ class GptApp(App):
         cls.KEYBINDINGS = keybindings
         return cls
 
-    def setup(self, model: AbstractModel) -> "GptApp":
+    def setup(
+        self,
+        model: AbstractModel,
+        clear_mode: ClearModesEnum = ClearModesEnum.VIEW,
+        debug: bool = False,
+        maintainer: Optional[Maintainer] = None,
+        sync_every: float = 0,
+    ) -> "GptApp":
         """
         Setups the App.
 
@@ -178,6 +414,15 @@ class GptApp(App):
         ----------
         model : AbstractModel
             Specifies the model to use.
+        clear_mode : ClearModesEnum
+            What happens to the session when the messages are cleared.
+        debug : bool
+            Whether to report the memory reclaimed by clearing the messages and the waits for the
+            database lock.
+        maintainer : Optional[Maintainer]
+            Maintenance of the database while the user is idle, it's disabled if `None`.
+        sync_every : float
+            Seconds between the checks for messages stored by other instances, 0 disables them.
 
         Returns
         -------
@@ -185,6 +430,14 @@ class GptApp(App):
             Instance of the app to use as a builder.
         """
         self.model = model
+        self.clear_mode = clear_mode
+        self.debug_memory = debug
+        self.maintainer = maintainer
+        self.sync_every = sync_every
+        # NOTE: the tracing is only stopped on exit if the app started it.
+        self.traces_memory = debug and not tracemalloc.is_tracing()
+        if self.traces_memory:
+            tracemalloc.start()
         return self
 
     def compose(self) -> ComposeResult:
@@ -197,8 +450,159 @@ class GptApp(App):
             TUI components.
         """
         yield Prompt()
+        yield SessionSwitcher()
         yield Messages()
 
+    async def on_mount(self) -> None:
+        """
+        Callback that is called when the app starts, it catches up the recall index, resumes the
+        interrupted turn of the session, upgrades the database in the background, and starts its
+        maintenance and the checks for messages of other instances.
+        """
+        if self.model.retriever is not None:
+            self.model.retriever.schedule(self.model.database)
+        self.run_worker(self.resume(show_user=True), exit_on_error=False)
+        self.migrations = self.set_interval(0.05, self.migrate)
+        if self.maintainer is not None:
+            self.set_interval(1, self.maintain)
+        if self.sync_every > 0:
+            self.data_version = await self.run_db(self.model.database.get_data_version)
+            await self.mark_synced()
+            self.set_interval(self.sync_every, self.sync)
+
+    def on_unmount(self) -> None:
+        """
+        Callback that is called when the app exits, it stops the memory tracing that it started.
+        """
+        if self.traces_memory:
+            tracemalloc.stop()
+            self.traces_memory = False
+
+    async def run_db(self, function: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        Runs a database call, in another thread if the database allows it, so the round trips to a
+        daemon don't stall the event loop.
+
+        Parameters
+        ----------
+        function : Callable[..., T]
+            Method of the database, or a function that uses it.
+        args : Any
+            Positional arguments of the function.
+        kwargs : Any
+            Keyword arguments of the function.
+
+        Returns
+        -------
+        T
+            Result of the function.
+        """
+        if not self.model.database.thread_safe:
+            return function(*args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(
+            None, partial(function, *args, **kwargs)
+        )
+
+    async def migrate(self):
+        """
+        Runs a batch of the pending database migrations, the timer stops once they're done.
+        """
+        try:
+            pending = await self.run_db(self.model.database.migrate)
+        except Exception:
+            # NOTE: a failed batch is retried later, like the maintenance.
+            return
+        if pending == 0:
+            self.migrations.stop()
+
+    async def maintain(self):
+        """
+        Runs a step of the database maintenance if the user is idle.
+        """
+        try:
+            await self.run_db(self.maintainer.step, self.model.database)
+        except Exception:
+            # NOTE: a failed step is retried later, maintenance must never break the chat.
+            ...
+
+    async def mark_synced(self):
+        """
+        Remembers the last stored message once the view shows the session, only the messages stored
+        after it are shown by the checks.
+        """
+        if self.sync_every > 0:
+            self.last_id = await self.run_db(self.model.database.get_last_message_id)
+
+    def read_new(self, after_id: int) -> Tuple[int, int, List[IndexedMessage]]:
+        """
+        Reads the messages that were stored after the given one.
+
+        Parameters
+        ----------
+        after_id : int
+            Last message that was already read.
+
+        Returns
+        -------
+        Tuple[int, int, List[IndexedMessage]]
+            Data version of the database, last read message and the new messages of the session.
+        """
+        database = self.model.database
+        data_version = database.get_data_version()
+        if data_version == self.data_version:
+            return data_version, after_id, []
+        msgs = []
+        for msg in database.iter_messages_after(after_id):
+            after_id = msg.id
+            if msg.session_name == self.model.session_name:
+                msgs.append(msg)
+        return data_version, after_id, msgs
+
+    async def sync(self):
+        """
+        Shows the messages that other instances stored in the session after the displayed ones. The
+        new messages are only read when the data version of the database changes, and never while a
+        turn is answered, so writes to other sessions, retention and archiving leave the view as it
+        is.
+        """
+        if self.turns > 0:
+            return
+        session_name = self.model.session_name
+        try:
+            data_version, last_id, msgs = await self.run_db(self.read_new, self.last_id)
+        except Exception:
+            # NOTE: a failed check is retried later, like the maintenance.
+            return
+        # NOTE: a turn or a switch that started meanwhile shows these messages itself.
+        if self.turns > 0 or session_name != self.model.session_name:
+            return
+        self.data_version = data_version
+        self.last_id = last_id
+        self.query_one(Messages).append_messages(msgs)
+
+    async def resume(self, show_user: bool):
+        """
+        Answers the turn of the session that was interrupted and shows it.
+
+        Parameters
+        ----------
+        show_user : bool
+            Whether the user message must be shown, it isn't when the history is already loaded.
+        """
+        self.turns += 1
+        try:
+            turn = await self.model.resume_requests()
+        finally:
+            self.turns -= 1
+            if self.turns == 0:
+                await self.mark_synced()
+        if turn is None:
+            return
+        messages = self.query_one(Messages)
+        if show_user:
+            messages.add_message(msg=turn[0], user="User")
+        messages.add_message(msg=turn[1], user="Assistant")
+
     async def on_key(self, event: Key) -> None:
         """
         Callback that is called when a key is pressed.
@@ -208,10 +612,14 @@ class GptApp(App):
         event : Key
             Event related to the key that was pressed.
         """
+        if self.maintainer is not None:
+            self.maintainer.touch()
         if self.mode == ModeEnum.NORMAL:
             await self.handle_normal(event)
         elif self.mode == ModeEnum.INSERT:
             await self.handle_insert(event)
+        elif self.mode == ModeEnum.SWITCH:
+            await self.handle_switch(event)
 
     async def handle_normal(self, event: Key) -> None:
         """
@@ -225,6 +633,23 @@ class GptApp(App):
         f = self.normal_commands.get(event.key)
         if f is not None:
             await f()
+            self.count = ""
+        elif event.key.isdigit() and (self.count or event.key != "0"):
+            self.count += event.key
+        else:
+            self.count = ""
+
+    def pop_count(self) -> int:
+        """
+        Consumes the count typed before a command, as in vi.
+
+        Returns
+        -------
+        int
+            Count, 1 if none was typed.
+        """
+        count, self.count = int(self.count or 1), ""
+        return count
 
     async def handle_insert(self, event: Key) -> None:
         """
@@ -239,46 +664,139 @@ class GptApp(App):
         if f is not None:
             await f()
 
+    async def handle_switch(self, event: Key) -> None:
+        """
+        Determines what to do in the session switcher.
+
+        Parameters
+        ----------
+        event : Key
+            Event related to the key that was pressed.
+        """
+        f = self.switch_commands.get(event.key)
+        if f is not None:
+            await f()
+
     async def insert(self):
         """
         Changes to insert mode.
         """
         self.add_class("insert-mode")
-        self.query_one(Input).focus()
+        self.query_one("#prompt-input", Input).focus()
         self.mode = ModeEnum.INSERT
 
     async def clear(self):
         """
-        Clears the historical messages.
+        Removes the displayed messages, depending on the clear mode the conversation continues in a
+        new session, or the current one is archived and restarted.
+        """
+        if self.debug_memory:
+            before = tracemalloc.get_traced_memory()[0]
+        messages = self.query_one(Messages)
+        n_widgets = len(messages.query(Message))
+        await messages.remove_children()
+        session_name = self.model.session_name
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        database = self.model.database
+        try:
+            if self.clear_mode == ClearModesEnum.NEW:
+                self.model.session_name = await self.unused_name(
+                    f"{session_name}-{stamp}"
+                )
+                await self.run_db(
+                    database.create_session, session_name=self.model.session_name
+                )
+            elif self.clear_mode == ClearModesEnum.ARCHIVE:
+                # NOTE: a session without a conversation has nothing worth archiving.
+                last = await self.run_db(
+                    database.get_last_message, session_name, "user"
+                )
+                if last is not None:
+                    archive_name = await self.unused_name(f"{session_name}@{stamp}")
+                    await self.run_db(
+                        database.rename_session, session_name, archive_name
+                    )
+                    await self.run_db(
+                        database.create_session, session_name=session_name
+                    )
+        except Exception as e:
+            # NOTE: another instance may have taken the name, the session is kept as it is.
+            self.model.session_name = session_name
+            self.notify(f"The session couldn't be cleared: {e}", severity="error")
+        if self.debug_memory:
+            gc.collect()
+            reclaimed = (before - tracemalloc.get_traced_memory()[0]) / 2**20
+            self.notify(f"Removed {n_widgets} messages, reclaimed {reclaimed:.1f} MiB")
+
+    async def unused_name(self, name: str) -> str:
         """
-        self.query_one(Messages)  # TODO
+        Finds a session name that isn't taken, a counter is appended to the given one if needed.
+
+        Parameters
+        ----------
+        name : str
+            Preferred name.
+
+        Returns
+        -------
+        str
+            Name of no existing session.
+        """
+        sessions = set(await self.run_db(self.model.database.list_sessions))
+        candidate, i = name, 1
+        while candidate in sessions:
+            i += 1
+            candidate = f"{name}-{i}"
+        return candidate
 
     async def yank(self):
         """
-        Copies the last message into the clipboard.
+        Copies an answer into the clipboard, the last one or the n-th last one if a count was typed.
+        """
+        answer = await self.run_db(
+            self.model.database.get_last_message,
+            self.model.session_name,
+            "assistant",
+            offset=self.pop_count() - 1,
+        )
+        if answer is not None:
+            await copy(answer)
+
+    async def yank_code(self):
+        """
+        Copies the code blocks of an answer into the clipboard, the last one or the n-th last one if
+        a count was typed.
         """
-        msgs = self.model.database.get_messages(self.model.session_name)
-        pyperclip.copy(msgs.values[-1].content)
+        answer = await self.run_db(
+            self.model.database.get_last_message,
+            self.model.session_name,
+            "assistant",
+            offset=self.pop_count() - 1,
+        )
+        blocks = code_blocks(answer) if answer is not None else []
+        if blocks:
+            await copy("\n".join(blocks))
 
     async def paste(self):
         """
         Pastes the clipboard into the prompt.
         """
-        clipboard_text = pyperclip.paste()
-        self.query_one(Input).insert_text_at_cursor(clipboard_text)
+        clipboard_text = await paste()
+        self.query_one("#prompt-input", Input).insert_text_at_cursor(clipboard_text)
 
     async def normal(self):
         """
         Switch to normal mode.
         """
         self.remove_class("insert-mode")
-        self.query_one(Input).reset_focus()
+        self.query_one("#prompt-input", Input).reset_focus()
         self.mode = ModeEnum.NORMAL
 
     async def quit(self):
         """
         Exit the app.
         """
+        await self.model.close()
         self.model.database.close()
         self.exit()
 
@@ -286,7 +804,7 @@ class GptApp(App):
         """
         Deletes the prompt.
         """
-        inp = self.query_one(Input)
+        inp = self.query_one("#prompt-input", Input)
         inp.action_delete_right_all()
         inp.action_delete_left_all()
 
@@ -294,11 +812,74 @@ class GptApp(App):
         """
         Sends the text in the prompt to the model and shows the response.
         """
-        inp = self.query_one(Input)
+        inp = self.query_one("#prompt-input", Input)
         text = inp.value
         messages = self.query_one(Messages)
         inp.action_delete_right_all()
         inp.action_delete_left_all()
-        messages.add_message(msg=text, user="User")
-        answer = await self.model.get_answer(text)
+        # NOTE: messages of other instances are shown before the turn, its own aren't shown again.
+        await self.sync()
+        self.turns += 1
+        try:
+            messages.add_message(msg=text, user="User")
+            locks = await self.run_db(self.model.database.get_lock_stats)
+            answer = await self.model.get_answer(text)
+        finally:
+            self.turns -= 1
+            if self.turns == 0:
+                await self.mark_synced()
         messages.add_message(msg=answer, user="Assistant")
+        if self.maintainer is not None:
+            self.maintainer.touch()
+        if self.debug_memory:
+            waited = (
+                await self.run_db(self.model.database.get_lock_stats)
+            ).wait_ms - locks.wait_ms
+            if waited >= 1:
+                self.notify(f"Waited {waited:.0f} ms for the database lock")
+
+    async def switch(self):
+        """
+        Opens the session switcher.
+        """
+        sessions = [
+            info.name for info in await self.run_db(self.model.database.get_sessions)
+        ]
+        switcher = self.query_one(SessionSwitcher)
+        switcher.load(sessions)
+        self.add_class("switch-mode")
+        switcher.query_one("#switcher-input", Input).focus()
+        self.mode = ModeEnum.SWITCH
+
+    async def close_switcher(self):
+        """
+        Closes the session switcher and goes back to normal mode.
+        """
+        self.remove_class("switch-mode")
+        self.set_focus(None)
+        self.mode = ModeEnum.NORMAL
+
+    async def move_switcher(self, step: int):
+        """
+        Moves the highlighted session in the switcher.
+
+        Parameters
+        ----------
+        step : int
+            Positive to move down, negative to move up.
+        """
+        self.query_one(SessionSwitcher).move(step)
+
+    async def select_session(self):
+        """
+        Swaps the active session with the one selected in the switcher.
+        """
+        session_name = self.query_one(SessionSwitcher).selected()
+        await self.close_switcher()
+        if session_name is None or session_name == self.model.session_name:
+            return
+        self.model.session_name = session_name
+        msgs = await self.run_db(self.model.last_messages)
+        self.query_one(Messages).load_messages(msgs)
+        await self.mark_synced()
+        self.run_worker(self.resume(show_user=False), exit_on_error=False)
@@ -0,0 +1,97 @@
+"""
+This file defines the CLI options in the archive subcommand.
+"""
+import os, time
+from pathlib import Path
+from click import option, command, echo, ClickException
+from gpttui.database.base import DatabasesEnum
+from gpttui.tui.registry import setup_database
+from typing import Tuple
+
+
+@command()
+@option(
+    "--database_kind",
+    type=DatabasesEnum,
+    default=DatabasesEnum.SQLITE,
+    help="Database that stores the messages.",
+)
+@option(
+    "--database_name",
+    type=str,
+    default="database.sqlite",
+    help="Connection string for the database.",
+)
+@option(
+    "--config_path",
+    type=Path,
+    default=Path(os.environ["HOME"]) / ".config/gpttui",
+    help="Folder to save gpttui data.",
+)
+@option(
+    "--days",
+    type=int,
+    default=90,
+    help="Archive the sessions that haven't been updated in this many days.",
+)
+@option(
+    "--session",
+    type=str,
+    multiple=True,
+    help="Archive this session regardless of its age, it can be repeated.",
+)
+@option(
+    "--restore",
+    type=str,
+    multiple=True,
+    help="Restore this session instead, it can be repeated.",
+)
+def archive(
+    database_kind: DatabasesEnum,
+    database_name: str,
+    config_path: Path,
+    days: int,
+    session: Tuple[str, ...],
+    restore: Tuple[str, ...],
+) -> None:
+    """
+    Moves the messages of old sessions into compressed archives, they're restored automatically the
+    next time the session is opened.
+
+    Parameters
+    ----------
+    database_kind : DatabasesEnum
+        Which database to use.
+    database_name : str
+        Connection string to the database.
+    config_path : Path
+        Folder to save gpttui data.
+    days : int
+        Days without updates before a session is archived.
+    session : Tuple[str, ...]
+        Sessions to archive regardless of their age.
+    restore : Tuple[str, ...]
+        Sessions to restore.
+    """
+    db = setup_database(database_kind, database_name, config_path)
+    missing = set(session + restore) - set(db.list_sessions())
+    if missing:
+        db.close()
+        raise ClickException(f"Sessions {', '.join(sorted(missing))} don't exist.")
+    if restore:
+        for name in restore:
+            echo(f"{name}: {db.restore_session(name)} messages restored")
+        db.close()
+        return
+    names = list(session) or db.get_inactive_sessions(int(time.time()) - days * 86400)
+    archived = 0
+    for name in names:
+        count = db.archive_session(name)
+        if count > 0:
+            archived += 1
+            echo(f"{name}: {count} messages archived")
+    # NOTE: the pages of the archived messages are returned to the file system right away.
+    if archived > 0:
+        db.vacuum_step(2**31 - 1)
+    db.close()
+    echo(f"Archived sessions: {archived}")
@@ -0,0 +1,123 @@
+"""
+This file defines the CLI options in the ask subcommand, it must not import the TUI so it starts
+fast in shell pipes.
+"""
+import asyncio, os, sys
+from pathlib import Path
+from click import argument, option, command, echo, ClickException
+from gpttui.database.base import DatabasesEnum
+from gpttui.models.base import ModelsEnum
+from gpttui.tui.config import config_file, config_folder
+from gpttui.tui.registry import model_types, setup_database
+from typing import Tuple
+
+
+def write(text: str) -> None:
+    """
+    Writes a piece of the answer as soon as it arrives.
+
+    Parameters
+    ----------
+    text : str
+        Piece of the answer.
+    """
+    sys.stdout.write(text)
+    sys.stdout.flush()
+
+
+@command()
+@argument("prompt", nargs=-1)
+@option(
+    "--database_kind",
+    type=DatabasesEnum,
+    default=DatabasesEnum.SQLITE,
+    help="Database to store the messages.",
+)
+@option(
+    "--database_name",
+    type=str,
+    default="database.sqlite",
+    help="Connection string for the database.",
+)
+@option("--session", type=str, default="ask", help="Session (chat) to append to.")
+@option(
+    "--model_kind",
+    type=ModelsEnum,
+    default=ModelsEnum.OPENAI,
+    help="Which model to use.",
+)
+@option(
+    "--context",
+    type=str,
+    default="You are an AI assistant",
+    help="Context for the model.",
+)
+@option(
+    "--config_path",
+    type=Path,
+    default=Path(os.environ["HOME"]) / ".config/gpttui",
+    help="Folder to save gpttui data.",
+)
+@option(
+    "--model_config", type=str, default="openai.json", help="Context for the model."
+)
+def ask(
+    prompt: Tuple[str, ...],
+    database_kind: DatabasesEnum,
+    database_name: str,
+    session: str,
+    model_kind: ModelsEnum,
+    context: str,
+    config_path: Path,
+    model_config: str,
+) -> None:
+    """
+    Asks a single question and streams the answer to stdout, the text piped into stdin is appended
+    to the prompt, e.g. `git diff | gpttui ask "review this"`.
+
+    Parameters
+    ----------
+    prompt : Tuple[str, ...]
+        Words of the prompt.
+    database_kind : DatabasesEnum
+        Which database to use.
+    database_name : str
+        Connection string to the database.
+    session : str
+        Session name.
+    model_kind : ModelsEnum
+        Which model to use.
+    context : str
+        Context for the model.
+    config_path : Path
+        Folder to save gpttui data.
+    model_config : str
+        Json file with the model's configuration.
+    """
+    message = " ".join(prompt)
+    if not sys.stdin.isatty():
+        piped = sys.stdin.read()
+        message = f"{message}\n\n{piped}" if message else piped
+    if not message.strip():
+        raise ClickException("Nothing to ask, pass a prompt or pipe some text.")
+    model_type, conf_type = model_types(model_kind)
+    cfg = config_file(config_folder(config_path) / model_config, conf_type)
+    db = setup_database(database_kind, database_name, config_path)
+    db.create_session(session_name=session)
+    model = (
+        model_type()
+        .add_context(context=context)
+        .setup(config=cfg, database=db, session_name=session)
+    )
+
+    async def run() -> None:
+        try:
+            await model.get_answer(message, on_text=write)
+        finally:
+            await model.close()
+
+    try:
+        asyncio.run(run())
+    finally:
+        db.close()
+    echo()
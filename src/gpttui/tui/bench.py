@@ -0,0 +1,86 @@
+"""
+This file defines the CLI options in the bench subcommand.
+"""
+import asyncio
+from pathlib import Path
+from click import option, command, echo
+from gpttui.codec import dumps, loads
+from gpttui.tui.benchmark import Benchmark, compare
+from typing import Optional
+
+
+@command()
+@option(
+    "--lengths",
+    type=str,
+    default="0,50,200",
+    help="Comma separated session lengths (displayed messages) to measure.",
+)
+@option("--repeat", type=int, default=10, help="Prompts sent for each session length.")
+@option(
+    "--markdown_lines",
+    type=int,
+    default=400,
+    help="Lines of the long Markdown answer.",
+)
+@option(
+    "--memory_messages",
+    type=int,
+    default=50,
+    help="Messages mounted to measure the memory per message.",
+)
+@option(
+    "--output",
+    type=Path,
+    default=Path("gpttui-bench.json"),
+    help="Json file to write the report.",
+)
+@option(
+    "--baseline",
+    type=Path,
+    default=None,
+    help="Report to compare with, e.g. from the previous release.",
+)
+def bench(
+    lengths: str,
+    repeat: int,
+    markdown_lines: int,
+    memory_messages: int,
+    output: Path,
+    baseline: Optional[Path],
+) -> None:
+    """
+    Measures the latency of the TUI headlessly, with a model that answers instantly.
+
+    Parameters
+    ----------
+    lengths : str
+        Comma separated session lengths.
+    repeat : int
+        Prompts sent for each session length.
+    markdown_lines : int
+        Lines of the long Markdown answer.
+    memory_messages : int
+        Messages mounted to measure the memory per message.
+    output : Path
+        Json file to write the report.
+    baseline : Optional[Path]
+        Report to compare with.
+    """
+    report = asyncio.run(
+        Benchmark(
+            lengths=[int(length) for length in lengths.split(",") if length],
+            repeat=repeat,
+            markdown_lines=markdown_lines,
+            memory_messages=memory_messages,
+        ).run()
+    )
+    output.write_bytes(dumps(report))
+    for group, metrics in report["results"].items():
+        for name, value in metrics.items():
+            echo(f"{group + '.' + name:<40}  {value:>12.1f}")
+    echo(f"Report written to {output}")
+    if baseline is not None:
+        echo(f"\n{'METRIC':<40}  {'BASELINE':>12}  {'CURRENT':>12}  CHANGE")
+        for name, old, new, change in compare(report, loads(baseline.read_bytes())):
+            echo(f"{name:<40}  {old:>12.1f}  {new:>12.1f}  {change:+.1%}")
@@ -0,0 +1,466 @@
+"""
+This module defines a headless benchmark of the TUI, it drives the app with a fake model and
+measures the latency from a keypress to the frame that paints the answer.
+"""
+import asyncio, gc, math, platform, sys, tempfile, time, tracemalloc
+from importlib import metadata
+from pathlib import Path
+from pydantic import BaseModel
+from rich.console import RenderableType
+from textual.pilot import Pilot, WaitForScreenTimeout
+from textual.screen import Screen
+from textual.widgets import Input
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from gpttui.database.base import AbstractDB, MessageRecord
+from gpttui.database.base import Messages as MessagesData
+from gpttui.database.sqlite import SqliteDB
+from gpttui.models.base import AbstractModel
+from gpttui.tui.app import GptApp, Message, Messages
+from gpttui.tui.config import DEFAULT_KEYBINDINGS, css_config
+
+SHORT_ANSWER = "Use `print`:\n\n```python\nprint('Hello, World!')\n```"
+HISTORY_MESSAGE = (
+    "Message {i} with **bold** text, `inline code` and a [link](https://example.com)."
+)
+
+
+def long_markdown(lines: int) -> str:
+    """
+    Markdown answer with headings, paragraphs, lists, tables and code blocks.
+
+    Parameters
+    ----------
+    lines : int
+        Approximate number of lines.
+
+    Returns
+    -------
+    str
+        Markdown text.
+    """
+    section = [
+        "## Section {i}",
+        "",
+        "Some text with **bold**, *italics* and `code` that wraps around the screen "
+        * 2,
+        "",
+        "- first item",
+        "- second item with `code`",
+        "",
+        "| name | value |",
+        "| ---- | ----- |",
+        "| a    | {i}   |",
+        "",
+        "```python",
+        "def f(x: int) -> int:",
+        "    return x * {i}",
+        "```",
+        "",
+    ]
+    n = max(1, math.ceil(lines / len(section)))
+    return "\n".join(line.format(i=i) for i in range(n) for line in section)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """
+    Percentile with linear interpolation.
+
+    Parameters
+    ----------
+    values : List[float]
+        Samples.
+    q : float
+        Percentile between 0 and 100.
+
+    Returns
+    -------
+    float
+        Percentile, `nan` if there are no samples.
+    """
+    if not values:
+        return math.nan
+    values = sorted(values)
+    pos = (len(values) - 1) * q / 100
+    low = math.floor(pos)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (pos - low)
+
+
+class BenchModel(AbstractModel):
+    """
+    Model that answers instantly, so the benchmark only measures gpttui.
+
+    Attributes
+    ----------
+    answer : str
+        Text of every answer.
+    """
+
+    answer: str = SHORT_ANSWER
+
+    def setup(
+        self, config: Optional[BaseModel], session_name: str, database: AbstractDB
+    ) -> "BenchModel":
+        """
+        Initializes the model.
+
+        Parameters
+        ----------
+        config : Optional[BaseModel]
+            Unused.
+        session_name : str
+            Session name.
+        database : AbstractDB
+            Database to store the messages.
+
+        Returns
+        -------
+        BenchModel
+            Instance of the model to be used as a builder.
+        """
+        self.config = config
+        self.session_name = session_name
+        self.database = database
+        return self
+
+    async def generate(self, msgs: MessagesData) -> str:
+        return self.answer
+
+
+class BenchApp(GptApp):
+    """
+    App that timestamps the frame that first shows a widget.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super(BenchApp, self).__init__(*args, **kwargs)
+        self.target: Optional[Callable[[], Optional[Message]]] = None
+        self.painted = asyncio.Event()
+        self.painted_at = 0.0
+
+    def expect(self, target: Callable[[], Optional[Message]]) -> None:
+        """
+        Starts waiting for a widget.
+
+        Parameters
+        ----------
+        target : Callable[[], Optional[Message]]
+            Finds the widget, `None` while it isn't mounted.
+        """
+        self.painted.clear()
+        self.target = target
+
+    def _display(self, screen: Screen, renderable: Optional[RenderableType]) -> None:
+        # NOTE: every frame ends here, even in headless mode where nothing is written.
+        super(BenchApp, self)._display(screen, renderable)
+        if self.target is None or renderable is None:
+            return
+        widget = self.target()
+        if widget is not None and widget.region.height > 0:
+            self.painted_at = time.perf_counter()
+            self.target = None
+            self.painted.set()
+
+
+class StallMonitor:
+    """
+    Measures how long the event loop is blocked, no frame can be painted meanwhile.
+
+    Parameters
+    ----------
+    interval : float
+        Seconds between the checks.
+    """
+
+    def __init__(self, interval: float = 0.001):
+        self.interval = interval
+        self.max_stall = 0.0
+        self.task: Optional[asyncio.Task] = None
+
+    async def run(self) -> None:
+        last = time.perf_counter()
+        while True:
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            self.max_stall = max(self.max_stall, now - last - self.interval)
+            last = now
+
+    def __enter__(self) -> "StallMonitor":
+        self.task = asyncio.get_running_loop().create_task(self.run())
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        if self.task is not None:
+            self.task.cancel()
+
+
+async def settle(pilot: Pilot) -> float:
+    """
+    Waits until the app processed every pending message, long sessions can take longer than the
+    pilot's timeout.
+
+    Parameters
+    ----------
+    pilot : Pilot
+        Pilot of the app.
+
+    Returns
+    -------
+    float
+        Elapsed seconds.
+    """
+    start = time.perf_counter()
+    while True:
+        try:
+            await pilot.pause()
+            return time.perf_counter() - start
+        except WaitForScreenTimeout:
+            ...
+
+
+async def send(app: BenchApp, text: str, timeout: float) -> float:
+    """
+    Sends a prompt with the enter key and waits for the frame that shows the answer.
+
+    Parameters
+    ----------
+    app : BenchApp
+        Running app in insert mode.
+    text : str
+        Prompt.
+    timeout : float
+        Maximum seconds to wait.
+
+    Returns
+    -------
+    float
+        Seconds from the keypress to the frame.
+    """
+    messages = app.query_one(Messages)
+    n = len(messages.children)
+
+    def answer() -> Optional[Message]:
+        children = messages.children
+        return children[n + 1] if len(children) > n + 1 else None  # type: ignore
+
+    app.query_one("#prompt-input", Input).value = text
+    app.expect(answer)
+    start = time.perf_counter()
+    app.simulate_key(app.KEYBINDINGS.send)
+    await asyncio.wait_for(app.painted.wait(), timeout)
+    return app.painted_at - start
+
+
+def history(length: int) -> MessagesData:
+    """
+    Session history to preload.
+
+    Parameters
+    ----------
+    length : int
+        Number of messages.
+
+    Returns
+    -------
+    MessagesData
+        Alternating user and assistant messages.
+    """
+    roles = ["user", "assistant"]
+    return MessagesData(
+        values=[
+            MessageRecord(roles[i % 2], HISTORY_MESSAGE.format(i=i))
+            for i in range(length)
+        ]
+    )
+
+
+class Benchmark:
+    """
+    Headless benchmark of the TUI.
+
+    Parameters
+    ----------
+    lengths : List[int]
+        Session lengths (number of displayed messages) to measure.
+    repeat : int
+        Prompts sent for each session length.
+    markdown_lines : int
+        Lines of the long Markdown answer.
+    memory_messages : int
+        Messages mounted to measure the memory per message.
+    size : Tuple[int, int]
+        Terminal size.
+    timeout : float
+        Maximum seconds to wait for an answer to be painted.
+    """
+
+    def __init__(
+        self,
+        lengths: List[int],
+        repeat: int = 10,
+        markdown_lines: int = 400,
+        memory_messages: int = 50,
+        size: Tuple[int, int] = (120, 40),
+        timeout: float = 120,
+    ):
+        self.lengths = lengths
+        self.repeat = repeat
+        self.markdown_lines = markdown_lines
+        self.memory_messages = memory_messages
+        self.size = size
+        self.timeout = timeout
+
+    async def session(self, folder: Path, length: int) -> Dict[str, float]:
+        """
+        Measures the prompts of a session.
+
+        Parameters
+        ----------
+        folder : Path
+            Folder for the database and the style.
+        length : int
+            Messages displayed before the prompts.
+
+        Returns
+        -------
+        Dict[str, float]
+            Metrics of the session.
+        """
+        db = SqliteDB().setup(database=str(folder / f"bench_{length}.sqlite"))
+        db.create_session("bench")
+        model = (
+            BenchModel()
+            .add_context(context="You're a benchmark")
+            .setup(config=None, database=db, session_name="bench")
+        )
+        app = BenchApp.setup_cls(
+            css_path=css_config(folder), keybindings=DEFAULT_KEYBINDINGS
+        )().setup(model=model)
+        metrics: Dict[str, float] = {}
+        async with app.run_test(size=self.size) as pilot:
+            app.set_focus(None)
+            await settle(pilot)
+            start = time.perf_counter()
+            app.query_one(Messages).load_messages(history(length))
+            await settle(pilot)
+            metrics["load_ms"] = 1000 * (time.perf_counter() - start)
+            app.simulate_key(app.KEYBINDINGS.insert)
+            await settle(pilot)
+            latencies = []
+            with StallMonitor() as monitor:
+                for i in range(self.repeat):
+                    latencies.append(await send(app, f"prompt {i}", self.timeout))
+                    await settle(pilot)
+            metrics["latency_p50_ms"] = 1000 * percentile(latencies, 50)
+            metrics["latency_p95_ms"] = 1000 * percentile(latencies, 95)
+            metrics["latency_max_ms"] = 1000 * max(latencies, default=math.nan)
+            metrics["max_stall_ms"] = 1000 * monitor.max_stall
+            model.answer = long_markdown(self.markdown_lines)
+            with StallMonitor() as monitor:
+                metrics["markdown_latency_ms"] = 1000 * await send(
+                    app, "long answer", self.timeout
+                )
+                await settle(pilot)
+            metrics["markdown_max_stall_ms"] = 1000 * monitor.max_stall
+            model.answer = SHORT_ANSWER
+        db.close()
+        return metrics
+
+    async def memory(self, folder: Path) -> Dict[str, float]:
+        """
+        Measures the memory allocated by each mounted message.
+
+        Parameters
+        ----------
+        folder : Path
+            Folder for the database and the style.
+
+        Returns
+        -------
+        Dict[str, float]
+            Bytes per message.
+        """
+        db = SqliteDB().setup(database=str(folder / "bench_memory.sqlite"))
+        model = BenchModel().setup(config=None, database=db, session_name="bench")
+        app = BenchApp.setup_cls(
+            css_path=css_config(folder), keybindings=DEFAULT_KEYBINDINGS
+        )().setup(model=model)
+        tracing = tracemalloc.is_tracing()
+        async with app.run_test(size=self.size) as pilot:
+            app.set_focus(None)
+            await settle(pilot)
+            if not tracing:
+                tracemalloc.start()
+            gc.collect()
+            before = tracemalloc.get_traced_memory()[0]
+            messages = app.query_one(Messages)
+            for i in range(self.memory_messages):
+                messages.add_message(msg=SHORT_ANSWER, user="Assistant")
+            await settle(pilot)
+            gc.collect()
+            after = tracemalloc.get_traced_memory()[0]
+            if not tracing:
+                tracemalloc.stop()
+        db.close()
+        return {"bytes_per_message": (after - before) / max(1, self.memory_messages)}
+
+    async def run(self) -> Dict[str, Any]:
+        """
+        Runs every measurement.
+
+        Returns
+        -------
+        Dict[str, Any]
+            Report with the environment, the parameters and the metrics.
+        """
+        results: Dict[str, Dict[str, float]] = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = Path(tmp)
+            for length in self.lengths:
+                results[f"session_{length}"] = await self.session(folder, length)
+            results["memory"] = await self.memory(folder)
+        return {
+            "environment": {
+                "gpttui": metadata.version("gpttui"),
+                "textual": metadata.version("textual"),
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+            },
+            "parameters": {
+                "lengths": self.lengths,
+                "repeat": self.repeat,
+                "markdown_lines": self.markdown_lines,
+                "memory_messages": self.memory_messages,
+                "size": list(self.size),
+            },
+            "results": results,
+        }
+
+
+def compare(
+    report: Dict[str, Any], baseline: Dict[str, Any]
+) -> List[Tuple[str, float, float, float]]:
+    """
+    Compares the metrics of two reports.
+
+    Parameters
+    ----------
+    report : Dict[str, Any]
+        Current report.
+    baseline : Dict[str, Any]
+        Report to compare with, usually from the previous release.
+
+    Returns
+    -------
+    List[Tuple[str, float, float, float]]
+        Metric, baseline value, current value and relative change, for the metrics in both.
+    """
+    rows = []
+    for group, metrics in report["results"].items():
+        for name, value in metrics.items():
+            old = baseline["results"].get(group, {}).get(name)
+            if old is None:
+                continue
+            change = (value - old) / old if old else math.nan
+            rows.append((f"{group}.{name}", old, value, change))
+    return rows
@@ -0,0 +1,52 @@
+"""
+This file defines the clipboard operations of the TUI, they run in a thread since `pyperclip` spawns
+a process on most platforms.
+"""
+import asyncio, re
+import pyperclip
+from typing import List
+
+CODE_BLOCK = re.compile(
+    r"^ {0,3}(`{3,}|~{3,})[^\n]*\n(.*?)^ {0,3}\1[ \t]*$", re.M | re.S
+)
+
+
+def code_blocks(text: str) -> List[str]:
+    """
+    Extracts the fenced code blocks of a markdown text.
+
+    Parameters
+    ----------
+    text : str
+        Markdown text.
+
+    Returns
+    -------
+    List[str]
+        Contents of the code blocks, without the fences.
+    """
+    return [match.group(2) for match in CODE_BLOCK.finditer(text)]
+
+
+async def copy(text: str) -> None:
+    """
+    Copies a text into the clipboard without blocking the event loop.
+
+    Parameters
+    ----------
+    text : str
+        Text to copy.
+    """
+    await asyncio.get_running_loop().run_in_executor(None, pyperclip.copy, text)
+
+
+async def paste() -> str:
+    """
+    Reads the clipboard without blocking the event loop.
+
+    Returns
+    -------
+    str
+        Clipboard content.
+    """
+    return await asyncio.get_running_loop().run_in_executor(None, pyperclip.paste)
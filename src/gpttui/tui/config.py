@@ -1,9 +1,10 @@
 """
 This file defines the main configuration options for the TUI.
 """
+import os
 from pathlib import Path
 from pydantic import BaseModel
-from typing import Type
+from typing import NamedTuple, Optional, Type
 
 __CSS_CONFIG = """
 Prompt {
@@ -51,6 +52,23 @@ Input {
     display: block;
 }
 
+SessionSwitcher {
+    display: none;
+    dock: bottom;
+    height: auto;
+    max-height: 50%;
+    margin: 0 0 1 0;
+}
+
+.switch-mode SessionSwitcher {
+    display: block;
+}
+
+SessionSwitcher Input {
+    dock: bottom;
+    width: 100%;
+}
+
 Message {
     layout: horizontal;
     padding: 1 0 0 0;
@@ -90,6 +108,23 @@ class KeyBindings(BaseModel):
     quit: str
     send: str
     delete: str
+    switch: str = "s"
+    yank_code: str = "Y"
+
+
+DEFAULT_KEYBINDINGS = KeyBindings(
+    insert="i",
+    normal="escape",
+    yank="y",
+    paste="p",
+    clear="c",
+    quit="q",
+    send="enter",
+    delete="d",
+    switch="s",
+    yank_code="Y",
+)
+ENV_PREFIX = "GPTTUI"
 
 
 def config_folder(config_path: Path) -> Path:
@@ -101,12 +136,44 @@ def config_folder(config_path: Path) -> Path:
     Path
         Configuration path.
     """
-    if not config_path.exists():
-        config_path.mkdir()
+    config_path.mkdir(parents=True, exist_ok=True)
     return config_path
 
 
-def config_file(path: Path, type: Type[BaseModel]) -> BaseModel:
+def env_overrides(obj: BaseModel, path: Path) -> BaseModel:
+    """
+    Overrides fields of a configuration with environment variables named
+    `GPTTUI_<FILE>_<FIELD>`, e.g. `GPTTUI_OPENAI_API_KEY` for the `api_key` of `openai.json`, so
+    secrets don't have to be written in the files.
+
+    Parameters
+    ----------
+    obj : BaseModel
+        Configuration.
+    path : Path
+        Configuration path.
+
+    Returns
+    -------
+    BaseModel
+        Configuration with the overrides, validated again if there are any.
+    """
+    prefix = f"{ENV_PREFIX}_{path.stem.upper()}_"
+    updates = {
+        name: os.environ[prefix + name.upper()]
+        for name in obj.__fields__
+        if prefix + name.upper() in os.environ
+    }
+    if not updates:
+        return obj
+    return type(obj).parse_obj({**obj.dict(), **updates})
+
+
+def config_file(
+    path: Path,
+    type: Type[BaseModel],
+    default: Optional[BaseModel] = None,
+) -> BaseModel:
     """
     Setups the config file given any configuration type.
 
@@ -116,6 +183,8 @@ def config_file(path: Path, type: Type[BaseModel]) -> BaseModel:
         Configuration path.
     type : Type[ConfT]
         Configuration dataclass.
+    default : Optional[ConfT]
+        Configuration written if the file doesn't exist, `type()` by default.
 
     Returns
     -------
@@ -123,12 +192,12 @@ def config_file(path: Path, type: Type[BaseModel]) -> BaseModel:
         Loaded configuration.
     """
     if not path.exists():
-        obj = type()
+        obj = default if default is not None else type()
         with open(path, "w") as f:
             f.write(obj.json())
     else:
         obj = type.parse_file(path)
-    return obj
+    return env_overrides(obj, path)
 
 
 def css_config(config_path: Path) -> Path:
@@ -143,26 +212,63 @@ def css_config(config_path: Path) -> Path:
     return filename
 
 
-def keybindings_config(config_path) -> KeyBindings:
+def keybindings_config(config_path: Path) -> KeyBindings:
     """
     Initializes the keybindings.
     """
     cfg_path = config_folder(config_path)
-    filename = cfg_path / "keybindings.json"
-    if not filename.exists():
-        filename.touch()
-        keybindings = KeyBindings(
-            insert="i",
-            normal="escape",
-            yank="y",
-            paste="p",
-            clear="c",
-            quit="q",
-            send="enter",
-            delete="d",
-        )
-        with open(filename, "w") as f:
-            f.write(keybindings.json())
-    else:
-        keybindings = KeyBindings.parse_file(filename)
-    return keybindings
+    return config_file(cfg_path / "keybindings.json", KeyBindings, DEFAULT_KEYBINDINGS)
+
+
+class ConfigBundle(NamedTuple):
+    """
+    Every configuration that the TUI needs.
+
+    Attributes
+    ----------
+    css_path : Path
+        CSS styling file.
+    keybindings : KeyBindings
+        Keybindings to use in the application.
+    model : Optional[BaseModel]
+        Model's configuration.
+    """
+
+    css_path: Path
+    keybindings: KeyBindings
+    model: Optional[BaseModel]
+
+
+def config_bundle(
+    config_path: Path,
+    model_config: Optional[str] = None,
+    model_type: Optional[Type[BaseModel]] = None,
+) -> ConfigBundle:
+    """
+    Loads every configuration at once, the environment overrides the fields of the files.
+
+    Parameters
+    ----------
+    config_path : Path
+        Folder to save gpttui data.
+    model_config : Optional[str]
+        Json file with the model's configuration, it isn't loaded if it's not given.
+    model_type : Optional[Type[BaseModel]]
+        Model's configuration dataclass.
+
+    Returns
+    -------
+    ConfigBundle
+        Loaded configurations.
+    """
+    config_folder(config_path)
+    # NOTE: older versions pickled the configurations here, including any key written in them.
+    (config_path / "config.cache").unlink(missing_ok=True)
+    model = None
+    if model_config is not None and model_type is not None:
+        model = config_file(config_path / model_config, model_type)
+    return ConfigBundle(
+        css_path=css_config(config_path),
+        keybindings=keybindings_config(config_path),
+        model=model,
+    )
@@ -3,29 +3,29 @@ This file defines the CLI options in the front subcommand.
 """
 import os
 from pathlib import Path
-from click import option, command
-from pydantic import BaseModel
-from gpttui.database.base import AbstractDB, DatabasesEnum
-from gpttui.database.sqlite import SqliteDB
-from gpttui.models.base import AbstractModel, ModelsEnum
-from gpttui.models.chatsonic import ChatSonicConf, ChatSonicModel
-from gpttui.models.colossal import ColossalConf, ColossalModel
-from gpttui.models.openai import OpenAIModel, OpenAIConf
-from gpttui.tui.app import GptApp
-from gpttui.tui.config import config_file, css_config, keybindings_config
-from typing import Dict, Type
+from click import option, command, get_current_context, ClickException
+from click.core import ParameterSource
+from gpttui.database.base import DatabasesEnum, RetentionPolicy
+from gpttui.database.maintenance import Maintainer
+from gpttui.embeddings.base import EmbeddersEnum
+from gpttui.models.base import ModelsEnum
+from gpttui.models.compaction import Compactor
+from gpttui.server.client import RemoteConf, RemoteDB, RemoteModel, default_socket
+from gpttui.tui.app import ClearModesEnum, GptApp
+from gpttui.tui.config import config_bundle
+from gpttui.tui.registry import model_types, setup_database, setup_retriever
+from typing import Optional
 
-DBS: Dict[DatabasesEnum, Type[AbstractDB]] = {DatabasesEnum.SQLITE: SqliteDB}
-MODELS: Dict[ModelsEnum, Type[AbstractModel]] = {
-    ModelsEnum.OPENAI: OpenAIModel,
-    ModelsEnum.CHATSONIC: ChatSonicModel,
-    ModelsEnum.COLOSSAL: ColossalModel,
-}
-CONFS: Dict[ModelsEnum, Type[BaseModel]] = {
-    ModelsEnum.OPENAI: OpenAIConf,
-    ModelsEnum.CHATSONIC: ChatSonicConf,
-    ModelsEnum.COLOSSAL: ColossalConf,
-}
+# NOTE: the daemon owns the database and the models, so these are set by gpttui serve.
+DAEMON_OPTIONS = (
+    "database_kind",
+    "database_name",
+    "compact_after",
+    "compact_keep",
+    "recall",
+    "embedder",
+    "embedder_config",
+)
 
 
 @command()
@@ -63,6 +63,85 @@ CONFS: Dict[ModelsEnum, Type[BaseModel]] = {
 @option(
     "--model_config", type=str, default="openai.json", help="Context for the model."
 )
+@option(
+    "--compact_after",
+    type=int,
+    default=0,
+    help="Summarize old messages once a session sends more messages than this, 0 disables it.",
+)
+@option(
+    "--compact_keep",
+    type=int,
+    default=10,
+    help="Number of recent messages that are never summarized.",
+)
+@option(
+    "--recall",
+    type=int,
+    default=0,
+    help="Number of relevant messages from other sessions added to the prompt, 0 disables it.",
+)
+@option(
+    "--embedder",
+    type=EmbeddersEnum,
+    default=EmbeddersEnum.HASHING,
+    help="Model that embeds the messages for the recall.",
+)
+@option(
+    "--embedder_config",
+    type=str,
+    default="embeddings.json",
+    help="Json file with the embedder's configuration.",
+)
+@option(
+    "--clear_mode",
+    type=ClearModesEnum,
+    default=ClearModesEnum.VIEW,
+    help="What clearing the messages does: VIEW only clears the screen, NEW continues in a new session and ARCHIVE renames the session and restarts it.",
+)
+@option(
+    "--debug",
+    is_flag=True,
+    default=False,
+    help="Report the memory reclaimed by clearing the messages and the waits for the database lock.",
+)
+@option(
+    "--retention_days",
+    type=int,
+    default=0,
+    help="Delete messages older than this in sessions without their own policy, 0 keeps them.",
+)
+@option(
+    "--retention_messages",
+    type=int,
+    default=0,
+    help="Keep only this many messages in sessions without their own policy, 0 keeps them all.",
+)
+@option(
+    "--maintain_after",
+    type=float,
+    default=10,
+    help="Seconds without keystrokes before the database maintenance runs, 0 disables it.",
+)
+@option(
+    "--sync_every",
+    type=float,
+    default=1,
+    help="Seconds between the checks for messages that other terminals stored in the session, 0 disables them.",
+)
+@option(
+    "--server",
+    is_flag=True,
+    default=False,
+    help="Use a running `gpttui serve` daemon instead of opening the database.",
+)
+@option(
+    "--socket",
+    "socket_path",
+    type=Path,
+    default=None,
+    help="Daemon's Unix socket, defaults to gpttui.sock in the config folder.",
+)
 def front(
     database_kind: DatabasesEnum,
     database_name: str,
@@ -71,6 +150,19 @@ def front(
     context: str,
     config_path: Path,
     model_config: str,
+    compact_after: int,
+    compact_keep: int,
+    recall: int,
+    embedder: EmbeddersEnum,
+    embedder_config: str,
+    clear_mode: ClearModesEnum,
+    debug: bool,
+    retention_days: int,
+    retention_messages: int,
+    maintain_after: float,
+    sync_every: float,
+    server: bool,
+    socket_path: Optional[Path],
 ) -> None:
     """
     Determines what to do when the front subcommand is launched.
@@ -93,19 +185,105 @@ def front(
         Folder to save gpttui data.
     model_config : str
         Json file with the model's configuration.
+    compact_after : int
+        Number of messages that triggers a summarization.
+    compact_keep : int
+        Number of recent messages that are never summarized.
+    recall : int
+        Number of recalled messages from other sessions.
+    embedder : EmbeddersEnum
+        Which embedder to use.
+    embedder_config : str
+        Json file with the embedder's configuration.
+    clear_mode : ClearModesEnum
+        What clearing the messages does.
+    debug : bool
+        Whether to report reclaimed memory.
+    retention_days : int
+        Default maximum age of the messages.
+    retention_messages : int
+        Default maximum number of messages of a session.
+    maintain_after : float
+        Idle seconds before the database maintenance runs.
+    sync_every : float
+        Seconds between the checks for messages of other terminals.
+    server : bool
+        Whether to use a running daemon.
+    socket_path : Optional[Path]
+        Daemon's Unix socket.
     """
-    css_path = css_config(config_path)
-    keybindings = keybindings_config(config_path)
-    db = DBS[database_kind]().setup(database=str(config_path / database_name))
+    maintainer = None
+    if maintain_after > 0:
+        maintainer = Maintainer(
+            default_policy=RetentionPolicy(retention_days, retention_messages),
+            idle_seconds=maintain_after,
+        )
+    if server:
+        ctx = get_current_context()
+        ignored = [
+            f"--{name}"
+            for name in DAEMON_OPTIONS
+            if ctx.get_parameter_source(name) != ParameterSource.DEFAULT
+        ]
+        if ignored:
+            raise ClickException(
+                f"{', '.join(ignored)} can't be used with --server, pass them to gpttui serve"
+            )
+        bundle = config_bundle(config_path)
+        if socket_path is None:
+            socket_path = default_socket(config_path)
+        if not socket_path.exists():
+            raise ClickException(
+                f"No daemon is listening on {socket_path}, start it with:\n\tgpttui serve"
+            )
+        remote_db = RemoteDB().setup(socket=str(socket_path))
+        remote_db.create_session(session_name=session)
+        model = (
+            RemoteModel()
+            .add_context(context=context)
+            .setup(
+                config=RemoteConf(model_kind=model_kind, model_config=model_config),
+                database=remote_db,
+                session_name=session,
+            )
+        )
+        app = GptApp.setup_cls(
+            css_path=bundle.css_path, keybindings=bundle.keybindings
+        )().setup(
+            model=model,
+            clear_mode=clear_mode,
+            debug=debug,
+            maintainer=maintainer,
+            sync_every=sync_every,
+        )
+        app.run()
+        return
+    model_type, conf_type = model_types(model_kind)
+    bundle = config_bundle(config_path, model_config, conf_type)
+    db = setup_database(database_kind, database_name, config_path)
     db.create_session(session_name=session)
-    cfg = config_file(config_path / model_config, CONFS[model_kind])
 
     model = (
-        MODELS[model_kind]()
+        model_type()
         .add_context(context=context)
-        .setup(config=cfg, database=db, session_name=session)
+        .setup(config=bundle.model, database=db, session_name=session)
+    )
+    if compact_after > 0:
+        model.add_compactor(
+            Compactor(max_messages=compact_after, keep_messages=compact_keep)
+        )
+    retriever = setup_retriever(
+        recall, embedder, embedder_config, database_kind, database_name, config_path
     )
-    app = GptApp.setup_cls(css_path=css_path, keybindings=keybindings)().setup(
-        model=model
+    if retriever is not None:
+        model.add_retriever(retriever)
+    app = GptApp.setup_cls(
+        css_path=bundle.css_path, keybindings=bundle.keybindings
+    )().setup(
+        model=model,
+        clear_mode=clear_mode,
+        debug=debug,
+        maintainer=maintainer,
+        sync_every=sync_every,
     )
     app.run()
@@ -4,19 +4,10 @@ This file defines the CLI options in the front subcommand.
 import os
 from pathlib import Path
 from click import option, command
-from pydantic import BaseModel
-from gpttui.models.base import  ModelsEnum
-from gpttui.models.chatsonic import ChatSonicConf
-from gpttui.models.colossal import ColossalConf
-from gpttui.models.openai import OpenAIConf
+from gpttui.models.base import ModelsEnum
 from gpttui.tui.config import config_file, css_config, keybindings_config
-from typing import Dict, Type
+from gpttui.tui.registry import model_types
 
-CONFS: Dict[ModelsEnum, Type[BaseModel]] = {
-    ModelsEnum.OPENAI: OpenAIConf,
-    ModelsEnum.CHATSONIC: ChatSonicConf,
-    ModelsEnum.COLOSSAL: ColossalConf,
-}
 
 @command()
 @option(
@@ -51,6 +42,7 @@ def init(
     model_config : str
         Json file with the model's configuration.
     """
+    _, conf_type = model_types(model_kind)
     css_config(config_path)
     keybindings_config(config_path)
-    config_file(config_path / model_config, CONFS[model_kind])
+    config_file(config_path / model_config, conf_type)
@@ -1,14 +1,49 @@
 """
-This file defines the main CLI.
+This file defines the main CLI, subcommands are imported when they're invoked so light commands
+like `ask` don't import the TUI.
 """
-from click import group
-from gpttui.tui.front import front
-from gpttui.tui.init import init
+from click import Command, Context, Group, group
+from gpttui.tui.registry import load
+from typing import Any, Dict, List, Optional
 
-@group()
-def cli() -> None:
-    ...
+COMMANDS: Dict[str, str] = {
+    "front": "gpttui.tui.front:front",
+    "init": "gpttui.tui.init:init",
+    "export": "gpttui.tui.transfer:export",
+    "import": "gpttui.tui.transfer:import_",
+    "sessions": "gpttui.tui.sessions:sessions",
+    "serve": "gpttui.tui.serve:serve",
+    "bench": "gpttui.tui.bench:bench",
+    "ask": "gpttui.tui.ask:ask",
+    "stats": "gpttui.tui.stats:stats",
+    "maintain": "gpttui.tui.maintain:maintain",
+    "archive": "gpttui.tui.archive:archive",
+}
+
+
+class LazyGroup(Group):
+    """
+    Group whose subcommands are given as `module:name` and imported on demand.
+
+    Parameters
+    ----------
+    lazy_commands : Dict[str, str]
+        Name and location of each subcommand.
+    """
 
+    def __init__(self, *args: Any, lazy_commands: Dict[str, str], **kwargs: Any):
+        super(LazyGroup, self).__init__(*args, **kwargs)
+        self.lazy_commands = lazy_commands
 
-cli.add_command(front)
-cli.add_command(init)
+    def list_commands(self, ctx: Context) -> List[str]:
+        return sorted([*super().list_commands(ctx), *self.lazy_commands])
+
+    def get_command(self, ctx: Context, cmd_name: str) -> Optional[Command]:
+        if cmd_name in self.lazy_commands:
+            return load(self.lazy_commands[cmd_name])
+        return super().get_command(ctx, cmd_name)
+
+
+@group(cls=LazyGroup, lazy_commands=COMMANDS)
+def cli() -> None:
+    ...
@@ -0,0 +1,114 @@
+"""
+This file defines the CLI options in the maintain subcommand.
+"""
+import os, time
+from pathlib import Path
+from click import option, command, echo, ClickException
+from gpttui.database.base import DatabasesEnum, RetentionPolicy
+from gpttui.tui.registry import setup_database
+from typing import Optional
+
+
+@command()
+@option(
+    "--database_kind",
+    type=DatabasesEnum,
+    default=DatabasesEnum.SQLITE,
+    help="Database that stores the messages.",
+)
+@option(
+    "--database_name",
+    type=str,
+    default="database.sqlite",
+    help="Connection string for the database.",
+)
+@option(
+    "--config_path",
+    type=Path,
+    default=Path(os.environ["HOME"]) / ".config/gpttui",
+    help="Folder to save gpttui data.",
+)
+@option(
+    "--session",
+    type=str,
+    default=None,
+    help="Session whose retention policy is stored, otherwise the policy is the default of this run.",
+)
+@option(
+    "--retention_days",
+    type=int,
+    default=0,
+    help="Delete messages older than this, 0 keeps them.",
+)
+@option(
+    "--retention_messages",
+    type=int,
+    default=0,
+    help="Keep only this many messages per session, 0 keeps them all.",
+)
+@option(
+    "--reset",
+    is_flag=True,
+    default=False,
+    help="Make the session use the default policy again.",
+)
+@option(
+    "--vacuum",
+    is_flag=True,
+    default=False,
+    help="Rebuild the whole database, old databases are always rebuilt once to enable the incremental vacuum.",
+)
+def maintain(
+    database_kind: DatabasesEnum,
+    database_name: str,
+    config_path: Path,
+    session: Optional[str],
+    retention_days: int,
+    retention_messages: int,
+    reset: bool,
+    vacuum: bool,
+) -> None:
+    """
+    Finishes the schema migrations, applies the retention policies, returns the free space to the
+    file system and refreshes the planner statistics, `gpttui front` does the same in small steps.
+
+    Parameters
+    ----------
+    database_kind : DatabasesEnum
+        Which database to use.
+    database_name : str
+        Connection string to the database.
+    config_path : Path
+        Folder to save gpttui data.
+    session : Optional[str]
+        Session whose retention policy is stored.
+    retention_days : int
+        Maximum age of the messages.
+    retention_messages : int
+        Maximum number of messages per session.
+    reset : bool
+        Whether the session's policy is removed.
+    vacuum : bool
+        Whether the whole database is rebuilt.
+    """
+    policy = RetentionPolicy(retention_days, retention_messages)
+    db = setup_database(database_kind, database_name, config_path)
+    if session is not None:
+        if session not in db.list_sessions():
+            db.close()
+            raise ClickException(f"Session {session} doesn't exist.")
+        db.set_retention(session, None if reset else policy)
+        echo(f"Retention policy of {session}: {db.get_retention(session) or 'default'}")
+        policy = RetentionPolicy()
+    while db.migrate(10000) > 0:
+        ...
+    deleted = db.apply_retention(policy, int(time.time()))
+    free_pages = db.vacuum_step(0 if vacuum else 2**31 - 1)
+    if free_pages < 0:
+        # NOTE: databases of older versions are rebuilt once, later runs release pages in steps.
+        echo("Rebuilding the database to enable the incremental vacuum")
+        free_pages = db.vacuum_step(0)
+    db.optimize()
+    db.close()
+    echo(f"Deleted messages: {deleted}")
+    echo(f"Free pages left: {free_pages}")
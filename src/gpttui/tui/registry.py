@@ -0,0 +1,233 @@
+"""
+This file defines where each database and model is implemented, they're only imported when
+they're used so commands don't pay for the backends (and the TUI) that they don't need.
+"""
+from importlib import import_module
+from pathlib import Path
+from click import ClickException
+from pydantic import BaseModel
+from gpttui.database.base import AbstractDB, DatabasesEnum
+from gpttui.embeddings.base import EmbeddersEnum
+from gpttui.models.base import AbstractModel, ModelsEnum
+from gpttui.tui.config import config_file
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple, Type
+
+if TYPE_CHECKING:
+    from gpttui.models.recall import Retriever
+
+DATABASES: Dict[DatabasesEnum, str] = {
+    DatabasesEnum.SQLITE: "gpttui.database.sqlite:SqliteDB",
+    DatabasesEnum.POSTGRES: "gpttui.database.postgres:PostgresDB",
+}
+MODELS: Dict[ModelsEnum, Tuple[str, str]] = {
+    ModelsEnum.OPENAI: (
+        "gpttui.models.openai:OpenAIModel",
+        "gpttui.models.openai:OpenAIConf",
+    ),
+    ModelsEnum.CHATSONIC: (
+        "gpttui.models.chatsonic:ChatSonicModel",
+        "gpttui.models.chatsonic:ChatSonicConf",
+    ),
+    ModelsEnum.COLOSSAL: (
+        "gpttui.models.colossal:ColossalModel",
+        "gpttui.models.colossal:ColossalConf",
+    ),
+    ModelsEnum.LOCAL: (
+        "gpttui.models.local:LocalModel",
+        "gpttui.models.local:LocalConf",
+    ),
+}
+# NOTE: the other backends only use core dependencies, so they have no install hint.
+DATABASE_EXTRAS: Dict[DatabasesEnum, str] = {DatabasesEnum.POSTGRES: "postgres"}
+MODEL_EXTRAS: Dict[ModelsEnum, str] = {ModelsEnum.LOCAL: "local"}
+
+EMBEDDERS: Dict[EmbeddersEnum, Tuple[str, str]] = {
+    EmbeddersEnum.HASHING: (
+        "gpttui.embeddings.hashing:HashingEmbedder",
+        "gpttui.embeddings.hashing:HashingConf",
+    ),
+    EmbeddersEnum.OPENAI: (
+        "gpttui.embeddings.openai:OpenAIEmbedder",
+        "gpttui.embeddings.openai:OpenAIEmbeddingConf",
+    ),
+}
+
+
+def load(spec: str) -> Any:
+    """
+    Imports an object given as `module:name`.
+
+    Parameters
+    ----------
+    spec : str
+        Module and name of the object.
+
+    Returns
+    -------
+    Any
+        Imported object.
+    """
+    module, name = spec.split(":")
+    return getattr(import_module(module), name)
+
+
+def database_type(database_kind: DatabasesEnum) -> Type[AbstractDB]:
+    """
+    Imports a database.
+
+    Parameters
+    ----------
+    database_kind : DatabasesEnum
+        Which database to use.
+
+    Returns
+    -------
+    Type[AbstractDB]
+        Database class.
+
+    Raises
+    ------
+    ClickException
+        If the dependencies of its extra are missing.
+    """
+    try:
+        return load(DATABASES[database_kind])
+    except ImportError:
+        if database_kind not in DATABASE_EXTRAS:
+            raise
+        raise ClickException(
+            f"{database_kind.value} dependencies are missing, please install it with:\n\tpip install gpttui[{DATABASE_EXTRAS[database_kind]}]"
+        )
+
+
+def model_types(
+    model_kind: ModelsEnum,
+) -> Tuple[Type[AbstractModel], Type[BaseModel]]:
+    """
+    Imports a model and its configuration.
+
+    Parameters
+    ----------
+    model_kind : ModelsEnum
+        Which model to use.
+
+    Returns
+    -------
+    Tuple[Type[AbstractModel], Type[BaseModel]]
+        Model and configuration classes.
+
+    Raises
+    ------
+    ClickException
+        If the dependencies of its extra are missing.
+    """
+    try:
+        return tuple(load(spec) for spec in MODELS[model_kind])  # type: ignore
+    except ImportError:
+        if model_kind not in MODEL_EXTRAS:
+            raise
+        raise ClickException(
+            f"{model_kind.value} dependencies are missing, please install it with:\n\tpip install gpttui[{MODEL_EXTRAS[model_kind]}]"
+        )
+
+
+def available_models() -> (
+    Tuple[Dict[ModelsEnum, Type[AbstractModel]], Dict[ModelsEnum, Type[BaseModel]]]
+):
+    """
+    Imports every model whose dependencies are installed.
+
+    Returns
+    -------
+    Tuple[Dict[ModelsEnum, Type[AbstractModel]], Dict[ModelsEnum, Type[BaseModel]]]
+        Models and their configurations.
+    """
+    models, confs = {}, {}
+    for model_kind in MODELS:
+        try:
+            models[model_kind], confs[model_kind] = model_types(model_kind)
+        except ClickException:
+            ...
+    return models, confs
+
+
+def setup_database(
+    database_kind: DatabasesEnum, database_name: str, config_path: Path
+) -> AbstractDB:
+    """
+    Creates the database, file based databases are stored in the config folder.
+
+    Parameters
+    ----------
+    database_kind : DatabasesEnum
+        Which database to use.
+    database_name : str
+        Connection string to the database.
+    config_path : Path
+        Folder to save gpttui data.
+
+    Returns
+    -------
+    AbstractDB
+        Initialized database.
+    """
+    if database_kind == DatabasesEnum.SQLITE:
+        database_name = str(config_path / database_name)
+    return database_type(database_kind)().setup(database=database_name)
+
+
+def setup_retriever(
+    recall: int,
+    embedder: EmbeddersEnum,
+    embedder_config: str,
+    database_kind: DatabasesEnum,
+    database_name: str,
+    config_path: Path,
+) -> Optional["Retriever"]:
+    """
+    Creates the retrieval of relevant messages from other sessions, its index is stored next to
+    file based databases.
+
+    Parameters
+    ----------
+    recall : int
+        Maximum number of recalled messages, 0 disables the retrieval.
+    embedder : EmbeddersEnum
+        Which embedder to use.
+    embedder_config : str
+        Json file with the embedder's configuration.
+    database_kind : DatabasesEnum
+        Which database to use.
+    database_name : str
+        Connection string to the database.
+    config_path : Path
+        Folder to save gpttui data.
+
+    Returns
+    -------
+    Optional[Retriever]
+        Retriever, `None` if it's disabled.
+
+    Raises
+    ------
+    ClickException
+        If its dependencies are missing.
+    """
+    if recall <= 0:
+        return None
+    try:
+        embedder_type, conf_type = (load(spec) for spec in EMBEDDERS[embedder])
+        EmbeddingIndex = load("gpttui.embeddings.index:EmbeddingIndex")
+        Retriever = load("gpttui.models.recall:Retriever")
+    except ImportError:
+        raise ClickException(
+            "Recall dependencies are missing, please install it with:\n\tpip install gpttui[recall]"
+        )
+    cfg = config_file(config_path / embedder_config, conf_type)
+    model = embedder_type().setup(config=cfg)
+    if database_kind == DatabasesEnum.SQLITE:
+        prefix = config_path / database_name
+    else:
+        prefix = config_path / database_kind.value.lower()
+    index = EmbeddingIndex(prefix, space=model.name, dim=cfg.dim)
+    return Retriever(embedder=model, index=index, top_k=recall)
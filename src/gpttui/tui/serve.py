@@ -0,0 +1,170 @@
+"""
+This file defines the CLI options in the serve subcommand.
+"""
+import asyncio
+import os
+from pathlib import Path
+from click import option, command, echo, ClickException
+from gpttui.database.base import DatabasesEnum
+from gpttui.embeddings.base import EmbeddersEnum
+from gpttui.server.client import default_socket
+from gpttui.server.daemon import Daemon, RateLimiter
+from gpttui.tui.config import config_file
+from gpttui.tui.registry import available_models, setup_database, setup_retriever
+from typing import Optional
+
+
+@command()
+@option(
+    "--database_kind",
+    type=DatabasesEnum,
+    default=DatabasesEnum.SQLITE,
+    help="Database to store the messages.",
+)
+@option(
+    "--database_name",
+    type=str,
+    default="database.sqlite",
+    help="Connection string for the database.",
+)
+@option(
+    "--config_path",
+    type=Path,
+    default=Path(os.environ["HOME"]) / ".config/gpttui",
+    help="Folder to save gpttui data.",
+)
+@option(
+    "--socket",
+    "socket_path",
+    type=Path,
+    default=None,
+    help="Unix socket to listen on, defaults to gpttui.sock in the config folder.",
+)
+@option(
+    "--rate",
+    type=float,
+    default=0,
+    help="Requests per second sent to the models by all clients, 0 disables the limit.",
+)
+@option(
+    "--burst",
+    type=int,
+    default=1,
+    help="Requests that can be sent at once after being idle.",
+)
+@option(
+    "--concurrency",
+    type=int,
+    default=4,
+    help="Maximum number of requests to the models in flight.",
+)
+@option(
+    "--compact_after",
+    type=int,
+    default=0,
+    help="Summarize old messages once a session sends more messages than this, 0 disables it.",
+)
+@option(
+    "--compact_keep",
+    type=int,
+    default=10,
+    help="Number of recent messages that are never summarized.",
+)
+@option(
+    "--recall",
+    type=int,
+    default=0,
+    help="Number of relevant messages from other sessions added to the prompt, 0 disables it.",
+)
+@option(
+    "--embedder",
+    type=EmbeddersEnum,
+    default=EmbeddersEnum.HASHING,
+    help="Model that embeds the messages for the recall.",
+)
+@option(
+    "--embedder_config",
+    type=str,
+    default="embeddings.json",
+    help="Json file with the embedder's configuration.",
+)
+def serve(
+    database_kind: DatabasesEnum,
+    database_name: str,
+    config_path: Path,
+    socket_path: Optional[Path],
+    rate: float,
+    burst: int,
+    concurrency: int,
+    compact_after: int,
+    compact_keep: int,
+    recall: int,
+    embedder: EmbeddersEnum,
+    embedder_config: str,
+) -> None:
+    """
+    Runs a daemon that shares the database and the models between `front --server` clients.
+
+    Parameters
+    ----------
+    database_kind : DatabasesEnum
+        Which database to use.
+    database_name : str
+        Connection string to the database.
+    config_path : Path
+        Folder to save gpttui data.
+    socket_path : Optional[Path]
+        Unix socket to listen on.
+    rate : float
+        Global requests per second.
+    burst : int
+        Requests that can be sent at once.
+    concurrency : int
+        Maximum number of requests in flight.
+    compact_after : int
+        Number of messages that triggers a summarization.
+    compact_keep : int
+        Number of recent messages that are never summarized.
+    recall : int
+        Number of recalled messages from other sessions.
+    embedder : EmbeddersEnum
+        Which embedder to use.
+    embedder_config : str
+        Json file with the embedder's configuration.
+    """
+    if socket_path is None:
+        socket_path = default_socket(config_path)
+    config_path.mkdir(parents=True, exist_ok=True)
+    db = setup_database(database_kind, database_name, config_path)
+    retriever = setup_retriever(
+        recall, embedder, embedder_config, database_kind, database_name, config_path
+    )
+    models, confs = available_models()
+
+    async def run() -> None:
+        daemon = Daemon().setup(
+            database=db,
+            config_path=config_path,
+            models=models,
+            confs=confs,
+            load_config=config_file,
+            limiter=RateLimiter(rate=rate, burst=burst, concurrency=concurrency),
+            compact_after=compact_after,
+            compact_keep=compact_keep,
+            retriever=retriever,
+            open_database=lambda: setup_database(
+                database_kind, database_name, config_path
+            ),
+        )
+        if retriever is not None:
+            retriever.schedule(db)
+        await daemon.serve(socket_path)
+
+    echo(f"Listening on {socket_path}")
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        ...
+    except RuntimeError as error:
+        db.close()
+        raise ClickException(str(error))
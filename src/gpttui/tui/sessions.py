@@ -0,0 +1,58 @@
+"""
+This file defines the CLI options in the sessions subcommand.
+"""
+import os
+from datetime import datetime
+from pathlib import Path
+from click import option, command, echo
+from gpttui.database.base import DatabasesEnum
+from gpttui.tui.registry import setup_database
+
+
+@command()
+@option(
+    "--database_kind",
+    type=DatabasesEnum,
+    default=DatabasesEnum.SQLITE,
+    help="Database that stores the messages.",
+)
+@option(
+    "--database_name",
+    type=str,
+    default="database.sqlite",
+    help="Connection string for the database.",
+)
+@option(
+    "--config_path",
+    type=Path,
+    default=Path(os.environ["HOME"]) / ".config/gpttui",
+    help="Folder to save gpttui data.",
+)
+def sessions(
+    database_kind: DatabasesEnum, database_name: str, config_path: Path
+) -> None:
+    """
+    Lists the sessions, the most recently updated first.
+
+    Parameters
+    ----------
+    database_kind : DatabasesEnum
+        Which database to use.
+    database_name : str
+        Connection string to the database.
+    config_path : Path
+        Folder to save gpttui data.
+    """
+    db = setup_database(database_kind, database_name, config_path)
+    infos = db.get_sessions()
+    db.close()
+    width = max([len(info.name) for info in infos] + [len("SESSION")])
+    echo(f"{'SESSION':<{width}}  {'MESSAGES':>8}  {'TOKENS':>8}  {'UPDATED':<16}  LAST")
+    for info in infos:
+        updated = datetime.fromtimestamp(info.updated_at).strftime("%Y-%m-%d %H:%M")
+        preview = " ".join(info.preview.split())
+        if info.archived:
+            preview = f"[archived] {preview}"
+        echo(
+            f"{info.name:<{width}}  {info.message_count:>8}  {info.token_total:>8}  {updated:<16}  {preview}"
+        )
@@ -0,0 +1,116 @@
+"""
+This file defines the CLI options in the stats subcommand.
+"""
+import os, time
+from pathlib import Path
+from click import option, command, echo, ClickException
+from gpttui.database.base import DatabasesEnum, UsageGroupEnum
+from gpttui.tui.registry import setup_database
+
+try:
+    from gpttui.database.usage import usage_stats
+except ImportError:
+    usage_stats = None
+
+
+@command()
+@option(
+    "--database_kind",
+    type=DatabasesEnum,
+    default=DatabasesEnum.SQLITE,
+    help="Database that stores the messages.",
+)
+@option(
+    "--database_name",
+    type=str,
+    default="database.sqlite",
+    help="Connection string for the database.",
+)
+@option(
+    "--config_path",
+    type=Path,
+    default=Path(os.environ["HOME"]) / ".config/gpttui",
+    help="Folder to save gpttui data.",
+)
+@option(
+    "--by",
+    type=UsageGroupEnum,
+    default=UsageGroupEnum.SESSION,
+    help="How the answers are grouped.",
+)
+@option(
+    "--days",
+    type=int,
+    default=30,
+    help="Only answers of the last days are included, 0 includes all of them.",
+)
+@option(
+    "--percentiles",
+    type=str,
+    default="50,90,99",
+    help="Comma separated latency percentiles.",
+)
+@option("--limit", type=int, default=20, help="Groups to show, 0 shows all of them.")
+def stats(
+    database_kind: DatabasesEnum,
+    database_name: str,
+    config_path: Path,
+    by: UsageGroupEnum,
+    days: int,
+    percentiles: str,
+    limit: int,
+) -> None:
+    """
+    Shows the tokens and the latency of the answers, the most expensive groups first. Tokens
+    marked with `~` are partly approximated because the server didn't report them.
+
+    Parameters
+    ----------
+    database_kind : DatabasesEnum
+        Which database to use.
+    database_name : str
+        Connection string to the database.
+    config_path : Path
+        Folder to save gpttui data.
+    by : UsageGroupEnum
+        How the answers are grouped.
+    days : int
+        Days to include, 0 includes all.
+    percentiles : str
+        Comma separated latency percentiles.
+    limit : int
+        Groups to show, 0 shows all.
+    """
+    if usage_stats is None:
+        raise ClickException(
+            "Stats dependencies are missing, please install it with:\n\tpip install gpttui[stats]"
+        )
+    try:
+        qs = [float(q) for q in percentiles.split(",") if q]
+    except ValueError:
+        raise ClickException(f"Percentiles must be numbers, got {percentiles}.")
+    if not all(0 <= q <= 100 for q in qs):
+        raise ClickException(
+            f"Percentiles must be between 0 and 100, got {percentiles}."
+        )
+    since = int(time.time()) - days * 86400 if days > 0 else 0
+    db = setup_database(database_kind, database_name, config_path)
+    groups = usage_stats(db, by, since=since, percentiles=qs)
+    db.close()
+    if limit > 0:
+        groups = groups[:limit]
+    width = max([len(group.usage.key) for group in groups] + [len(by.name)])
+    header = "".join(f"  {'P' + format(q, 'g'):>8}" for q in qs)
+    echo(
+        f"{by.name:<{width}}  {'TURNS':>6}  {'PROMPT':>10}  {'COMPLETION':>10}  {'PEAK':>8}{header}"
+    )
+    for group in groups:
+        usage = group.usage
+        mark = "~" if usage.estimated_turns else ""
+        latencies = "".join(
+            f"  {latency / 1000:>7.2f}s" for latency in group.latencies_ms
+        )
+        echo(
+            f"{usage.key:<{width}}  {usage.turns:>6}  {mark + str(usage.prompt_tokens):>10}"
+            f"  {mark + str(usage.completion_tokens):>10}  {usage.max_prompt_tokens:>8}{latencies}"
+        )
@@ -0,0 +1,154 @@
+"""
+This file defines the CLI options in the export and import subcommands.
+"""
+import os
+from pathlib import Path
+from click import option, command, echo
+from gpttui.database.base import DatabasesEnum
+from gpttui.database.transfer import (
+    TransferFormatsEnum,
+    export_jsonl,
+    export_parquet,
+    import_jsonl,
+    import_parquet,
+)
+from gpttui.tui.registry import setup_database
+from typing import Tuple
+
+
+@command()
+@option(
+    "--database_kind",
+    type=DatabasesEnum,
+    default=DatabasesEnum.SQLITE,
+    help="Database that stores the messages.",
+)
+@option(
+    "--database_name",
+    type=str,
+    default="database.sqlite",
+    help="Connection string for the database.",
+)
+@option(
+    "--config_path",
+    type=Path,
+    default=Path(os.environ["HOME"]) / ".config/gpttui",
+    help="Folder to save gpttui data.",
+)
+@option(
+    "--session",
+    type=str,
+    multiple=True,
+    help="Session to export, all sessions are exported if it's not given.",
+)
+@option(
+    "--format",
+    "fmt",
+    type=TransferFormatsEnum,
+    default=TransferFormatsEnum.JSONL,
+    help="Output format.",
+)
+@option("--output", type=Path, required=True, help="Output file.")
+@option(
+    "--batch_size", type=int, default=1000, help="Rows read from the database at once."
+)
+def export(
+    database_kind: DatabasesEnum,
+    database_name: str,
+    config_path: Path,
+    session: Tuple[str, ...],
+    fmt: TransferFormatsEnum,
+    output: Path,
+    batch_size: int,
+) -> None:
+    """
+    Exports sessions from the database into a file.
+
+    Parameters
+    ----------
+    database_kind : DatabasesEnum
+        Which database to use.
+    database_name : str
+        Connection string to the database.
+    config_path : Path
+        Folder to save gpttui data.
+    session : Tuple[str, ...]
+        Sessions to export.
+    fmt : TransferFormatsEnum
+        Output format.
+    output : Path
+        Output file.
+    batch_size : int
+        Rows read from the database at once.
+    """
+    db = setup_database(database_kind, database_name, config_path)
+    sessions = session if session else db.list_sessions()
+    if fmt == TransferFormatsEnum.PARQUET:
+        total = export_parquet(db, sessions, output, batch_size=batch_size)
+    else:
+        total = export_jsonl(db, sessions, output, batch_size=batch_size)
+    db.close()
+    echo(f"Exported {total} messages.")
+
+
+@command(name="import")
+@option(
+    "--database_kind",
+    type=DatabasesEnum,
+    default=DatabasesEnum.SQLITE,
+    help="Database to store the messages.",
+)
+@option(
+    "--database_name",
+    type=str,
+    default="database.sqlite",
+    help="Connection string for the database.",
+)
+@option(
+    "--config_path",
+    type=Path,
+    default=Path(os.environ["HOME"]) / ".config/gpttui",
+    help="Folder to save gpttui data.",
+)
+@option(
+    "--format",
+    "fmt",
+    type=TransferFormatsEnum,
+    default=TransferFormatsEnum.JSONL,
+    help="Input format.",
+)
+@option("--input", "input_path", type=Path, required=True, help="Input file.")
+@option("--batch_size", type=int, default=1000, help="Rows read from the file at once.")
+def import_(
+    database_kind: DatabasesEnum,
+    database_name: str,
+    config_path: Path,
+    fmt: TransferFormatsEnum,
+    input_path: Path,
+    batch_size: int,
+) -> None:
+    """
+    Imports sessions from a file into the database.
+
+    Parameters
+    ----------
+    database_kind : DatabasesEnum
+        Which database to use.
+    database_name : str
+        Connection string to the database.
+    config_path : Path
+        Folder to save gpttui data.
+    fmt : TransferFormatsEnum
+        Input format.
+    input_path : Path
+        Input file.
+    batch_size : int
+        Rows read from the file at once.
+    """
+    db = setup_database(database_kind, database_name, config_path)
+    if fmt == TransferFormatsEnum.PARQUET:
+        total = import_parquet(db, input_path, batch_size=batch_size)
+    else:
+        total = import_jsonl(db, input_path)
+    db.close()
+    echo(f"Imported {total} messages.")
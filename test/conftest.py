@@ -0,0 +1,23 @@
+"""
+Defines the helpers that are shared by several test modules.
+"""
+from pydantic import BaseModel
+from gpttui.database.base import AbstractDB, Messages
+from gpttui.models.base import AbstractModel
+
+
+class EchoModel(AbstractModel):
+    """
+    Offline model that answers with the number of received messages.
+    """
+
+    def setup(
+        self, config: BaseModel, session_name: str, database: AbstractDB
+    ) -> "EchoModel":
+        self.config = config
+        self.session_name = session_name
+        self.database = database
+        return self
+
+    async def generate(self, msgs: Messages) -> str:
+        return str(len(msgs.values))
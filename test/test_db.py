@@ -1,9 +1,24 @@
 """
 Tests for the databases integration.
 """
-import pytest, time
+import os, pytest, sqlite3, tempfile, threading, time
+from click.testing import CliRunner
+from pathlib import Path
+from typing import Dict, Iterator, List
 from gpttui.database.sqlite import SqliteDB
-from gpttui.database.base import AbstractDB, Message, MessageWithTime
+from gpttui.database.base import (
+    AbstractDB,
+    Message,
+    MessageWithTime,
+    RetentionPolicy,
+    TurnMetric,
+    UsageGroupEnum,
+    SUMMARY_ROLE,
+)
+from gpttui.database.maintenance import Maintainer
+from gpttui.database.migrations import MIGRATIONS
+from gpttui.database.transfer import export_jsonl, import_jsonl
+from gpttui.tui.main import cli
 
 
 class TestSqliteDB:
@@ -12,59 +27,820 @@ class TestSqliteDB:
     """
 
     @staticmethod
-    def setup_db() -> AbstractDB:
+    def setup_db(tmp_path: Path) -> AbstractDB:
         """
         Initializes the database.
 
+        Parameters
+        ----------
+        tmp_path : Path
+            Temporary folder.
+
         Returns
         -------
         AbstractDB
             Initialized database.
         """
-        db = SqliteDB().setup(database="test.db")
+        db = SqliteDB().setup(database=str(tmp_path / "test.db"))
         return db
 
-    @pytest.mark.parametrize("session_name", [f"chat{i}" for i in range(10)])
-    def test_session(self, session_name: str):
+    @pytest.mark.parametrize(
+        "session_name", [f"chat{i}" for i in range(10)] + ["chat-10", "a chat"]
+    )
+    def test_session(self, tmp_path: Path, session_name: str):
         """
         Tests the session creation and deletion.
 
         Parameters
         ----------
+        tmp_path : Path
+            Temporary folder.
         session_name : str
             Session name.
         """
-        db = TestSqliteDB.setup_db()
+        db = TestSqliteDB.setup_db(tmp_path)
         db.create_session(session_name)
-        cursor = db.connection.cursor()
-        cursor.execute("SELECT name FROM sqlite_schema;")
-        (*result,) = map(lambda i: i[0], cursor.fetchall())
-        assert session_name in result
+        assert session_name in db.list_sessions()
 
         db.delete_session(session_name)
+        assert session_name not in db.list_sessions()
+
+    def test_legacy_sessions(self, tmp_path: Path):
+        """
+        Tests that sessions stored as tables are moved into the registry, and that other tables are
+        left alone.
+
+        Parameters
+        ----------
+        tmp_path : Path
+            Temporary folder.
+        """
+        path = str(tmp_path / "legacy.db")
+        connection = sqlite3.connect(path)
+        connection.execute(
+            "CREATE TABLE legacy(id INTEGER PRIMARY KEY AUTOINCREMENT, role TEXT, content TEXT, timestamp INT);"
+        )
+        connection.execute(
+            "INSERT INTO legacy (role, content, timestamp) VALUES ('user', 'hello', 1);"
+        )
+        connection.execute("CREATE TABLE notes(key TEXT, value TEXT);")
+        connection.execute("INSERT INTO notes VALUES ('a', 'b');")
+        connection.commit()
+        connection.close()
+
+        db = SqliteDB().setup(database=path)
+        assert db.list_sessions() == ["legacy"]
+        assert db.get_messages("legacy").values[0].content == "hello"
+        db.close()
+        connection = sqlite3.connect(path)
+        assert connection.execute("SELECT * FROM notes;").fetchall() == [("a", "b")]
+        connection.close()
+
+    def test_migrations(self, tmp_path: Path):
+        """
+        Tests that large legacy databases are upgraded in batches, and that sessions are listed and
+        moved on demand while the migration is pending.
+
+        Parameters
+        ----------
+        tmp_path : Path
+            Temporary folder.
+        """
+        path = str(tmp_path / "legacy.db")
+        connection = sqlite3.connect(path)
+        for table, n_messages in [("big", 2500), ("huge", 3000), ("small", 3)]:
+            connection.execute(
+                f"CREATE TABLE {table}(id INTEGER PRIMARY KEY AUTOINCREMENT, role TEXT, content TEXT, timestamp INT);"
+            )
+            connection.executemany(
+                f"INSERT INTO {table} (role, content, timestamp) VALUES ('user', ?, ?);",
+                ((str(i), i) for i in range(n_messages)),
+            )
+        connection.commit()
+        connection.close()
+
+        db = SqliteDB().setup(database=path)
+        version = lambda: db.connection.execute("PRAGMA user_version;").fetchone()[0]
+        assert version() == len(MIGRATIONS) - 1
+        assert db.list_sessions() == ["big", "huge", "small"]
+        infos = {info.name: info.message_count for info in db.get_sessions()}
+        assert infos == {"big": 2500, "huge": 3000, "small": 3}
+        (info,) = [info for info in db.get_sessions() if info.name == "big"]
+        assert (info.created_at, info.updated_at, info.preview) == (0, 2499, "2499")
+        contents = [msg.content for msg in db.get_messages("huge")]
+        assert contents == [str(i) for i in range(3000)]
+        steps = 1
+        while db.migrate(batch_size=1000) > 0:
+            steps += 1
+        assert steps == 3 and version() == len(MIGRATIONS)
+        infos = {info.name: info.message_count for info in db.get_sessions()}
+        assert infos == {"big": 2500, "huge": 3000, "small": 3}
+        assert [msg.content for msg in db.get_messages("big")][-1] == "2499"
+        db.close()
 
-        cursor = db.connection.cursor()
-        cursor.execute("SELECT name FROM sqlite_schema;")
-        (*result,) = map(lambda i: i[0], cursor.fetchall())
-        assert session_name not in result
+        db = SqliteDB().setup(database=str(tmp_path / "new.db"))
+        assert db.migrate() == 0 and version() == len(MIGRATIONS)
+        db.close()
 
     @pytest.mark.parametrize("message", ["hello", "testing", "hi"])
-    def test_message(self, message: str):
+    def test_message(self, tmp_path: Path, message: str):
         """
         Tests the save and retrieval of messages.
 
         Parameters
         ----------
+        tmp_path : Path
+            Temporary folder.
         message : str
             Message to save.
         """
-        db = TestSqliteDB.setup_db()
+        db = TestSqliteDB.setup_db(tmp_path)
         db.create_session("test")
         msg = Message(role="user", content=message)
         msgt = MessageWithTime(message=msg, timestamp=int(time.time()))
         db.add_message(msgt, "test")
 
         messages = db.get_messages("test")
-        msgt2 = messages.values[0].dict()
+        msgt2 = messages.values[0]._asdict()
         assert msgt2 == msg.dict()
         db.delete_session("test")
+
+    def test_session_metadata(self, tmp_path: Path):
+        """
+        Tests that the sessions metadata is updated with every message.
+        """
+        db = TestSqliteDB.setup_db(tmp_path)
+        for session in ["chat0", "chat1"]:
+            db.create_session(session)
+        now = int(time.time())
+        db.add_message(
+            MessageWithTime(message=Message(role="user", content="hi"), timestamp=now),
+            "chat1",
+        )
+        msgs = [
+            MessageWithTime(
+                message=Message(role="user", content="a" * 8), timestamp=now + 1
+            )
+        ] * 2
+        db.add_messages(msgs, "chat0")
+
+        infos = [info for info in db.get_sessions() if info.name in ("chat0", "chat1")]
+        assert [info.name for info in infos] == ["chat0", "chat1"]
+        assert (infos[0].message_count, infos[0].token_total) == (2, 4)
+        assert (infos[1].message_count, infos[1].preview) == (1, "hi")
+        db.delete_session("chat0")
+        db.delete_session("chat1")
+
+    def test_summary(self, tmp_path: Path):
+        """
+        Tests that summaries replace the messages they cover.
+        """
+        db = TestSqliteDB.setup_db(tmp_path)
+        db.create_session("test")
+        msgs = [
+            MessageWithTime(message=Message(role=role, content=str(i)), timestamp=i)
+            for i, role in enumerate(["system", "user", "assistant", "user"])
+        ]
+        db.add_messages(msgs, "test")
+
+        compactable, until_id = db.get_compactable("test", keep=1)
+        assert [msg.content for msg in compactable.values] == ["1", "2"]
+        db.add_summary("summary", until_id, "test")
+
+        recent = db.get_recent_messages("test")
+        assert [(msg.role, msg.content) for msg in recent.values] == [
+            ("system", "0"),
+            (SUMMARY_ROLE, "summary"),
+            ("user", "3"),
+        ]
+        assert len(db.get_messages("test").values) == 4
+        compactable, until_id = db.get_compactable("test", keep=1)
+        assert until_id is None
+        db.delete_session("test")
+
+    def test_remote_state(self, tmp_path: Path):
+        """
+        Tests the tracking of the messages that a model's server has seen.
+        """
+        db = TestSqliteDB.setup_db(tmp_path)
+        db.create_session("test")
+        assert db.get_remote_state("test") == (None, 0)
+        for role, remote_id in [("user", None), ("assistant", "r1"), ("user", None)]:
+            msg = Message(role=role, content=role)
+            db.add_message(
+                MessageWithTime(message=msg, timestamp=1, remote_id=remote_id), "test"
+            )
+
+        remote_id, seen_id = db.get_remote_state("test")
+        assert remote_id == "r1"
+        assert db.get_messages_after("test", seen_id).values == [("user", "user")]
+        db.delete_session("test")
+
+    def test_requests(self, tmp_path: Path):
+        """
+        Tests the queue of requests to the model.
+        """
+        db = TestSqliteDB.setup_db(tmp_path)
+        db.create_session("test")
+        user = MessageWithTime(message=Message(role="user", content="1"), timestamp=1)
+        dropped = db.enqueue_request(user, "test")
+        user = MessageWithTime(message=Message(role="user", content="2"), timestamp=2)
+        request_id = db.enqueue_request(user, "test")
+        assert db.get_pending_requests() == [(request_id, "test", "2")]
+        assert not db.complete_request(dropped, None, "test")
+
+        answer = MessageWithTime(
+            message=Message(role="assistant", content="3"), timestamp=3
+        )
+        assert db.complete_request(request_id, answer, "test")
+        assert not db.complete_request(request_id, answer, "test")
+        assert db.get_pending_requests("test") == []
+        assert [msg.content for msg in db.get_messages("test").values] == [
+            "1",
+            "2",
+            "3",
+        ]
+        assert db.get_sessions()[0].message_count == 3
+        db.delete_session("test")
+
+    @staticmethod
+    def add_metrics(db: AbstractDB, day: int, latencies: Dict[str, List[float]]):
+        """
+        Stores answers with their metrics, the session "b" runs on a local backend.
+
+        Parameters
+        ----------
+        db : AbstractDB
+            Database.
+        day : int
+            Unix time of the first answer.
+        latencies : Dict[str, List[float]]
+            Latency of every answer per session.
+        """
+        for session, values in latencies.items():
+            db.create_session(session)
+            for i, latency in enumerate(values):
+                user = MessageWithTime(
+                    message=Message(role="user", content="q"), timestamp=i
+                )
+                request_id = db.enqueue_request(user, session)
+                answer = MessageWithTime(
+                    message=Message(role="assistant", content="a"), timestamp=i
+                )
+                backend = "local" if session == "b" else "openai"
+                metric = TurnMetric(
+                    backend,
+                    day + i * 3600 * 8,
+                    latency,
+                    10 * (i + 1),
+                    5,
+                    session == "b",
+                )
+                assert db.complete_request(request_id, answer, session, metric)
+
+    def test_usage(self, tmp_path: Path):
+        """
+        Tests that the metrics are stored with the answers and aggregated per group.
+        """
+        db = TestSqliteDB.setup_db(tmp_path)
+        day = 86400 * 20000
+        TestSqliteDB.add_metrics(db, day, {"a": [10.0, 40.0, 20.0, 30.0], "b": [5.0]})
+        assert db.get_usage(UsageGroupEnum.SESSION) == [
+            ("a", 4, 100, 20, 40, 0),
+            ("b", 1, 10, 5, 10, 1),
+        ]
+        assert [row.key for row in db.get_usage(UsageGroupEnum.BACKEND)] == [
+            "openai",
+            "local",
+        ]
+        assert [row[:2] for row in db.get_usage(UsageGroupEnum.DAY)] == [
+            ("2024-10-04", 4),
+            ("2024-10-05", 1),
+        ]
+        assert db.get_usage(UsageGroupEnum.SESSION, since=day + 1)[0][:2] == ("a", 3)
+        db.delete_session("a")
+        db.delete_session("b")
+
+    def test_usage_stats(self, tmp_path: Path):
+        """
+        Tests the latency percentiles of every group.
+        """
+        np = pytest.importorskip("numpy")
+        from gpttui.database.usage import usage_stats
+
+        db = TestSqliteDB.setup_db(tmp_path)
+        latencies = {"a": [10.0, 40.0, 20.0, 30.0], "b": [5.0]}
+        TestSqliteDB.add_metrics(db, 86400 * 20000, latencies)
+        stats = {
+            s.usage.key: s.latencies_ms
+            for s in usage_stats(
+                db, UsageGroupEnum.SESSION, percentiles=[0, 50, 90, 100]
+            )
+        }
+        assert stats["a"] == pytest.approx(
+            tuple(np.percentile(latencies["a"], [0, 50, 90, 100]))
+        )
+        assert stats["b"] == (5.0, 5.0, 5.0, 5.0)
+        with pytest.raises(ValueError):
+            usage_stats(db, UsageGroupEnum.SESSION, percentiles=[50, 101])
+        for percentiles in ["50,-1", "p99"]:
+            result = CliRunner().invoke(
+                cli,
+                ["stats", "--config_path", str(tmp_path), "--percentiles", percentiles],
+            )
+            assert result.exit_code == 1 and "Percentiles must be" in result.output
+        db.delete_session("a")
+        db.delete_session("b")
+        assert db.get_usage(UsageGroupEnum.SESSION) == []
+
+    def test_retention(self, tmp_path: Path):
+        """
+        Tests that the retention policies keep the system messages and the pending requests.
+        """
+        db = TestSqliteDB.setup_db(tmp_path)
+        now = 86400 * 100
+        for session in ["a", "b"]:
+            db.create_session(session)
+            db.add_message(
+                MessageWithTime(
+                    message=Message(role="system", content="s"), timestamp=0
+                ),
+                session,
+            )
+            db.add_messages(
+                (
+                    MessageWithTime(
+                        message=Message(role="user", content=str(day)),
+                        timestamp=day * 86400,
+                    )
+                    for day in range(1, 100)
+                ),
+                session,
+            )
+        user = MessageWithTime(message=Message(role="user", content="q"), timestamp=0)
+        db.enqueue_request(user, "b")
+        db.set_retention("a", RetentionPolicy(max_messages=3))
+        assert db.get_retention("a") == (0, 3) and db.get_retention("b") is None
+
+        assert db.apply_retention(RetentionPolicy(max_age_days=10), now) == 96 + 89
+        contents = lambda session: [msg.content for msg in db.get_messages(session)]
+        assert contents("a") == ["s", "97", "98", "99"]
+        assert contents("b") == ["s"] + [str(day) for day in range(90, 100)] + ["q"]
+        assert db.get_pending_requests("b")[0].content == "q"
+        assert {info.name: info.message_count for info in db.get_sessions()} == {
+            "a": 4,
+            "b": 12,
+        }
+        assert db.apply_retention(RetentionPolicy(max_age_days=10), now) == 0
+        db.set_retention("a", None)
+        assert db.get_retention("a") is None
+        db.delete_session("a")
+        db.delete_session("b")
+
+    def test_vacuum(self, tmp_path: Path):
+        """
+        Tests that deleted sessions are returned to the file system in bounded steps.
+        """
+        path = tmp_path / "vacuum.sqlite"
+        db = SqliteDB().setup(database=str(path))
+        db.create_session("small")
+        db.add_message(
+            MessageWithTime(message=Message(role="user", content="x"), timestamp=0),
+            "small",
+        )
+        db.create_session("big")
+        db.add_messages(
+            (
+                MessageWithTime(
+                    message=Message(role="user", content="x" * 1000), timestamp=i
+                )
+                for i in range(2000)
+            ),
+            "big",
+        )
+        wal = path.with_name(f"{path.name}-wal")
+        size = path.stat().st_size + wal.stat().st_size
+        db.delete_session("big")
+        free_pages = db.vacuum_step(100)
+        assert free_pages > 0
+        while free_pages:
+            free_pages = db.vacuum_step(100)
+        assert path.stat().st_size + wal.stat().st_size < size / 10
+        db.optimize()
+        stats = db.connection.execute("SELECT count(*) FROM sqlite_stat1;").fetchone()
+        assert stats[0] > 0
+        db.close()
+
+    def test_legacy_vacuum(self, tmp_path: Path):
+        """
+        Tests that `gpttui maintain` rebuilds once the databases that were created without the
+        incremental vacuum, so their free pages can be released.
+        """
+        path = tmp_path / "legacy.sqlite"
+        # NOTE: older versions didn't set auto_vacuum, it can't change once a table exists.
+        connection = sqlite3.connect(path)
+        connection.execute("CREATE TABLE legacy (x INTEGER);")
+        connection.close()
+        db = SqliteDB().setup(database=str(path))
+        db.create_session("big")
+        db.add_messages(
+            (
+                MessageWithTime(
+                    message=Message(role="user", content="x" * 1000), timestamp=i
+                )
+                for i in range(500)
+            ),
+            "big",
+        )
+        db.delete_session("big")
+        assert db.vacuum_step(100) == -1
+        db.close()
+        args = ["maintain", "--config_path", str(tmp_path)]
+        result = CliRunner().invoke(cli, [*args, "--database_name", path.name])
+        assert result.exit_code == 0, result.output
+        assert "Rebuilding the database" in result.output
+        db = SqliteDB().setup(database=str(path))
+        assert db.connection.execute("PRAGMA auto_vacuum;").fetchone()[0] == 2
+        assert db.vacuum_step(100) == 0
+        db.close()
+
+    def test_archive(self, tmp_path: Path):
+        """
+        Tests that archived sessions are restored exactly on their first access.
+
+        Parameters
+        ----------
+        tmp_path : Path
+            Temporary folder.
+        """
+        path = str(tmp_path / "archive.sqlite")
+        db = SqliteDB().setup(database=path)
+        for session in ["old", "busy", "new"]:
+            db.create_session(session)
+            db.add_messages(
+                (
+                    MessageWithTime(
+                        message=Message(role="user", content=f"{session} {i}"),
+                        timestamp=i,
+                    )
+                    for i in range(10)
+                ),
+                session,
+            )
+        _, until_id = db.get_compactable("old", keep=2)
+        db.add_summary("summary", until_id, "old")
+        user = MessageWithTime(message=Message(role="user", content="q"), timestamp=10)
+        db.enqueue_request(user, "busy")
+        db.connection.execute("UPDATE sessions SET updated_at = 10;")
+        db.connection.commit()
+        before = db.get_recent_messages("old").payload()
+
+        assert db.get_inactive_sessions(100) == ["old", "new"]
+        assert db.archive_session("old") == 11
+        assert db.archive_session("old") == 0
+        assert db.get_inactive_sessions(100) == ["new"]
+        assert len(list(db.archive_path.iterdir())) == 1
+        infos = {info.name: info for info in db.get_sessions()}
+        assert infos["old"].archived and infos["old"].message_count == 10
+        assert db.connection.execute(
+            "SELECT count(*) FROM messages WHERE session_id = ?;",
+            (
+                db.connection.execute(
+                    "SELECT id FROM sessions WHERE name = 'old';"
+                ).fetchone()[0],
+            ),
+        ).fetchone() == (0,)
+        db.close()
+
+        db = SqliteDB().setup(database=path)
+        assert db.get_recent_messages("old").payload() == before
+        assert list(db.archive_path.iterdir()) == []
+        assert not any(info.archived for info in db.get_sessions())
+        assert db.restore_session("old") == 0
+
+        db.archive_session("new")
+        db.delete_session("new")
+        assert list(db.archive_path.iterdir()) == []
+        db.close()
+
+    def test_concurrency(self, tmp_path: Path):
+        """
+        Tests that writes wait for the lock of another process and that its commits are seen.
+
+        Parameters
+        ----------
+        tmp_path : Path
+            Temporary folder.
+        """
+        path = str(tmp_path / "shared.sqlite")
+        db = SqliteDB().setup(database=path, timeout="0.05", retries="10")
+        db.create_session("test")
+        version = db.get_data_version()
+        other = SqliteDB().setup(database=path)
+        other.add_message(
+            MessageWithTime(message=Message(role="user", content="a"), timestamp=0),
+            "test",
+        )
+        assert db.get_data_version() != version
+
+        writer = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        writer.execute("BEGIN IMMEDIATE;")
+        timer = threading.Timer(0.2, lambda: writer.execute("COMMIT;"))
+        timer.start()
+        db.add_message(
+            MessageWithTime(message=Message(role="user", content="b"), timestamp=1),
+            "test",
+        )
+        timer.join()
+        stats = db.get_lock_stats()
+        assert stats.contended == 1 and stats.retries > 0 and stats.failures == 0
+        assert stats.max_wait_ms >= 150
+        assert [msg.content for msg in other.get_messages("test")] == ["a", "b"]
+
+        writer.execute("BEGIN IMMEDIATE;")
+        db.retries = 0
+        with pytest.raises(sqlite3.OperationalError):
+            db.add_message(
+                MessageWithTime(message=Message(role="user", content="c"), timestamp=2),
+                "test",
+            )
+        writer.execute("ROLLBACK;")
+        assert db.get_lock_stats().failures == 1
+        assert len(db.get_messages("test")) == 2
+        writer.close()
+        other.close()
+        db.close()
+
+    def test_maintainer(self, tmp_path: Path):
+        """
+        Tests that the maintenance waits for the user to be idle and runs one step at a time.
+        """
+        db = TestSqliteDB.setup_db(tmp_path)
+        maintainer = Maintainer(idle_seconds=60)
+        assert maintainer.step(db) is None
+        maintainer.idle_seconds = 0
+        steps = [maintainer.step(db) for _ in range(4)]
+        assert steps == ["retention", "vacuum", "optimize", None]
+
+    def test_indexed_messages(self, tmp_path: Path):
+        """
+        Tests the queries used to index the messages of every session.
+        """
+        db = TestSqliteDB.setup_db(tmp_path)
+        for session_name in ["a", "b"]:
+            db.create_session(session_name)
+            for role in ["system", "user", "assistant"]:
+                msg = Message(role=role, content=f"{session_name} {role}")
+                db.add_message(MessageWithTime(message=msg, timestamp=1), session_name)
+        msgs = list(db.iter_messages_after(0, batch_size=1))
+        assert [msg.content for msg in msgs][-4:] == [
+            "a user",
+            "a assistant",
+            "b user",
+            "b assistant",
+        ]
+        assert list(db.iter_messages_after(msgs[-1].id)) == []
+        found = db.get_messages_by_ids([msgs[-1].id, msgs[-4].id, -1])
+        assert sorted(found) == sorted([msgs[-1], msgs[-4]])
+        db.delete_session("a")
+        db.delete_session("b")
+
+    @pytest.mark.parametrize("n_messages", [1, 10, 2500])
+    def test_bulk_messages(self, tmp_path: Path, n_messages: int):
+        """
+        Tests the bulk insertion and the batched iteration of messages.
+
+        Parameters
+        ----------
+        tmp_path : Path
+            Temporary folder.
+        n_messages : int
+            Number of messages to insert.
+        """
+        db = TestSqliteDB.setup_db(tmp_path)
+        db.create_session("test")
+        msgs = (
+            MessageWithTime(message=Message(role="user", content=str(i)), timestamp=i)
+            for i in range(n_messages)
+        )
+        assert db.add_messages(msgs, "test") == n_messages
+
+        contents = [msg.message.content for msg in db.iter_messages("test", 1000)]
+        assert contents == [str(i) for i in range(n_messages)]
+        db.delete_session("test")
+
+    def test_transfer(self, tmp_path: Path):
+        """
+        Tests the export and import of sessions through JSON lines.
+
+        Parameters
+        ----------
+        tmp_path : Path
+            Temporary folder.
+        """
+        db = TestSqliteDB.setup_db(tmp_path)
+        for session in ["chat0", "chat1"]:
+            db.create_session(session)
+            msg = Message(role="user", content=f"hello from {session}")
+            db.add_message(MessageWithTime(message=msg, timestamp=1), session)
+
+        path = tmp_path / "sessions.jsonl"
+        assert export_jsonl(db, ["chat0", "chat1"], path) == 2
+        db.delete_session("chat0")
+        db.delete_session("chat1")
+
+        assert import_jsonl(db, path) == 2
+        for session in ["chat0", "chat1"]:
+            messages = db.get_messages(session)
+            assert messages.values[0].content == f"hello from {session}"
+            db.delete_session(session)
+
+
+@pytest.fixture(scope="module")
+def postgres_dsn() -> Iterator[str]:
+    """
+    Connection string of a postgresql server, it uses `GPTTUI_POSTGRES_DSN` or an embedded server.
+
+    Yields
+    ------
+    str
+        Connection string.
+    """
+    pytest.importorskip("psycopg_pool")
+    if "GPTTUI_POSTGRES_DSN" in os.environ:
+        yield os.environ["GPTTUI_POSTGRES_DSN"]
+        return
+    pgserver = pytest.importorskip("pgserver")
+    with tempfile.TemporaryDirectory() as folder:
+        server = pgserver.get_server(folder, cleanup_mode="stop")
+        yield server.get_uri()
+        server.cleanup()
+
+
+class TestPostgresDB:
+    """
+    Unittests for the postgresql database.
+    """
+
+    @pytest.mark.parametrize("session_name", ["chat0", "chat-1", "a chat"])
+    def test_session(self, postgres_dsn: str, session_name: str):
+        """
+        Tests the session creation and deletion.
+
+        Parameters
+        ----------
+        postgres_dsn : str
+            Connection string.
+        session_name : str
+            Session name.
+        """
+        from gpttui.database.postgres import PostgresDB
+
+        db = PostgresDB().setup(database=postgres_dsn)
+        db.create_session(session_name)
+        assert session_name in db.list_sessions()
+        db.delete_session(session_name)
+        assert session_name not in db.list_sessions()
+        db.close()
+
+    @pytest.mark.parametrize("n_messages", [1, 2500])
+    def test_messages(self, postgres_dsn: str, n_messages: int):
+        """
+        Tests the save and retrieval of messages.
+
+        Parameters
+        ----------
+        postgres_dsn : str
+            Connection string.
+        n_messages : int
+            Number of messages to insert.
+        """
+        from gpttui.database.postgres import PostgresDB
+
+        db = PostgresDB().setup(database=postgres_dsn)
+        db.create_session("test")
+        msg = Message(role="user", content="hello")
+        db.add_message(MessageWithTime(message=msg, timestamp=0), "test")
+        msgs = (
+            MessageWithTime(message=Message(role="user", content=str(i)), timestamp=i)
+            for i in range(n_messages)
+        )
+        assert db.add_messages(msgs, "test") == n_messages
+
+        assert db.get_messages("test").values[0]._asdict() == msg.dict()
+        contents = [msg.message.content for msg in db.iter_messages("test", 1000)]
+        assert contents == ["hello"] + [str(i) for i in range(n_messages)]
+        db.delete_session("test")
+        db.close()
+
+    def test_requests(self, postgres_dsn: str):
+        """
+        Tests the queue of requests to the model.
+
+        Parameters
+        ----------
+        postgres_dsn : str
+            Connection string.
+        """
+        from gpttui.database.postgres import PostgresDB
+
+        db = PostgresDB().setup(database=postgres_dsn)
+        db.create_session("test")
+        user = MessageWithTime(message=Message(role="user", content="1"), timestamp=1)
+        request_id = db.enqueue_request(user, "test")
+        assert db.get_pending_requests("test") == [(request_id, "test", "1")]
+        answer = MessageWithTime(
+            message=Message(role="assistant", content="2"), timestamp=2
+        )
+        assert db.complete_request(request_id, answer, "test")
+        assert not db.complete_request(request_id, answer, "test")
+        assert db.get_pending_requests() == []
+        assert [msg.content for msg in db.get_messages("test").values] == ["1", "2"]
+        db.delete_session("test")
+        db.close()
+
+    def test_indexed_messages(self, postgres_dsn: str):
+        """
+        Tests the queries used to index the messages of every session.
+
+        Parameters
+        ----------
+        postgres_dsn : str
+            Connection string.
+        """
+        from gpttui.database.postgres import PostgresDB
+
+        db = PostgresDB().setup(database=postgres_dsn)
+        db.create_session("test")
+        for role in ["system", "user", "assistant"]:
+            msg = Message(role=role, content=role)
+            db.add_message(MessageWithTime(message=msg, timestamp=1), "test")
+        msgs = list(db.iter_messages_after(0))
+        assert [msg.content for msg in msgs][-2:] == ["user", "assistant"]
+        assert db.get_messages_by_ids([msgs[-1].id]) == [msgs[-1]]
+        db.delete_session("test")
+        db.close()
+
+
+class TestEmbeddingIndex:
+    """
+    Unittests for the index of message vectors.
+    """
+
+    def test_search(self, tmp_path: Path):
+        """
+        Tests the search, the exclusion of a session and the recovery of interrupted appends.
+        """
+        np = pytest.importorskip("numpy")
+        from gpttui.embeddings.index import EmbeddingIndex
+
+        index = EmbeddingIndex(tmp_path / "db.sqlite", space="test", dim=2)
+        index.append([1, 2, 3], [10, 10, 20], np.array([[1, 0], [0.8, 0.6], [0, 1]]))
+        assert index.last_id() == 3
+        assert [i for i, _ in index.search(np.array([1, 0]), k=2)] == [1, 2]
+        assert [i for i, _ in index.search(np.array([1, 0]), 2, exclude_key=10)] == [3]
+
+        with open(index.vectors_path, "ab") as f:
+            f.write(b"\0" * 4)
+        index.append([4], [20], np.array([[0.6, 0.8]]))
+        reopened = EmbeddingIndex(tmp_path / "db.sqlite", space="test", dim=2)
+        assert reopened.last_id() == 4
+        assert [i for i, _ in reopened.search(np.array([0, 1]), k=1)] == [3]
+
+    def test_exact(self, tmp_path: Path):
+        """
+        Tests that the search finds the same neighbours as an exhaustive ranking.
+        """
+        np = pytest.importorskip("numpy")
+        from gpttui.embeddings.index import EmbeddingIndex
+
+        n, dim = 2000, 16
+        index = EmbeddingIndex(tmp_path / "db.sqlite", space="test", dim=dim)
+        vectors = np.random.default_rng(0).random((n, dim), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        keys = np.arange(n, dtype=np.int64) % 3
+        index.append(np.arange(1, n + 1), keys, vectors)
+        scores = vectors @ vectors[42]
+        scores[keys == 1] = -np.inf
+        expected = list(np.argsort(scores)[::-1][:5] + 1)
+        assert [i for i, _ in index.search(vectors[42], k=5, exclude_key=1)] == expected
+
+    @pytest.mark.slow
+    def test_latency(self, tmp_path: Path):
+        """
+        Tests that a search over a million messages takes tens of milliseconds, it writes half a
+        gigabyte so it only runs with `pytest -m slow`.
+        """
+        np = pytest.importorskip("numpy")
+        from gpttui.embeddings.index import EmbeddingIndex
+
+        n, dim = 1_000_000, 128
+        index = EmbeddingIndex(tmp_path / "db.sqlite", space="test", dim=dim)
+        vectors = np.random.default_rng(0).random((n, dim), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        index.append(np.arange(1, n + 1), np.zeros(n, dtype=np.int64), vectors)
+        index.search(vectors[0], k=5)
+        start = time.perf_counter()
+        hits = index.search(vectors[42], k=5, exclude_key=1)
+        assert time.perf_counter() - start < 0.2
+        assert hits[0][0] == 43
@@ -1,51 +1,520 @@
 """
 Defines the tests that are performed over models.
 """
-import pytest
-from gpttui.database.base import AbstractDB
-from gpttui.models.base import AbstractModel
-from gpttui.models.openai import OpenAIModel
+import asyncio, httpx, os, pytest, time
+from concurrent.futures.process import BrokenProcessPool
+from conftest import EchoModel
+from pydantic import BaseModel
+from gpttui.codec import ArrayEncoder, dumps, dumps_object, loads
+from gpttui.database.base import AbstractDB, Messages, MessageRecord, UsageGroupEnum
+from gpttui.models.cassettes import (
+    Cassette,
+    CassetteMiss,
+    RecordingTransport,
+    ReplayTransport,
+    cassette_transport,
+)
+from gpttui.models.chatsonic import ChatSonicConf, ChatSonicModel
+from gpttui.models.colossal import ColossalConf, ColossalModel
+from gpttui.models.base import AbstractModel, StateMismatch
+from gpttui.models.compaction import Compactor
+from gpttui.models.turns import iter_conversation, iter_turns
+from gpttui.models.workers import WorkerPool, send_all
+from gpttui.models.openai import OpenAIConf, OpenAIModel
 from gpttui.database.sqlite import SqliteDB
-from typing import Tuple
+from multiprocessing.connection import Connection
+from pathlib import Path
+from typing import List, Optional, Tuple, Type
+
+
+CASSETTES = Path(__file__).parent / "cassettes"
+RECORD = os.environ.get("GPTTUI_RECORD") == "1"
 
 
 class TestOpenAi:
     """
-    Tests that are used for any OpenAI model.
+    Tests that are used for any OpenAI model, replayed from cassettes. Run with `GPTTUI_RECORD=1`
+    and `GPTTUI_OPENAI_API_KEY` to record them again.
     """
 
     @staticmethod
-    def setup_model() -> Tuple[AbstractDB, AbstractModel]:
+    def setup_model(cassette: str, tmp_path: Path) -> Tuple[AbstractDB, AbstractModel]:
         """
         Initialize the model and the database.
 
+        Parameters
+        ----------
+        cassette : str
+            Name of the cassette.
+        tmp_path : Path
+            Temporary folder.
+
         Returns
         -------
         Tuple[AbstractDB, AbstractModel]
             Initialized database and model.
         """
-        db = SqliteDB().setup(database="test.db")
+        db = SqliteDB().setup(database=str(tmp_path / "test.db"))
         model = (
             OpenAIModel()
             .add_context(context="You're an expert programmer")
-            .setup(model_name="gpt-3.5-turbo", database=db, session_name="test")
+            .setup(
+                config=OpenAIConf(api_key=os.environ.get("GPTTUI_OPENAI_API_KEY", "")),
+                database=db,
+                session_name="test",
+                transport=cassette_transport(CASSETTES / f"{cassette}.json", RECORD),
+            )
         )
         return db, model
 
     @pytest.mark.parametrize(
-        "message", ["Is Python better than JS?", "How to write hello word in Python?"]
+        "cassette,message",
+        [
+            ("openai_python_vs_js", "Is Python better than JS?"),
+            ("openai_hello_world", "How to write hello word in Python?"),
+        ],
     )
-    def test_generation(self, message: str):
+    def test_generation(self, tmp_path: Path, cassette: str, message: str):
         """
         Tests the generation from the models.
 
         Parameters
         ----------
+        tmp_path : Path
+            Temporary folder.
+        cassette : str
+            Name of the cassette.
         message : str
             Input message.
         """
-        db, model = TestOpenAi.setup_model()
+        db, model = TestOpenAi.setup_model(cassette, tmp_path)
+        db.create_session(session_name="test")
+        answer = asyncio.run(model.get_answer(message))
+        asyncio.run(model.close())
+        usage = {row.key: row for row in db.get_usage(UsageGroupEnum.SESSION)}
+        db.delete_session(session_name="test")
+        db.close()
+        assert isinstance(answer, str) and answer
+        assert usage["test"][1:] == (1, 24, 38, 24, 0)
+
+
+class StatefulEchoModel(EchoModel):
+    """
+    Offline model whose server remembers the conversation.
+    """
+
+    known: List[str] = []
+    sent: List[int] = []
+
+    def is_stateful(self) -> bool:
+        return True
+
+    async def generate_stateful(
+        self, msgs: Messages, remote_id: Optional[str]
+    ) -> Tuple[str, Optional[str]]:
+        if remote_id is not None and remote_id not in self.known:
+            raise StateMismatch(remote_id)
+        self.sent.append(len(msgs.values))
+        self.known.append(f"r{len(self.sent)}")
+        return "answer", self.known[-1]
+
+
+class TestStateful:
+    """
+    Tests for models that keep the conversation in their server.
+    """
+
+    def test_delta(self, tmp_path: Path):
+        """
+        Tests that only new messages are sent, and the whole history when the state is lost.
+        """
+        db = SqliteDB().setup(database=str(tmp_path / "test.db"))
+        model = (
+            StatefulEchoModel()
+            .add_context(context="You're an expert programmer")
+            .setup(config=BaseModel(), database=db, session_name="stateful")
+        )
+        model.known, model.sent = [], []
+
+        async def chat(n: int):
+            for i in range(n):
+                await model.get_answer(str(i))
+
+        asyncio.run(chat(3))
+        assert model.sent == [2, 1, 1]
+        model.known.clear()
+        asyncio.run(chat(1))
+        assert model.sent[-1] == 8
+        db.delete_session(session_name="stateful")
+
+
+class TestCompactor:
+    """
+    Tests for the background summarization of sessions.
+    """
+
+    def test_compaction(self, tmp_path: Path):
+        """
+        Tests that long sessions are summarized in the background.
+        """
+        db = SqliteDB().setup(database=str(tmp_path / "test.db"))
+        model = (
+            EchoModel()
+            .add_context(context="You're an expert programmer")
+            .setup(config=BaseModel(), database=db, session_name="compaction")
+            .add_compactor(Compactor(max_messages=4, keep_messages=2))
+        )
+
+        async def chat():
+            for i in range(3):
+                await model.get_answer(str(i))
+            await model.compactor.task  # type: ignore
+
+        asyncio.run(chat())
+        msgs = model.last_messages()
+        assert msgs.values[1].content.startswith("Summary of the previous conversation")
+        assert [msg.content for msg in msgs.values[2:]] == ["2", "6"]
+        db.delete_session(session_name="compaction")
+
+
+class FlakyEchoModel(EchoModel):
+    """
+    Offline model whose first request is lost.
+    """
+
+    calls = 0
+
+    async def generate(self, msgs: Messages) -> str:
+        self.calls += 1
+        if self.calls == 1:
+            raise ConnectionError("network is down")
+        return await super().generate(msgs)
+
+
+class TestRequestQueue:
+    """
+    Tests the recovery of interrupted turns.
+    """
+
+    def test_resume(self, tmp_path: Path):
+        """
+        Tests that a lost request is answered once when the session is resumed.
+        """
+        db = SqliteDB().setup(database=str(tmp_path / "test.db"))
+        model = (
+            FlakyEchoModel()
+            .add_context(context="You're an expert programmer")
+            .setup(config=BaseModel(), database=db, session_name="queue")
+        )
+        with pytest.raises(ConnectionError):
+            asyncio.run(model.get_answer("hi"))
+        assert len(db.get_pending_requests("queue")) == 1
+
+        assert asyncio.run(model.resume_requests()) == ("hi", "2")
+        assert asyncio.run(model.resume_requests()) is None
+        roles = [msg.role for msg in db.get_messages("queue").values]
+        assert roles == ["system", "user", "assistant"]
+        db.delete_session(session_name="queue")
+
+
+class TestRecall:
+    """
+    Tests the retrieval of messages from other sessions.
+    """
+
+    def test_recall(self, tmp_path):
+        """
+        Tests that similar messages of other sessions are added to the prompt.
+        """
+        pytest.importorskip("numpy")
+        from gpttui.embeddings.hashing import HashingConf, HashingEmbedder
+        from gpttui.embeddings.index import EmbeddingIndex
+        from gpttui.models.recall import RECALL_INSTRUCTION, Retriever
+
+        db = SqliteDB().setup(database=str(tmp_path / "db.sqlite"))
+        embedder = HashingEmbedder().setup(config=HashingConf())
+        retriever = Retriever(
+            embedder=embedder,
+            index=EmbeddingIndex(tmp_path / "db.sqlite", embedder.name, 128),
+            top_k=1,
+        )
+        past = (
+            EchoModel()
+            .add_context(context="context")
+            .setup(config=BaseModel(), database=db, session_name="past")
+        )
+        model = (
+            EchoModel()
+            .add_context(context="context")
+            .setup(config=BaseModel(), database=db, session_name="now")
+            .add_retriever(retriever)
+        )
+
+        async def chat():
+            await past.get_answer("my cat is called Tom")
+            await past.get_answer("the weather is sunny")
+            assert await retriever.update(db) == 4
+            msgs = model.last_messages()
+            msgs.values.append(MessageRecord("user", "what is my cat called?"))
+            return await retriever.recall(model, msgs)
+
+        msgs = asyncio.run(chat())
+        assert msgs.values[0].content == "context"
+        assert msgs.values[1].content == (
+            f"{RECALL_INSTRUCTION}\n- (past) user: my cat is called Tom"
+        )
+        db.close()
+
+
+class TestOpenAiClient:
+    """
+    Tests the clients owned by each OpenAI model.
+    """
+
+    def test_credentials(self, tmp_path: Path):
+        """
+        Tests that two models in one process keep their own base url and credentials.
+        """
+        seen = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            seen.append((str(request.url), request.headers["authorization"]))
+            answer = {"choices": [{"message": {"content": "hello"}}]}
+            return httpx.Response(200, content=dumps(answer))
+
+        db = SqliteDB().setup(database=str(tmp_path / "test.db"))
+        transport = httpx.MockTransport(handler)
+        models = [
+            OpenAIModel().setup(
+                config=OpenAIConf(api_key=key, base_url=url),
+                database=db,
+                session_name="test",
+                transport=transport,
+            )
+            for key, url in (("a", "http://one/v1"), ("b", "http://two/v1"))
+        ]
+        msgs = Messages(values=[MessageRecord("user", "hi")])
+
+        async def chat() -> List[str]:
+            answers = [await model.generate(msgs) for model in models]
+            for model in models:
+                await model.close()
+            return answers
+
+        assert asyncio.run(chat()) == ["hello", "hello"]
+        assert seen == [
+            ("http://one/v1/chat/completions", "Bearer a"),
+            ("http://two/v1/chat/completions", "Bearer b"),
+        ]
+        assert all(model.client.is_closed for model in models)
+        db.close()
+
+
+def count_job(n: int, conn: Connection) -> None:
+    """
+    Worker job that streams its process id `n` times, `n` < 0 fails and `n` = 0 kills the worker.
+    """
+    if n == 0:
+        os._exit(1)
+
+    def values():
+        for _ in range(abs(n)):
+            yield os.getpid()
+        if n < 0:
+            raise ValueError("failed job")
+
+    send_all(conn, values())
+
+
+class TestWorkerPool:
+    """
+    Tests the streaming jobs of the process pool used by local models.
+    """
+
+    def test_stream(self):
+        """
+        Tests that jobs stream from other processes, concurrently, and that failures surface.
+        """
+        pool = WorkerPool(workers=2)
+
+        async def collect(n: int) -> List[int]:
+            return [pid async for pid in pool.stream(count_job, n)]
+
+        async def run() -> None:
+            first, second = await asyncio.gather(collect(3), collect(2))
+            assert len(first) == 3 and len(second) == 2
+            assert os.getpid() not in first + second
+            with pytest.raises(ValueError):
+                await collect(-2)
+            with pytest.raises(BrokenProcessPool):
+                await collect(0)
+            assert len(await collect(1)) == 1
+
+        asyncio.run(run())
+        pool.close()
+
+
+class TestCassettes:
+    """
+    Tests the recording and replay of the models' traffic.
+    """
+
+    @pytest.mark.parametrize(
+        "model_type,config",
+        [(ChatSonicModel, ChatSonicConf), (ColossalModel, ColossalConf)],
+    )
+    def test_models(
+        self, tmp_path: Path, model_type: Type[AbstractModel], config: Type[BaseModel]
+    ):
+        """
+        Tests that other providers are replayed from their cassettes.
+
+        Parameters
+        ----------
+        tmp_path : Path
+            Temporary folder.
+        model_type : Type[AbstractModel]
+            Model.
+        config : Type[BaseModel]
+            Configuration of the model.
+        """
+        db = SqliteDB().setup(database=str(tmp_path / "test.db"))
+        name = model_type.__name__.replace("Model", "").lower()
+        model = (
+            model_type()
+            .add_context(context="You're an expert programmer")
+            .setup(
+                config=config(),
+                database=db,
+                session_name="test",
+                transport=cassette_transport(CASSETTES / f"{name}.json", RECORD),
+            )
+        )
         db.create_session(session_name="test")
-        answer = model.get_answer(message)
+        answer = asyncio.run(model.get_answer("How to write hello word in Python?"))
+        asyncio.run(model.close())
         db.delete_session(session_name="test")
-        assert isinstance(answer, str)
+        db.close()
+        assert 'print("Hello, World!")' in answer
+
+    def test_replay(self, tmp_path: Path):
+        """
+        Tests that the chunks and their timing are recorded, and replayed in order at the recorded
+        speed or as fast as possible.
+        """
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            await asyncio.sleep(0.2)
+            return httpx.Response(200, content=request.content[::-1])
+
+        async def send(
+            transport: httpx.AsyncBaseTransport,
+            bodies: Tuple[str, ...] = ("ab", "cd", "ab"),
+        ) -> Tuple[List[str], float]:
+            async with httpx.AsyncClient(transport=transport) as client:
+                start = time.perf_counter()
+                texts = [
+                    (await client.post("http://test/echo", content=body)).text
+                    for body in bodies
+                ]
+                return texts, time.perf_counter() - start
+
+        path = tmp_path / "echo.json"
+        recording = RecordingTransport(Cassette(path), httpx.MockTransport(handler))
+        assert asyncio.run(send(recording))[0] == ["ba", "dc", "ba"]
+        texts, elapsed = asyncio.run(send(cassette_transport(path, realtime=True)))
+        assert texts == ["ba", "dc", "ba"] and elapsed >= 0.6
+        texts, elapsed = asyncio.run(send(cassette_transport(path)))
+        assert texts == ["ba", "dc", "ba"] and elapsed < 0.2
+        with pytest.raises(CassetteMiss):
+            asyncio.run(send(ReplayTransport(Cassette(path)), ("ef",)))
+
+
+class TestPayloads:
+    """
+    Tests the serialization of messages into provider payloads.
+    """
+
+    msgs = Messages(
+        values=[
+            MessageRecord("system", "context"),
+            MessageRecord("user", "hi"),
+            MessageRecord("assistant", "hello"),
+        ]
+    )
+
+    def test_payload(self):
+        """
+        Tests the role/content serialization.
+        """
+        assert TestPayloads.msgs.payload()[1] == {"role": "user", "content": "hi"}
+
+    def test_chatsonic(self):
+        """
+        Tests the chatsonic history.
+        """
+        assert list(ChatSonicModel.parse_messages(TestPayloads.msgs)) == [
+            {"is_sent": True, "message": "hi"},
+            {"is_sent": False, "message": "hello"},
+        ]
+
+    def test_colossal(self):
+        """
+        Tests the colossal history.
+        """
+        assert list(ColossalModel.parse_messages(TestPayloads.msgs)) == [
+            {"instruction": "hi", "response": "hello"}
+        ]
+
+    def test_turns(self):
+        """
+        Tests that failed turns are skipped and the open turn is kept.
+        """
+        msgs = [
+            MessageRecord("system", "context"),
+            MessageRecord("user", "failed"),
+            MessageRecord("user", "hi"),
+            MessageRecord("assistant", "hello"),
+            MessageRecord("assistant", "unrequested"),
+            MessageRecord("user", "bye"),
+        ]
+        assert [(u.content, a and a.content) for u, a in iter_turns(msgs)] == [
+            ("hi", "hello"),
+            ("bye", None),
+        ]
+        assert [msg.content for msg in iter_conversation(msgs)] == [
+            "context",
+            "hi",
+            "hello",
+            "bye",
+        ]
+
+
+class TestCodec:
+    """
+    Tests the JSON encoding of payloads.
+    """
+
+    def test_array_encoder(self):
+        """
+        Tests that the cached prefix is reused and invalidated when it changes.
+        """
+        encoder = ArrayEncoder()
+        items = [{"role": "user", "content": str(i)} for i in range(3)]
+        assert loads(encoder.encode(items)) == items
+
+        first = encoder.cache[0][1]
+        items.append({"role": "assistant", "content": "ñ"})
+        assert loads(encoder.encode(items)) == items
+        assert encoder.cache[0][1] is first
+
+        items[0] = {"role": "user", "content": "changed"}
+        assert loads(encoder.encode(items)) == items
+        assert loads(encoder.encode([])) == []
+
+    def test_dumps_object(self):
+        """
+        Tests objects with already encoded values.
+        """
+        payload = dumps_object({"top_k": 40}, {"history": b"[1,2]"})
+        assert loads(payload) == {"top_k": 40, "history": [1, 2]}
@@ -0,0 +1,301 @@
+"""
+Defines the tests that are performed over the daemon and its clients.
+"""
+import asyncio, pytest, subprocess, sys, threading, time
+from click.testing import CliRunner
+from pathlib import Path
+from pydantic import BaseModel
+from conftest import EchoModel
+from gpttui.database.base import (
+    Message,
+    MessageRecord,
+    Messages,
+    MessageWithTime,
+)
+from gpttui.database.sqlite import SqliteDB
+from gpttui.models.base import ModelsEnum
+from gpttui.server.client import RemoteConf, RemoteDB, RemoteModel
+from gpttui.server.daemon import Daemon, RateLimiter
+from gpttui.server.protocol import RemoteError
+from gpttui.tui.app import GptApp, Message as MessageWidget
+from gpttui.tui.config import css_config, keybindings_config
+from gpttui.tui.main import cli
+from typing import Iterator, Tuple
+
+
+@pytest.fixture
+def daemon(tmp_path: Path) -> Iterator[Tuple[Daemon, Path]]:
+    """
+    Runs a daemon with an echo model in a background thread.
+    """
+    socket_path = tmp_path / "gpttui.sock"
+    loop = asyncio.new_event_loop()
+    daemon = Daemon()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        # NOTE: sqlite connections belong to the thread that opens them.
+        database = str(tmp_path / "database.sqlite")
+        daemon.setup(
+            database=SqliteDB().setup(database=database),
+            config_path=tmp_path,
+            models={ModelsEnum.OPENAI: EchoModel},
+            confs={ModelsEnum.OPENAI: BaseModel},
+            load_config=lambda path, conf: conf(),
+            limiter=RateLimiter(rate=1000, burst=1, concurrency=2),
+            open_database=lambda: SqliteDB().setup(database=database),
+        )
+        task = loop.create_task(daemon.serve(socket_path))
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            ...
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    while not socket_path.exists():
+        time.sleep(0.01)
+    yield daemon, socket_path
+    for task in asyncio.all_tasks(loop):
+        loop.call_soon_threadsafe(task.cancel)
+    thread.join(timeout=5)
+
+
+class TestDaemon:
+    """
+    Tests for the daemon and its thin clients.
+    """
+
+    def test_database(self, daemon: Tuple[Daemon, Path]):
+        """
+        Tests that the database calls are forwarded to the daemon.
+        """
+        _, socket_path = daemon
+        db = RemoteDB().setup(socket=str(socket_path))
+        db.create_session(session_name="remote")
+        assert "remote" in db.list_sessions()
+        assert [info.name for info in db.get_sessions()] == ["remote"]
+        assert len(db.get_messages(session_name="remote")) == 0
+        with pytest.raises(RemoteError):
+            db.call("missing")
+        db.close()
+
+    def test_clients(self, daemon: Tuple[Daemon, Path]):
+        """
+        Tests that several clients share the daemon's model and database.
+        """
+        server, socket_path = daemon
+        models = []
+        for _ in range(3):
+            db = RemoteDB().setup(socket=str(socket_path))
+            model = (
+                RemoteModel()
+                .add_context(context="You're an expert programmer")
+                .setup(
+                    config=RemoteConf(
+                        model_kind=ModelsEnum.OPENAI, model_config="openai.json"
+                    ),
+                    database=db,
+                    session_name="shared",
+                )
+            )
+            models.append(model)
+
+        async def ask():
+            return await asyncio.gather(*[model.get_answer("hi") for model in models])
+
+        answers = asyncio.run(ask())
+        assert sorted(answers) == ["2", "4", "6"]
+        msgs = models[0].database.get_messages(session_name="shared")
+        assert [msg.role for msg in msgs.values].count("assistant") == 3
+        assert len(server.models) == 1
+        for model in models:
+            model.database.close()
+
+    def test_generate(self, daemon: Tuple[Daemon, Path]):
+        """
+        Tests that the daemon's model answers messages that aren't stored.
+        """
+        _, socket_path = daemon
+        db = RemoteDB().setup(socket=str(socket_path))
+        model = (
+            RemoteModel()
+            .add_context(context="context")
+            .setup(
+                config=RemoteConf(
+                    model_kind=ModelsEnum.OPENAI, model_config="openai.json"
+                ),
+                database=db,
+                session_name="generate",
+            )
+        )
+        msgs = Messages(values=[MessageRecord("user", "a"), MessageRecord("user", "b")])
+        assert asyncio.run(model.generate(msgs)) == "2"
+        assert "generate" not in db.list_sessions()
+        db.close()
+
+    def test_app(self, daemon: Tuple[Daemon, Path], tmp_path: Path):
+        """
+        Tests that the TUI of a client runs its database calls off the event loop and shows the
+        messages of other clients.
+        """
+        _, socket_path = daemon
+        db = RemoteDB().setup(socket=str(socket_path))
+        db.create_session(session_name="shared")
+        threads = set()
+        call = db.call
+
+        def record(method: str, **params):
+            threads.add(threading.current_thread())
+            return call(method, **params)
+
+        db.call = record
+        model = (
+            RemoteModel()
+            .add_context(context="context")
+            .setup(
+                config=RemoteConf(
+                    model_kind=ModelsEnum.OPENAI, model_config="openai.json"
+                ),
+                database=db,
+                session_name="shared",
+            )
+        )
+        other = RemoteDB().setup(socket=str(socket_path))
+        app = GptApp.setup_cls(
+            css_path=css_config(tmp_path), keybindings=keybindings_config(tmp_path)
+        )().setup(model=model, sync_every=0.05)
+
+        async def run():
+            async with app.run_test() as pilot:
+                await pilot.pause(0.2)
+                msg = Message(role="user", content="elsewhere")
+                other.add_message(MessageWithTime(message=msg, timestamp=1), "shared")
+                await pilot.pause(0.3)
+                return [widget.message for widget in app.query(MessageWidget)]
+
+        assert asyncio.run(run()) == ["elsewhere"]
+        assert threads and threading.main_thread() not in threads
+        other.close()
+        db.close()
+
+    def test_eviction(self, daemon: Tuple[Daemon, Path]):
+        """
+        Tests that the least recently used models are closed.
+        """
+        server, socket_path = daemon
+        server.max_models = 1
+        db = RemoteDB().setup(socket=str(socket_path))
+        for session in ["a", "b"]:
+            model = (
+                RemoteModel()
+                .add_context(context="context")
+                .setup(
+                    config=RemoteConf(
+                        model_kind=ModelsEnum.OPENAI, model_config="openai.json"
+                    ),
+                    database=db,
+                    session_name=session,
+                )
+            )
+            asyncio.run(model.get_answer("hi"))
+        assert [key[2] for key in server.models] == ["b"]
+        db.close()
+
+    def test_stream(self, daemon: Tuple[Daemon, Path]):
+        """
+        Tests that sessions are streamed in batches and that abandoned streams are closed.
+        """
+        server, socket_path = daemon
+        db = RemoteDB().setup(socket=str(socket_path))
+        db.create_session("stream")
+        db.add_messages(
+            (
+                MessageWithTime(
+                    message=Message(role="user", content=str(i)), timestamp=i
+                )
+                for i in range(5)
+            ),
+            "stream",
+        )
+        contents = [msg.message.content for msg in db.iter_messages("stream", 2)]
+        assert contents == [str(i) for i in range(5)]
+        assert not server.cursors
+        stream = db.iter_messages("stream", 2)
+        next(stream)
+        assert len(server.cursors) == 1
+        stream.close()
+        assert not server.cursors
+        db.close()
+
+    def test_running(self, daemon: Tuple[Daemon, Path]):
+        """
+        Tests that a second daemon doesn't take the socket of a running one.
+        """
+        server, socket_path = daemon
+        with pytest.raises(RuntimeError):
+            asyncio.run(Daemon().serve(socket_path))
+        db = RemoteDB().setup(socket=str(socket_path))
+        assert db.call("ping") == "pong"
+        db.close()
+
+
+class TestServe:
+    """
+    Tests for the serve subcommand.
+    """
+
+    def test_imports(self):
+        """
+        Tests that the daemon doesn't import the TUI, and that the front doesn't import the models
+        that it doesn't use.
+        """
+        code = (
+            "import sys\n"
+            "import gpttui.tui.serve\n"
+            "print(any(m.startswith('textual') for m in sys.modules))\n"
+            "import gpttui.tui.front\n"
+            "print(sorted(m for m in sys.modules if m.startswith('gpttui.models.')))"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, timeout=60
+        )
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.splitlines() == [
+            "False",
+            "['gpttui.models.base', 'gpttui.models.compaction']",
+        ]
+
+    def test_front_options(self, tmp_path: Path):
+        """
+        Tests that the front refuses the options that only the daemon uses.
+        """
+        args = ["front", "--server", "--config_path", str(tmp_path)]
+        result = CliRunner().invoke(
+            cli, [*args, "--recall", "3", "--compact_after", "5"]
+        )
+        assert result.exit_code == 1
+        assert "--compact_after, --recall can't be used with --server" in result.output
+        result = CliRunner().invoke(cli, args)
+        assert result.exit_code == 1 and "No daemon is listening" in result.output
+
+
+class TestRateLimiter:
+    """
+    Tests for the global rate limit.
+    """
+
+    def test_rate(self):
+        """
+        Tests that requests beyond the burst wait for new tokens.
+        """
+        limiter = RateLimiter(rate=50, burst=2, concurrency=10)
+
+        async def run():
+            start = time.monotonic()
+            for _ in range(4):
+                async with limiter:
+                    ...
+            return time.monotonic() - start
+
+        assert asyncio.run(run()) >= 0.03
@@ -0,0 +1,356 @@
+"""
+Tests for the TUI components.
+"""
+import asyncio, json, os, pyperclip, pytest, subprocess, sys, threading, tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from gpttui.database.base import Message as MessageData, MessageWithTime, UsageGroupEnum
+from gpttui.database.sqlite import SqliteDB
+from gpttui.models.openai import OpenAIConf, OpenAIModel
+from gpttui.tui.app import (
+    ClearModesEnum,
+    GptApp,
+    Message,
+    Messages,
+    fuzzy_filter,
+    fuzzy_score,
+)
+from gpttui.tui.benchmark import Benchmark, compare, percentile
+from gpttui.tui.clipboard import code_blocks
+from gpttui.tui.config import (
+    config_bundle,
+    css_config,
+    keybindings_config,
+)
+from typing import List
+
+
+class TestSwitcher:
+    """
+    Unittests for the session switcher.
+    """
+
+    @pytest.mark.parametrize(
+        "query,text,matches",
+        [("pd", "python_dev", True), ("dp", "python_dev", False), ("", "any", True)],
+    )
+    def test_fuzzy_score(self, query: str, text: str, matches: bool):
+        """
+        Tests the subsequence matching.
+
+        Parameters
+        ----------
+        query : str
+            Characters to look for.
+        text : str
+            Candidate text.
+        matches : bool
+            Whether the query must match.
+        """
+        assert (fuzzy_score(query, text) is not None) == matches
+
+    @pytest.mark.parametrize(
+        "query,expected",
+        [
+            ("ch", ["chat", "python_chat"]),
+            ("pyc", ["python_chat"]),
+            ("", ["python_chat", "chat", "rust"]),
+        ],
+    )
+    def test_fuzzy_filter(self, query: str, expected: List[str]):
+        """
+        Tests the filtering and sorting of sessions.
+
+        Parameters
+        ----------
+        query : str
+            Characters to look for.
+        expected : List[str]
+            Expected sessions.
+        """
+        assert fuzzy_filter(query, ["python_chat", "chat", "rust"]) == expected
+
+
+class TestYank:
+    """
+    Tests for the clipboard operations.
+    """
+
+    def test_code_blocks(self):
+        """
+        Tests the extraction of fenced code blocks.
+        """
+        text = "Run:\n```python\nprint(1)\n```\nor\n~~~\nls\n```\n~~~\n"
+        assert code_blocks(text) == ["print(1)\n", "ls\n```\n"]
+        assert code_blocks("no code") == []
+
+    def test_count(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+        """
+        Tests that a count picks an older answer and that code blocks can be yanked alone.
+        """
+        copied: List[str] = []
+        monkeypatch.setattr(pyperclip, "copy", copied.append)
+        db = SqliteDB().setup(database=str(tmp_path / "db.sqlite"))
+        db.create_session("test")
+        for i, content in enumerate(["first\n```\nx = 1\n```", "second", "third"]):
+            for role in ["user", "assistant"]:
+                msg = MessageData(role=role, content=content)
+                db.add_message(MessageWithTime(message=msg, timestamp=i), "test")
+        model = (
+            OpenAIModel()
+            .add_context(context="context")
+            .setup(config=OpenAIConf(), database=db, session_name="test")
+        )
+        app = GptApp.setup_cls(
+            css_path=css_config(tmp_path), keybindings=keybindings_config(tmp_path)
+        )().setup(model=model)
+
+        async def run():
+            async with app.run_test() as pilot:
+                app.set_focus(None)
+                await pilot.press("y", "2", "y", "3", "Y")
+                await pilot.pause()
+
+        asyncio.run(run())
+        assert copied == ["third", "second", "x = 1\n"]
+        db.close()
+
+
+class TestClear:
+    """
+    Tests for clearing the messages.
+    """
+
+    def test_archive(self, tmp_path: Path):
+        """
+        Tests that the widgets are removed, the session is archived under a new name every time and
+        empty sessions aren't archived.
+        """
+        db = SqliteDB().setup(database=str(tmp_path / "db.sqlite"))
+        model = (
+            OpenAIModel()
+            .add_context(context="context")
+            .setup(config=OpenAIConf(), database=db, session_name="test")
+        )
+        model.last_messages()
+        tracing = tracemalloc.is_tracing()
+        app = GptApp.setup_cls(
+            css_path=css_config(tmp_path), keybindings=keybindings_config(tmp_path)
+        )().setup(model=model, clear_mode=ClearModesEnum.ARCHIVE, debug=True)
+
+        async def run():
+            async with app.run_test() as pilot:
+                app.set_focus(None)
+                messages = app.query_one(Messages)
+                for _ in range(2):
+                    for i in range(20):
+                        msg = MessageData(role="user", content=str(i))
+                        db.add_message(
+                            MessageWithTime(message=msg, timestamp=i), "test"
+                        )
+                        messages.add_message(msg=str(i), user="User")
+                    await pilot.pause()
+                    await pilot.press("c")
+                    await pilot.pause()
+                await pilot.press("c")
+                await pilot.pause()
+                return len(messages.query(Message))
+
+        assert asyncio.run(run()) == 0
+        sessions = db.list_sessions()
+        assert "test" in sessions and len(sessions) == 3
+        assert len(db.get_messages("test").values) == 0
+        db.close()
+        assert tracemalloc.is_tracing() == tracing
+
+
+class TestSync:
+    """
+    Tests for several instances sharing a session.
+    """
+
+    def test_other_instance(self, tmp_path: Path):
+        """
+        Tests that the messages stored by another process are shown, and that the history and the
+        writes to other sessions aren't.
+        """
+        path = str(tmp_path / "db.sqlite")
+        db = SqliteDB().setup(database=path)
+        db.create_session("test")
+        db.create_session("other")
+        msg = MessageData(role="user", content="old")
+        db.add_message(MessageWithTime(message=msg, timestamp=0), "test")
+        model = (
+            OpenAIModel()
+            .add_context(context="context")
+            .setup(config=OpenAIConf(), database=db, session_name="test")
+        )
+        model.last_messages()
+        other = SqliteDB().setup(database=path)
+        app = GptApp.setup_cls(
+            css_path=css_config(tmp_path), keybindings=keybindings_config(tmp_path)
+        )().setup(model=model, sync_every=0.05)
+
+        async def run():
+            async with app.run_test() as pilot:
+                shown = []
+                msg = MessageData(role="user", content="elsewhere")
+                other.add_message(MessageWithTime(message=msg, timestamp=1), "other")
+                await pilot.pause(0.2)
+                shown.append(
+                    [
+                        widget.message
+                        for widget in app.query_one(Messages).query(Message)
+                    ]
+                )
+                for content in ["first", "second"]:
+                    for role in ["user", "assistant"]:
+                        msg = MessageData(role=role, content=content)
+                        other.add_message(
+                            MessageWithTime(message=msg, timestamp=1), "test"
+                        )
+                    await pilot.pause(0.2)
+                    shown.append(
+                        [
+                            widget.message
+                            for widget in app.query_one(Messages).query(Message)
+                        ]
+                    )
+                return shown
+
+        assert asyncio.run(run()) == [
+            [],
+            ["first", "first"],
+            ["first", "first", "second", "second"],
+        ]
+        other.close()
+        db.close()
+
+
+class TestConfig:
+    """
+    Tests for the configuration loader.
+    """
+
+    def test_bundle(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+        """
+        Tests that the files are created and that the environment overrides them.
+        """
+        config_path = tmp_path / "nested" / "gpttui"
+        (config_path).mkdir(parents=True)
+        (config_path / "config.cache").write_bytes(b"legacy")
+        bundle = config_bundle(config_path, "openai.json", OpenAIConf)
+        assert bundle.keybindings.yank == "y"
+        assert not (config_path / "config.cache").exists()
+
+        monkeypatch.setenv("GPTTUI_OPENAI_API_KEY", "secret")
+        bundle = config_bundle(config_path, "openai.json", OpenAIConf)
+        assert bundle.model.api_key == "secret"
+        assert "secret" not in (config_path / "openai.json").read_text()
+
+        cfg = OpenAIConf(model_name="other")
+        (config_path / "openai.json").write_text(cfg.json())
+        bundle = config_bundle(config_path, "openai.json", OpenAIConf)
+        assert bundle.model.model_name == "other"
+
+
+class TestBenchmark:
+    """
+    Tests for the headless latency benchmark.
+    """
+
+    def test_percentile(self):
+        """
+        Tests the interpolated percentiles.
+        """
+        assert percentile([3, 1, 2], 50) == 2
+        assert percentile([1, 2], 95) == pytest.approx(1.95)
+
+    def test_report(self):
+        """
+        Tests that a small run measures every metric and can be compared.
+        """
+        report = asyncio.run(
+            Benchmark(
+                lengths=[0, 4], repeat=2, markdown_lines=20, memory_messages=5
+            ).run()
+        )
+        results = report["results"]
+        assert set(results) == {"session_0", "session_4", "memory"}
+        assert 0 < results["session_4"]["latency_p50_ms"] < 10000
+        assert results["memory"]["bytes_per_message"] > 0
+        rows = compare(report, report)
+        assert len(rows) == 15 and all(change == 0 for *_, change in rows)
+
+
+class SSEHandler(BaseHTTPRequestHandler):
+    """
+    OpenAI compatible endpoint that streams the received prompt back in pieces.
+    """
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["content-length"])))
+        assert body["stream"]
+        prompt = body["messages"][-1]["content"]
+        self.send_response(200)
+        self.send_header("content-type", "text/event-stream")
+        self.end_headers()
+        for piece in ["echo: ", prompt.replace("\n", " ")]:
+            chunk = {"choices": [{"delta": {"content": piece}}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+        if body.get("stream_options", {}).get("include_usage"):
+            chunk = {
+                "choices": [],
+                "usage": {"prompt_tokens": 7, "completion_tokens": 2},
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def log_message(self, *args):
+        ...
+
+
+class TestAsk:
+    """
+    Tests for the pipe mode.
+    """
+
+    def test_pipe(self, tmp_path: Path):
+        """
+        Tests that piped text is appended to the prompt, the answer is streamed and stored, and the
+        TUI isn't imported.
+        """
+        server = ThreadingHTTPServer(("127.0.0.1", 0), SSEHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        env = {
+            **os.environ,
+            "GPTTUI_OPENAI_BASE_URL": f"http://127.0.0.1:{server.server_port}/v1",
+        }
+        code = (
+            "import sys\n"
+            "from gpttui.tui.main import cli\n"
+            "try:\n"
+            "    cli()\n"
+            "finally:\n"
+            "    print(sorted(m for m in sys.modules if m.startswith('textual')), file=sys.stderr)"
+        )
+        args = ["ask", "review", "this", "--config_path", str(tmp_path)]
+        result = subprocess.run(
+            [sys.executable, "-c", code, *args],
+            input="diff",
+            capture_output=True,
+            text=True,
+            env=env,
+            timeout=60,
+        )
+        server.shutdown()
+        assert result.returncode == 0, result.stderr
+        assert result.stdout == "echo: review this  diff\n"
+        assert result.stderr.strip() == "[]"
+        db = SqliteDB().setup(database=str(tmp_path / "database.sqlite"))
+        contents = [msg.content for msg in db.get_messages("ask").values]
+        assert contents[-2:] == ["review this\n\ndiff", "echo: review this  diff"]
+        (usage,) = db.get_usage(UsageGroupEnum.BACKEND)
+        db.close()
+        assert usage == ("openai/gpt-3.5-turbo", 1, 7, 2, 7, 0)